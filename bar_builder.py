@@ -0,0 +1,144 @@
+# bar_builder.py - Streaming Tick-to-Bar (OHLCV) Aggregator
+# =========================================================
+# Builds OHLCV bars for any set of resolutions directly from WebSocket ticks,
+# so intraday logic (e.g. the ORB) doesn't have to poll the history API.
+# Bars are aligned on epoch boundaries, which for 1/5/15-min bars also lines up
+# with the NSE session (IST is UTC+5:30 = 22 × 15 min).
+
+import threading
+from collections import deque
+import market_clock
+
+DEFAULT_RESOLUTIONS = (1, 5, 15)  # Minutes
+MAX_BARS = 500                    # Completed bars kept per (symbol, resolution)
+START_GRACE_SECONDS = 10          # First tick may arrive this late after a window opens and still count as full coverage
+
+
+class BarBuilder:
+    """
+    Thread-safe OHLCV aggregator. Feed it from the WebSocket callback thread via
+    `on_tick()`; read completed bars from any thread via `get_bars()` / `get_range()`.
+    """
+
+    def __init__(self, resolutions=DEFAULT_RESOLUTIONS, max_bars=MAX_BARS):
+        self.resolutions = tuple(resolutions)
+        self.max_bars = max_bars
+        self._lock = threading.Lock()
+        self._created_ts = market_clock.time()
+        self._current = {}     # (symbol, res) -> open bar dict
+        self._completed = {}   # (symbol, res) -> deque of closed bar dicts
+        self._first_ts = {}    # symbol -> timestamp of the first tick seen
+        self._last_cum_vol = {}  # symbol -> last cumulative day volume (for per-bar deltas)
+
+    def on_tick(self, tick):
+        """Ingest a tick_types.Tick (uses exchange time when present)."""
+        symbol = tick.symbol
+        price = tick.ltp
+        ts = tick.exch_ts or market_clock.time()
+
+        cum_vol = tick.volume
+        with self._lock:
+            volume = 0
+            if cum_vol is not None:
+                last = self._last_cum_vol.get(symbol)
+                volume = max(cum_vol - last, 0) if last is not None else 0
+                self._last_cum_vol[symbol] = cum_vol
+            self._first_ts.setdefault(symbol, ts)
+
+            for res in self.resolutions:
+                key = (symbol, res)
+                bar_start = int(ts // (res * 60)) * res * 60
+                bar = self._current.get(key)
+                if bar is None:
+                    done = self._completed.get(key)
+                    if done and bar_start <= done[-1]['start']:
+                        continue  # Late tick for a bar already closed by roll()
+                if bar is None or bar_start > bar['start']:
+                    if bar is not None:
+                        self._completed.setdefault(key, deque(maxlen=self.max_bars)).append(bar)
+                    self._current[key] = {"start": bar_start, "open": price, "high": price,
+                                          "low": price, "close": price, "volume": volume}
+                elif bar_start == bar['start']:
+                    if price > bar['high']:
+                        bar['high'] = price
+                    if price < bar['low']:
+                        bar['low'] = price
+                    bar['close'] = price
+                    bar['volume'] += volume
+                # Late ticks for an already-closed bar are ignored
+
+    def backfill(self, symbol, candles):
+        """
+        Merges 1-minute history candles [ts, open, high, low, close, volume] into every
+        resolution, e.g. to repair bars lost during a feed outage. Bars built from ticks
+        only widen to the candle's high/low; missing periods are created (flagged
+        'backfilled') and kept in time order. Returns the number of candles applied.
+        """
+        now = market_clock.time()
+        applied = 0
+        with self._lock:
+            for ts, o, h, l, c, v in sorted(candles):
+                self._first_ts.setdefault(symbol, ts)
+                for res in self.resolutions:
+                    key = (symbol, res)
+                    bar_start = int(ts // (res * 60)) * res * 60
+                    done = self._completed.setdefault(key, deque(maxlen=self.max_bars))
+                    current = self._current.get(key)
+                    bar = current if current is not None and current['start'] == bar_start else \
+                        next((b for b in reversed(done) if b['start'] == bar_start), None)
+                    if bar is not None:
+                        bar['high'] = max(bar['high'], h)
+                        bar['low'] = min(bar['low'], l)
+                        if bar.get('backfilled'):
+                            bar['close'] = c
+                            bar['volume'] += v
+                        continue
+                    bar = {"start": bar_start, "open": o, "high": h, "low": l, "close": c,
+                           "volume": v, "backfilled": True}
+                    if current is not None and bar_start > current['start']:
+                        done.append(current)
+                        self._current[key] = bar
+                    elif current is None and bar_start + res * 60 > now and (not done or bar_start > done[-1]['start']):
+                        self._current[key] = bar  # Period still open: live ticks keep extending it
+                    elif not done or bar_start > done[-1]['start']:
+                        done.append(bar)
+                    else:
+                        self._completed[key] = deque(sorted(list(done) + [bar], key=lambda b: b['start']),
+                                                     maxlen=self.max_bars)
+                applied += 1
+        return applied
+
+    def roll(self, now=None):
+        """Close any open bar whose period has ended (call on a timer so quiet symbols still complete)."""
+        now = now or market_clock.time()
+        with self._lock:
+            for key, bar in list(self._current.items()):
+                if now >= bar['start'] + key[1] * 60:
+                    self._completed.setdefault(key, deque(maxlen=self.max_bars)).append(bar)
+                    del self._current[key]
+
+    def get_bars(self, symbol, resolution, include_partial=False):
+        """Returns a list of bar dicts (oldest first) for a symbol/resolution."""
+        with self._lock:
+            bars = list(self._completed.get((symbol, resolution), ()))
+            if include_partial and (symbol, resolution) in self._current:
+                bars.append(dict(self._current[(symbol, resolution)]))
+        return bars
+
+    def get_range(self, symbol, start_ts, end_ts, resolution=None):
+        """
+        High/low over [start_ts, end_ts) built from completed bars, or None if the
+        builder didn't see the whole window (started late or bars missing).
+        """
+        resolution = resolution or min(self.resolutions)
+        with self._lock:
+            first_ts = self._first_ts.get(symbol)
+            if first_ts is None:
+                return None
+            if self._created_ts > start_ts and first_ts > start_ts + START_GRACE_SECONDS:
+                return None  # Builder started after the window opened: incomplete coverage
+            bars = [b for b in self._completed.get((symbol, resolution), ())
+                    if start_ts <= b['start'] < end_ts]
+        if not bars or bars[-1]['start'] + resolution * 60 < end_ts:
+            return None  # Last bar in the window hasn't closed yet
+        return {"high": max(b['high'] for b in bars), "low": min(b['low'] for b in bars), "bars": len(bars)}
@@ -0,0 +1,182 @@
+# bench_tick_path.py - Microbenchmark: Dict Ticks vs. Compact Tick/SpreadPosition
+# ===============================================================================
+# Measures the per-tick cost of the scalper's ingestion + exit-check path in two
+# forms, on the same synthetic message stream:
+#   legacy  - SDK dicts stored as-is, LTPs keyed by symbol string, positions as
+#             dicts probed with .get() / string matching on every tick
+#   compact - tick_types.Tick built once at ingestion, LTPs keyed by interned
+#             symbol id, SpreadPosition views with precomputed exit parameters
+# Both paths do the same consumer fan-out as the scalper: store the tick, read
+# the bar fields (price/volume/exchange time), update the LTP map and run the
+# exit checks of every spread touching the symbol.
+# Ingestion (feed thread) and the trading loop are timed separately; the loop
+# also reports its tracemalloc peak.
+#
+# Usage:
+#   python bench_tick_path.py [--ticks 200000] [--positions 4] [--ladder 24]
+
+import argparse
+import gc
+import random
+import time
+import tracemalloc
+
+from tick_types import SpreadPosition, ticks_from_message
+
+INDEX_SYMBOLS = ("NSE:NIFTY50-INDEX", "NSE:NIFTYBANK-INDEX")
+
+
+def _make_stream(n_ticks, ladder, seed=1):
+    """SDK-shaped messages: two indices plus `ladder` option symbols per index."""
+    rng = random.Random(seed)
+    symbols = list(INDEX_SYMBOLS)
+    for root, base, step in (("NIFTY", 25000, 50), ("BANKNIFTY", 56000, 100)):
+        for k in range(ladder):
+            symbols.append(f"NSE:{root}26OCT{base + (k - ladder // 2) * step}{'CE' if k % 2 else 'PE'}")
+    messages = []
+    for i in range(n_ticks):
+        symbol = rng.choice(symbols)
+        ltp = round(rng.uniform(50, 300), 2) if "INDEX" not in symbol else 25000.0 + rng.gauss(0, 20)
+        messages.append({
+            "symbol": symbol, "ltp": ltp, "type": "sf", "bid_price": ltp - 0.05, "ask_price": ltp + 0.05,
+            "bid_size": 1200, "ask_size": 900, "last_traded_qty": 75, "vol_traded_today": 1000 + i,
+            "last_traded_time": 1760600000 + i // 50, "exch_feed_time": 1760600000 + i // 50,
+            "open_price": 100.0, "high_price": 120.0, "low_price": 90.0, "prev_close_price": 101.0,
+            "ch": 1.2, "chp": 0.8, "avg_trade_price": 105.0, "tot_buy_qty": 50000, "tot_sell_qty": 48000,
+        })
+    return symbols, messages
+
+
+def _make_positions(symbols, n_positions):
+    positions = {}
+    legs = [s for s in symbols if "INDEX" not in s]
+    for i in range(n_positions):
+        buy, sell = legs[2 * i], legs[2 * i + 1]
+        positions[buy] = {
+            "id": i, "qty": 75, "direction": "LONG SPREAD (LONG)" if i % 2 == 0 else "LONG SPREAD (SHORT)",
+            "sim_entry_price": 40.0, "sim_stop_loss_price": 0, "sim_take_profit_price": 1e9,
+            "index_entry_price": 25000.0, "index_stop_loss_price": 1.0 if i % 2 == 0 else 1e9,
+            "index_take_profit_price": 0, "index_symbol": INDEX_SYMBOLS[0] if "BANK" not in buy else INDEX_SYMBOLS[1],
+            "is_spread": True, "sell_symbol": sell, "buy_premium": 60.0, "sell_premium": 20.0,
+            "net_debit": 40.0, "max_profit": 10.0, "profit_target": 6.0, "spread_width": 50,
+        }
+    index = {}
+    for key, pos in positions.items():
+        for symbol in (key, pos["sell_symbol"], pos["index_symbol"]):
+            index.setdefault(symbol, set()).add(key)
+    return positions, index
+
+
+def ingest_legacy(messages):
+    store, batch = {}, []
+    for message in messages:
+        if isinstance(message, dict) and 'symbol' in message and 'ltp' in message:
+            store[message['symbol']] = message
+        batch.append(message)
+    return batch
+
+
+def loop_legacy(batch, positions, index):
+    latest, bars, exits = {}, {}, 0
+    for tick in batch:
+        if isinstance(tick, dict) and 'symbol' in tick and 'ltp' in tick:
+            sym = tick['symbol']
+            bars[sym] = (tick.get('ltp'), tick.get('vol_traded_today'),
+                         tick.get('exch_feed_time') or tick.get('last_traded_time'))
+            latest[sym] = tick['ltp']
+            keys = index.get(sym)
+            for buy_sym, pos in ([(k, positions[k]) for k in list(keys) if k in positions] if keys else []):
+                if not pos.get('is_spread'):
+                    continue
+                sell_sym = pos['sell_symbol']
+                pos_index_symbol = pos.get('index_symbol')
+                if sym == pos_index_symbol:
+                    index_live = latest.get(pos_index_symbol, 0)
+                    if index_live > 0:
+                        if "(LONG)" in pos['direction']:
+                            exits += index_live <= pos['index_stop_loss_price']
+                        else:
+                            exits += index_live >= pos['index_stop_loss_price']
+                buy_ltp = latest.get(buy_sym, 0)
+                sell_ltp = latest.get(sell_sym, 0)
+                if buy_ltp > 0 and sell_ltp > 0:
+                    exits += (buy_ltp - sell_ltp) >= pos['sim_take_profit_price']
+    return exits
+
+
+def ingest_compact(messages):
+    store, batch = {}, []
+    for message in messages:
+        for tick in ticks_from_message(message):
+            store[tick.symbol] = tick
+            batch.append(tick)
+    return batch
+
+
+def loop_compact(batch, positions, index):
+    spreads = {key: SpreadPosition.from_position(key, pos) for key, pos in positions.items()}
+    latest, bars, exits = {}, {}, 0
+    for tick in batch:
+        sym_id = tick.sym_id
+        bars[sym_id] = (tick.ltp, tick.volume, tick.exch_ts)
+        latest[sym_id] = tick.ltp
+        keys = index.get(tick.symbol)
+        for spread in ([spreads[k] for k in keys if k in spreads] if keys else []):
+            if sym_id == spread.index_id:
+                index_live = latest.get(spread.index_id, 0)
+                if index_live > 0:
+                    if spread.is_call:
+                        exits += index_live <= spread.index_stop_loss
+                    else:
+                        exits += index_live >= spread.index_stop_loss
+            buy_ltp = latest.get(spread.buy_id, 0)
+            sell_ltp = latest.get(spread.sell_id, 0)
+            if buy_ltp > 0 and sell_ltp > 0:
+                exits += (buy_ltp - sell_ltp) >= spread.take_profit
+    return exits
+
+
+def _best_ns(fn, *args, repeat):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter_ns()
+        result = fn(*args)
+        best = min(best, time.perf_counter_ns() - start)
+    return best, result
+
+
+def _traced_peak(fn, *args):
+    gc.collect()
+    tracemalloc.start()
+    fn(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-tick cost of dict vs compact tick/position types.")
+    parser.add_argument("--ticks", type=int, default=200000)
+    parser.add_argument("--positions", type=int, default=4, help="Open spreads (at most --ladder)")
+    parser.add_argument("--ladder", type=int, default=24, help="Option symbols streamed per index")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    symbols, messages = _make_stream(args.ticks, args.ladder)
+    positions, index = _make_positions(symbols, min(args.positions, args.ladder))
+    n = len(messages)
+    print(f"{n:,} ticks over {len(symbols)} symbols, {len(positions)} open spreads (best of {args.repeat})")
+    results = {}
+    for name, ingest, loop in (("legacy", ingest_legacy, loop_legacy), ("compact", ingest_compact, loop_compact)):
+        ingest_ns, batch = _best_ns(ingest, messages, repeat=args.repeat)
+        loop_ns, exits = _best_ns(loop, batch, positions, index, repeat=args.repeat)
+        loop_peak = _traced_peak(loop, batch, positions, index)
+        results[name] = loop_ns
+        print(f"  {name:<8} ingest {ingest_ns / n:>6.0f} ns/tick (feed thread) | trading loop {loop_ns / n:>6.0f} ns/tick, "
+              f"peak {loop_peak / 1024:>7.1f} KiB | exit hits {exits}")
+    print(f"  trading loop compact/legacy: {results['compact'] / results['legacy']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
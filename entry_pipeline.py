@@ -0,0 +1,86 @@
+# entry_pipeline.py - Executor-Backed Entry Pipeline
+# ==================================================
+# Keeps entry REST work (ORB history fallback, option leg quotes, margin
+# check, order placement) off the tick loop. The loop only offers a cheap
+# "breakout candidate"; a small thread pool then runs
+#
+#   resolve(candidate) -> resolved order (or None)
+#   recheck(order)     -> last look against the latest streamed prices
+#   submit(order)      -> paper fill or live order via the order gateway
+#
+# so exit checks keep running on every tick while an entry is in flight.
+# At most one candidate per key (index) is in flight: further offers for
+# that key are coalesced away until it finishes.
+#
+# inline=True runs the stages on the offering thread (deterministic replay).
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+ENTRY_WORKERS = 2  # One per traded index is enough: candidates never overlap per index
+
+
+class EntryPipeline:
+    """resolve/recheck/submit are callables supplied by the strategy (see module header)."""
+
+    def __init__(self, resolve, recheck, submit, max_workers=ENTRY_WORKERS, inline=False):
+        self.resolve = resolve
+        self.recheck = recheck
+        self.submit = submit
+        self.inline = inline
+        self.stats = {"offered": 0, "coalesced": 0, "resolved": 0, "stale": 0, "submitted": 0, "errors": 0}
+        self._lock = threading.Lock()
+        self._in_flight = set()  # Candidate keys being worked on
+        self._executor = None if inline else ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="entry")
+
+    def offer(self, key, candidate):
+        """Queues a candidate for `key` unless one is already in flight. Returns True if accepted."""
+        with self._lock:
+            if key in self._in_flight:
+                self.stats["coalesced"] += 1
+                return False
+            self._in_flight.add(key)
+            self.stats["offered"] += 1
+        if self.inline:
+            self._run(key, candidate)
+        else:
+            self._executor.submit(self._run, key, candidate)
+        return True
+
+    def busy(self, key):
+        return key in self._in_flight
+
+    def shutdown(self, wait=False):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+
+    def log_report(self, logger):
+        if self.stats["offered"]:
+            logger.info(f"Entry pipeline: {self.stats['offered']} candidates ({self.stats['coalesced']} coalesced) | "
+                        f"{self.stats['resolved']} resolved, {self.stats['stale']} stale on recheck, "
+                        f"{self.stats['submitted']} submitted | Errors {self.stats['errors']}")
+
+    def _count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def _run(self, key, candidate):
+        try:
+            order = self.resolve(candidate)
+            if order is None:
+                return
+            self._count("resolved")
+            if not self.recheck(order):
+                self._count("stale")
+                return
+            self.submit(order)
+            self._count("submitted")
+        except Exception as e:
+            self._count("errors")
+            logger.error(f"Entry pipeline error for {key}: {e}", exc_info=True)
+        finally:
+            with self._lock:
+                self._in_flight.discard(key)
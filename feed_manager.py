@@ -0,0 +1,304 @@
+# feed_manager.py - Self-Healing Market Data Feed
+# ===============================================
+# Wraps fyers_client.start_level2_websocket with outage recovery:
+#   1. Reconnects with exponential backoff (plus jitter) when the socket drops.
+#   2. Re-subscribes the exact symbol set that is live at reconnect time
+#      (SymbolUpdate and DepthUpdate). The SDK's own reconnect only restores
+#      the symbols passed at start-up, so anything subscribed dynamically
+#      (option legs, ladders) would go silent. The SDK socket keeps the
+#      topic of the call in progress on the socket object (and sleeps inside
+#      subscribe), so every (un)subscribe on it goes through one lock.
+#   3. Backfills the outage window: one batched quotes call refreshes the last
+#      price of every subscribed symbol (delivered to on_tick like a normal
+#      message), and 1-minute history repairs the BarBuilder bars of the
+#      underlying indices.
+#   4. Hands a gap report (window, blind seconds, price extremes, recovery
+#      time) to the owner, so it can flag positions whose exit checks were
+#      blind during the outage.
+#
+# Exposes the same subscribe/unsubscribe/keep_running/close_connection/
+# is_connected surface as the SDK socket, so agents can swap it in directly.
+
+import datetime
+import logging
+import random
+import threading
+import time
+from collections import deque
+
+import fyers_client
+
+logger = logging.getLogger(__name__)
+
+BACKOFF_INITIAL = 1.0    # Seconds before the first reconnect attempt
+BACKOFF_MAX = 30.0       # Cap on the backoff delay
+CONNECT_TIMEOUT = 10.0   # Seconds to wait for a new socket to report connected
+QUOTES_BATCH_LIMIT = 50  # Max symbols per Fyers quotes call
+MAX_GAP_HISTORY = 50     # Gap reports kept in memory
+
+
+class ResilientFeed:
+    """
+    Level 2 feed that survives disconnects. `on_gap(gap)` is called from the
+    recovery thread after each outage has been backfilled; keep it cheap (e.g.
+    append to a deque the trading loop drains).
+    """
+
+    def __init__(self, fyers_instance, on_tick, symbols, bar_builder=None, history_symbols=(),
+                 on_gap=None, latency=None, record_ticks=True):
+        self.fyers = fyers_instance
+        self.on_tick = on_tick
+        self.symbols = set(symbols)
+        self.depth_symbols = set()  # Also subscribed to DepthUpdate
+        self.bar_builder = bar_builder
+        self.history_symbols = tuple(history_symbols)  # Symbols whose bars are repaired from 1-min history
+        self.on_gap = on_gap
+        self.latency = latency  # Optional LatencyRecorder: "feed.reconnect" / "feed.recovery"
+        self.record_ticks = record_ticks
+        self.gaps = deque(maxlen=MAX_GAP_HISTORY)
+        self.stats = {"connects": 0, "drops": 0, "attempts": 0, "backfilled_quotes": 0,
+                      "backfilled_candles": 0, "blind_seconds": 0.0,
+                      "last_recovery_ms": 0.0, "max_recovery_ms": 0.0}
+        self._lock = threading.Lock()
+        self._subscribe_lock = threading.Lock()  # Serializes SDK (un)subscribe calls (see module header)
+        self._socket = None
+        self._generation = 0          # Closes reported by replaced sockets are ignored
+        self._down = threading.Event()
+        self._stop = threading.Event()
+        self._last_message_ts = None  # time.time() of the last feed message (outage start)
+        self._drop_ns = None
+        self._live_since_reconnect = None  # Symbols that ticked live while backfilling
+        self._thread = None
+
+    # --- Socket-compatible surface ---
+
+    def start(self):
+        """Connects (retrying in the background if the first attempt fails) and returns self."""
+        if not self._connect():
+            logger.error("Initial feed connection failed; retrying in the background")
+            self._mark_down()
+        self._thread = threading.Thread(target=self._supervise, name="feed-recovery", daemon=True)
+        self._thread.start()
+        return self
+
+    def subscribe(self, symbols, data_type="SymbolUpdate", channel=11):
+        with self._lock:
+            (self.depth_symbols if data_type == "DepthUpdate" else self.symbols).update(symbols)
+            sock = self._socket
+        if sock is not None:
+            with self._subscribe_lock:
+                sock.subscribe(symbols=list(symbols), data_type=data_type)
+
+    def unsubscribe(self, symbols, data_type="SymbolUpdate", channel=11):
+        with self._lock:
+            (self.depth_symbols if data_type == "DepthUpdate" else self.symbols).difference_update(symbols)
+            sock = self._socket
+        if sock is not None:
+            with self._subscribe_lock:
+                sock.unsubscribe(symbols=list(symbols), data_type=data_type)
+
+    def keep_running(self):
+        self._stop.wait()
+
+    def close_connection(self):
+        self._stop.set()
+        with self._lock:
+            self._generation += 1
+            sock, self._socket = self._socket, None
+        if sock is not None:
+            self._close_quietly(sock)
+
+    def is_connected(self):
+        sock = self._socket
+        return sock is not None and not self._down.is_set() and sock.is_connected()
+
+    def log_report(self, logger):
+        if self.stats['drops']:
+            logger.info(f"Feed: {self.stats['drops']} drops, {self.stats['blind_seconds']:.1f}s blind | Recovery last "
+                        f"{self.stats['last_recovery_ms']:.0f} ms, max {self.stats['max_recovery_ms']:.0f} ms")
+
+    # --- Connection management ---
+
+    def _on_message(self, message):
+        self._last_message_ts = time.time()
+        live = self._live_since_reconnect
+        if live is not None:
+            for tick in message if isinstance(message, list) else (message,):
+                if isinstance(tick, dict) and 'symbol' in tick:
+                    live.add(tick['symbol'])
+        self.on_tick(message)
+
+    def _on_close(self, generation, message):
+        if generation == self._generation and not self._stop.is_set():
+            self._mark_down()
+
+    def _mark_down(self):
+        if not self._down.is_set():
+            self._drop_ns = time.monotonic_ns()
+            self._down.set()
+
+    def _close_quietly(self, sock):
+        try:
+            sock.close_connection()
+        except Exception as e:
+            logger.debug(f"Ignoring error while closing feed socket: {e}")
+
+    def _connect(self):
+        """One connection attempt with the current symbol set. Returns True once streaming."""
+        self.stats["attempts"] += 1
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+            old, self._socket = self._socket, None
+            symbols = sorted(self.symbols)
+        if old is not None:
+            self._close_quietly(old)  # The SDK socket is a singleton: release it before reconnecting
+        self._down.clear()
+
+        sock = fyers_client.start_level2_websocket(
+            self.fyers.token, self._on_message, symbols, record_ticks=self.record_ticks,
+            on_close=lambda message: self._on_close(generation, message), reconnect=False,
+            client_id=getattr(self.fyers, "client_id", None), subscribe_lock=self._subscribe_lock)
+        if sock is None:
+            return False
+        deadline = time.monotonic() + CONNECT_TIMEOUT
+        while not sock.is_connected() and time.monotonic() < deadline and not self._stop.is_set():
+            time.sleep(0.1)
+
+        with self._lock:
+            self._socket = sock
+            added = self.symbols.difference(symbols)    # (Un)subscribed while we were connecting
+            removed = set(symbols).difference(self.symbols)
+            depth_symbols = sorted(self.depth_symbols)
+        if not sock.is_connected():
+            return False
+        with self._subscribe_lock:
+            if added:
+                sock.subscribe(symbols=sorted(added))
+            if removed:
+                sock.unsubscribe(symbols=sorted(removed))
+            if depth_symbols:
+                sock.subscribe(symbols=depth_symbols, data_type="DepthUpdate")
+        self.stats["connects"] += 1
+        return True
+
+    def _supervise(self):
+        while not self._stop.is_set():
+            if self._down.wait(1.0) and not self._stop.is_set():
+                try:
+                    self._recover()
+                except Exception as e:
+                    logger.error(f"Feed recovery failed: {e}", exc_info=True)
+                    self._stop.wait(BACKOFF_INITIAL)
+
+    def _recover(self):
+        drop_ns = self._drop_ns or time.monotonic_ns()
+        gap_start = self._last_message_ts or time.time()
+        self.stats["drops"] += 1
+        logger.warning(f"📡 Feed down ({len(self.symbols)} symbols). Reconnecting...")
+
+        attempt, delay = 0, BACKOFF_INITIAL
+        self._live_since_reconnect = set()
+        try:
+            while not self._stop.is_set():
+                attempt += 1
+                if self._connect():
+                    break
+                wait = delay * random.uniform(1.0, 1.25)
+                logger.warning(f"📡 Reconnect attempt {attempt} failed; retrying in {wait:.1f}s")
+                if self._stop.wait(wait):
+                    return
+                delay = min(delay * 2, BACKOFF_MAX)
+            connected_ns = time.monotonic_ns()
+            gap_end = time.time()
+            gap = self._backfill(gap_start, gap_end)
+        finally:
+            self._live_since_reconnect = None
+
+        recovered_ns = time.monotonic_ns()
+        gap.update({
+            "attempts": attempt,
+            "reconnect_ms": (connected_ns - drop_ns) / 1e6,
+            "recovery_ms": (recovered_ns - drop_ns) / 1e6,
+        })
+        self.gaps.append(gap)
+        self.stats["blind_seconds"] += gap["blind_seconds"]
+        self.stats["last_recovery_ms"] = gap["recovery_ms"]
+        self.stats["max_recovery_ms"] = max(self.stats["max_recovery_ms"], gap["recovery_ms"])
+        if self.latency is not None:
+            self.latency.record("feed.reconnect", connected_ns - drop_ns)
+            self.latency.record("feed.recovery", recovered_ns - drop_ns)
+        logger.warning(f"📡 Feed recovered after {attempt} attempt(s): blind {gap['blind_seconds']:.1f}s, "
+                       f"reconnect {gap['reconnect_ms']:.0f} ms, recovery {gap['recovery_ms']:.0f} ms | "
+                       f"backfilled {gap['quotes']} quotes, {gap['candles']} candles")
+        if self.on_gap is not None:
+            self.on_gap(gap)
+
+    # --- Backfill ---
+
+    def _backfill(self, gap_start, gap_end):
+        """
+        Refreshes last prices and bars for the outage window. Returns the gap report:
+        {start, end, blind_seconds, symbols, extremes: {symbol: (low, high)},
+         bars: {symbol: 1-min candles}, quotes, candles}.
+        """
+        with self._lock:
+            symbols = sorted(self.symbols)
+        extremes = {}
+        ticks = []
+        for i in range(0, len(symbols), QUOTES_BATCH_LIMIT):
+            batch = symbols[i:i + QUOTES_BATCH_LIMIT]
+            try:
+                response = self.fyers.quotes(data={"symbols": ",".join(batch)})
+            except Exception as e:
+                logger.error(f"Backfill quotes failed: {e}")
+                continue
+            if response.get('s') != 'ok':
+                logger.error(f"Backfill quotes failed: {response.get('message', response)}")
+                continue
+            for item in response.get('d', []):
+                v = item.get('v') or {}
+                ltp = v.get('lp')
+                if not ltp:
+                    continue
+                extremes[item['n']] = (ltp, ltp)
+                ticks.append({"symbol": item['n'], "ltp": ltp, "bid_price": v.get('bid') or 0.0,
+                              "ask_price": v.get('ask') or 0.0, "vol_traded_today": v.get('volume'),
+                              "exch_feed_time": v.get('tt'), "backfill": True})
+
+        candles = 0
+        bars = {}
+        for symbol in self.history_symbols:
+            window = self._history_window(symbol, gap_start, gap_end)
+            if window:
+                bars[symbol] = window
+                low = min(c[3] for c in window)
+                high = max(c[2] for c in window)
+                last_low, last_high = extremes.get(symbol, (low, high))
+                extremes[symbol] = (min(low, last_low), max(high, last_high))
+                if self.bar_builder is not None:
+                    candles += self.bar_builder.backfill(symbol, window)
+
+        # Never overwrite a price that already arrived live on the new connection
+        live = self._live_since_reconnect or set()
+        ticks = [t for t in ticks if t['symbol'] not in live]
+        if ticks:
+            self.on_tick(ticks)
+        self.stats["backfilled_quotes"] += len(ticks)
+        self.stats["backfilled_candles"] += candles
+        return {"start": gap_start, "end": gap_end, "blind_seconds": max(gap_end - gap_start, 0.0),
+                "symbols": symbols, "extremes": extremes, "bars": bars, "quotes": len(ticks), "candles": candles}
+
+    def _history_window(self, symbol, gap_start, gap_end):
+        """1-minute candles overlapping [gap_start, gap_end] (today's session only)."""
+        day = datetime.date.fromtimestamp(gap_end).isoformat()
+        try:
+            response = self.fyers.history(data={"symbol": symbol, "resolution": "1", "date_format": "1",
+                                                "range_from": day, "range_to": day, "cont_flag": "1"})
+        except Exception as e:
+            logger.error(f"Backfill history failed for {symbol}: {e}")
+            return []
+        if response.get('s') != 'ok':
+            return []
+        first_minute = int(gap_start // 60) * 60
+        return [c for c in response.get('candles', []) if first_minute <= c[0] <= gap_end]
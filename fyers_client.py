@@ -3,12 +3,24 @@
 import os
 import webbrowser
 import datetime
+import json
+import threading
+import urllib.parse
+import numpy as np
 import pandas as pd
+import requests
+import websocket
+from requests.adapters import HTTPAdapter
 from fyers_apiv3.fyersModel import FyersModel, SessionModel
+from fyers_apiv3.fyersModel import Config as FyersApiConfig
 from fyers_apiv3.FyersWebsocket.data_ws import FyersDataSocket
+from fyers_apiv3.FyersWebsocket.order_ws import FyersOrderSocket
 import config
+import symbol_master
+import tick_journal
 import time
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
 logger = logging.getLogger(__name__)
 
@@ -16,6 +28,161 @@ logger = logging.getLogger(__name__)
 REDIRECT_URI = "http://127.0.0.1"
 TOKEN_FILE = "access_token.txt"
 
+# Set FYERS_SIM_URL (e.g. http://127.0.0.1:8765) to run against fyers_sim_server.py instead of the Fyers cloud
+SIM_SERVER_URL = os.environ.get("FYERS_SIM_URL", "").rstrip("/") or None
+
+# --- Pooled HTTP Session ---
+# The SDK's FyersServiceSync calls requests.get/post per request (no connection reuse),
+# so every REST call can pay a fresh TCP+TLS handshake. We swap in a service that uses
+# one shared keep-alive session with explicit (connect, read) timeouts per endpoint class.
+HTTP_POOL_SIZE = 8          # >= concurrent callers (order-leg pool + strategy + dashboard)
+PREWARM_CONNECTIONS = 4     # Connections to open before market open
+REST_TIMEOUTS = {           # (connect, read) seconds
+    "order": (1.0, 3.0),
+    "data": (1.0, 2.0),
+    "history": (2.0, 10.0),
+    "account": (2.0, 5.0),
+}
+_ENDPOINT_CLASSES = {
+    FyersApiConfig.orders_endpoint: "order",
+    FyersApiConfig.multileg_orders: "order",
+    FyersApiConfig.multi_orders: "order",
+    FyersApiConfig.gtt_orders_sync: "order",
+    FyersApiConfig.quotes: "data",
+    FyersApiConfig.market_depth: "data",
+    FyersApiConfig.history: "history",
+    FyersApiConfig.option_chain: "history",
+}
+
+_http_session = None
+_http_lock = threading.Lock()
+_http_metrics = {"requests": 0, "errors": 0, "timeouts": 0, "by_class": {}}
+
+def _get_http_session():
+    """Returns the process-wide keep-alive session (created on first use)."""
+    global _http_session
+    with _http_lock:
+        if _http_session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=2, pool_maxsize=HTTP_POOL_SIZE, max_retries=0, pool_block=False)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _http_session = session
+        return _http_session
+
+def _pool_connection_counts():
+    """(handshakes, pooled_requests) summed over every urllib3 pool in the session."""
+    session = _get_http_session()
+    handshakes = pooled_requests = 0
+    for adapter in session.adapters.values():
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                handshakes += pool.num_connections
+                pooled_requests += pool.num_requests
+    return handshakes, pooled_requests
+
+def get_http_metrics():
+    """
+    Snapshot of REST usage: request/error counts per endpoint class, new connections
+    (TCP+TLS handshakes) and connection reuse rate.
+    """
+    handshakes, pooled_requests = _pool_connection_counts()
+    with _http_lock:
+        metrics = {
+            "requests": _http_metrics["requests"],
+            "errors": _http_metrics["errors"],
+            "timeouts": _http_metrics["timeouts"],
+            "by_class": {k: dict(v) for k, v in _http_metrics["by_class"].items()},
+        }
+    metrics["handshakes"] = handshakes
+    metrics["reuse_rate"] = 1 - (handshakes / pooled_requests) if pooled_requests else 0.0
+    return metrics
+
+def _record_http(endpoint_class, latency_ms, error=False, timeout=False):
+    with _http_lock:
+        _http_metrics["requests"] += 1
+        _http_metrics["errors"] += int(error)
+        _http_metrics["timeouts"] += int(timeout)
+        stats = _http_metrics["by_class"].setdefault(endpoint_class, {"requests": 0, "total_ms": 0.0, "max_ms": 0.0})
+        stats["requests"] += 1
+        stats["total_ms"] += latency_ms
+        stats["max_ms"] = max(stats["max_ms"], latency_ms)
+
+
+class PooledFyersService:
+    """
+    Drop-in replacement for fyers_apiv3's FyersServiceSync (same call signatures),
+    backed by the shared keep-alive session with per-endpoint-class timeouts.
+    """
+    content = "application/json"
+
+    def __init__(self, api_base=None, data_base=None):
+        self.api_base = api_base or FyersApiConfig.API
+        self.data_base = data_base or FyersApiConfig.DATA_API
+
+    def _request(self, method, api, header, data=None, data_flag=False, as_params=False):
+        endpoint_class = _ENDPOINT_CLASSES.get(api, "account")
+        url = (self.data_base if data_flag else self.api_base) + api
+        if as_params and data is not None:
+            url = url + "?" + urllib.parse.urlencode(data)
+            body = None
+        else:
+            body = json.dumps(data) if data is not None or method != "GET" else None
+        headers = {"Authorization": header, "Content-Type": self.content, "version": "3"}
+
+        start = time.perf_counter()
+        try:
+            response = _get_http_session().request(method, url, data=body, headers=headers,
+                                                   timeout=REST_TIMEOUTS[endpoint_class])
+            result = response.json()
+            _record_http(endpoint_class, (time.perf_counter() - start) * 1000, error=not response.ok)
+            return result
+        except requests.Timeout as e:
+            _record_http(endpoint_class, (time.perf_counter() - start) * 1000, error=True, timeout=True)
+            logger.error(f"REST timeout on {api} ({endpoint_class}): {e}")
+            return {"s": "error", "code": -99, "message": f"Timeout: {e}"}
+        except Exception as e:
+            _record_http(endpoint_class, (time.perf_counter() - start) * 1000, error=True)
+            logger.error(f"REST error on {api}: {e}")
+            return {"s": "error", "code": -99, "message": str(e)}
+
+    def get_call(self, api, header, data=None, data_flag=False):
+        return self._request("GET", api, header, data, data_flag=data_flag, as_params=True)
+
+    def post_call(self, api, header, data=None):
+        return self._request("POST", api, header, data)
+
+    def delete_call(self, api, header, data):
+        return self._request("DELETE", api, header, data)
+
+    def patch_call(self, api, header, data):
+        return self._request("PATCH", api, header, data)
+
+def _install_pooled_service(fyers):
+    """Routes a FyersModel's REST calls through the pooled session."""
+    if fyers is not None and not fyers.is_async:
+        fyers.service = PooledFyersService()
+    return fyers
+
+def prewarm_connections(fyers_instance, count=PREWARM_CONNECTIONS):
+    """
+    Opens `count` keep-alive connections before market open by issuing cheap
+    concurrent requests, so the first order of the day doesn't pay a TLS handshake.
+    Also usable as a periodic keep-alive ping.
+    """
+    start = time.perf_counter()
+    threads = [threading.Thread(target=fyers_instance.market_status, daemon=True) for _ in range(count)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=REST_TIMEOUTS["account"][0] + REST_TIMEOUTS["account"][1])
+    metrics = get_http_metrics()
+    logger.info(f"HTTP pool pre-warmed in {(time.perf_counter() - start) * 1000:.1f} ms | "
+                f"Handshakes: {metrics['handshakes']} | Reuse rate: {metrics['reuse_rate']:.1%}")
+    return metrics
+
 # --- Authentication Functions ---
 def generate_new_token(client_id, secret_key):
     """Generates a new access token via the manual login flow."""
@@ -47,6 +214,14 @@ def generate_new_token(client_id, secret_key):
         logger.error(f"Error during new token generation: {e}", exc_info=True)
         return None
 
+def _get_sim_fyers_model(client_id):
+    """FyersModel whose REST calls go to the local simulator (no auth round trip)."""
+    os.makedirs("logs", exist_ok=True)  # The SDK logger opens logs/fyersApi.log at construction
+    fyers = FyersModel(client_id=client_id, token="sim-token", log_path=os.path.join(os.getcwd(), "logs"))
+    fyers.service = PooledFyersService(api_base=f"{SIM_SERVER_URL}/api/v3", data_base=f"{SIM_SERVER_URL}/data")
+    logger.warning(f"🧪 SIMULATOR MODE: REST calls for {client_id} go to {SIM_SERVER_URL}")
+    return fyers
+
 def get_fyers_model(client_id=None, secret_key=None):
     """Initializes and returns an authenticated FyersModel instance."""
     use_hft_keys = client_id is not None and secret_key is not None
@@ -54,6 +229,9 @@ def get_fyers_model(client_id=None, secret_key=None):
         client_id = config.FYERS_APP_ID
         secret_key = config.FYERS_SECRET_KEY
 
+    if SIM_SERVER_URL:
+        return _get_sim_fyers_model(client_id)
+
     token_file = "access_token_hft.txt" if use_hft_keys else TOKEN_FILE
     access_token = None
 
@@ -62,7 +240,7 @@ def get_fyers_model(client_id=None, secret_key=None):
             access_token = f.read().strip()
 
     if access_token:
-        fyers = FyersModel(client_id=client_id, token=access_token, log_path=os.path.join(os.getcwd(), "logs"))
+        fyers = fyers_model_for_token(client_id, access_token)
         profile_check = fyers.get_profile()
         if profile_check.get('s') == 'ok':
             logger.info(f"Authentication successful for {client_id} using saved token.")
@@ -73,10 +251,19 @@ def get_fyers_model(client_id=None, secret_key=None):
     
     new_access_token = generate_new_token(client_id, secret_key)
     if new_access_token:
-        return FyersModel(client_id=client_id, token=new_access_token, log_path=os.path.join(os.getcwd(), "logs"))
+        return fyers_model_for_token(client_id, new_access_token)
     else:
         return None
 
+def fyers_model_for_token(client_id, access_token):
+    """
+    FyersModel for a client id and access token the caller already holds (e.g. passed
+    down from the parent process). No profile check and never an interactive login.
+    """
+    if SIM_SERVER_URL:
+        return _get_sim_fyers_model(client_id)
+    return _install_pooled_service(FyersModel(client_id=client_id, token=access_token, log_path=os.path.join(os.getcwd(), "logs")))
+
 # --- Data Functions for Options Agent & ML ---
 def get_historical_data(fyers_instance, symbol, timeframe, start_date, end_date):
     """Fetches historical data and returns it as a pandas DataFrame."""
@@ -105,39 +292,133 @@ def get_historical_data(fyers_instance, symbol, timeframe, start_date, end_date)
 
 _symbol_master_df = None
 _symbol_master_date = None
+_option_index = None  # Built from the symbol master once per day (see _build_option_index)
 
 def _get_fyers_symbol_master():
-    global _symbol_master_df, _symbol_master_date
+    global _symbol_master_df, _symbol_master_date, _option_index
     today = datetime.date.today()
     if _symbol_master_df is not None and _symbol_master_date == today:
         return _symbol_master_df
     
     try:
-        logger.info("Downloading Fyers Symbol Master...")
-        url = "https://public.fyers.in/sym_details/NSE_FO.csv"
-        df = pd.read_csv(url, header=None)
+        # Memory-mapped local cache, refreshed once per day (see symbol_master.py)
+        df = symbol_master.load_dataframe()
+        if df is None:
+            return None
         _symbol_master_df = df
         _symbol_master_date = today
+        _option_index = None  # Rebuilt lazily from the fresh master
         return df
     except Exception as e:
         logger.error(f"Failed to fetch Fyers Symbol Master: {e}")
         return None
 
+def install_symbol_master(df):
+    """Use `df` (NSE_FO.csv column layout) as today's symbol master, e.g. a synthetic one for replay."""
+    global _symbol_master_df, _symbol_master_date, _option_index
+    _symbol_master_df = df
+    _symbol_master_date = datetime.date.today()
+    _option_index = None
+
+def _build_option_index(df):
+    """
+    Builds the in-memory option lookup index from the symbol master:
+      contracts: {(underlying, option_type, strike): [symbol, ...]}  sorted by expiry (nearest first)
+      strikes:   {(underlying, option_type): np.ndarray}  sorted strikes listed for the nearest expiry
+    """
+    # 13: Underlying, 15: Strike Price, 16: Option Type (CE/PE/XX), 8: Expiry Epoch, 9: Symbol
+    options = df[df[16].isin(["CE", "PE"])][[13, 16, 15, 8, 9]]
+    options = options.sort_values(by=[13, 16, 15, 8])
+    
+    contracts = {}
+    for underlying, option_type, strike, _, symbol in options.itertuples(index=False, name=None):
+        contracts.setdefault((underlying, option_type, float(strike)), []).append(symbol)
+    
+    strikes = {}
+    nearest_expiry = options.groupby([13, 16])[8].transform("min")
+    for (underlying, option_type), group in options[options[8] == nearest_expiry].groupby([13, 16]):
+        strikes[(underlying, option_type)] = np.unique(group[15].to_numpy(dtype=float))
+    
+    logger.info(f"Option index built: {len(contracts):,} (underlying, type, strike) keys")
+    return {"contracts": contracts, "strikes": strikes}
+
+def get_option_index():
+    """Returns today's option lookup index, (re)building it from the symbol master when needed."""
+    global _option_index
+    if _get_fyers_symbol_master() is None:
+        return None
+    if _option_index is None:
+        _option_index = _build_option_index(_symbol_master_df)
+    return _option_index
+
+def lookup_option(underlying, option_type, strike, expiry_rank=0):
+    """
+    O(1) symbol lookup by (underlying root e.g. "NIFTY", "CE"/"PE", strike).
+    expiry_rank=0 is the nearest expiry, 1 the next, etc. Returns None if not listed.
+    """
+    index = get_option_index()
+    if index is None:
+        return None
+    symbols = index["contracts"].get((underlying, option_type, float(strike)))
+    if not symbols or expiry_rank >= len(symbols):
+        return None
+    return symbols[expiry_rank]
+
+def strikes_around(underlying, spot, n, option_type="CE"):
+    """
+    The 2n+1 listed nearest-expiry strikes closest to `spot` (vectorised searchsorted
+    on the sorted strike array). Returns an np.ndarray, empty if the underlying is unknown.
+    """
+    index = get_option_index()
+    if index is None:
+        return np.empty(0)
+    strikes = index["strikes"].get((underlying, option_type))
+    if strikes is None or len(strikes) == 0:
+        return np.empty(0)
+    centre = int(np.abs(strikes - spot).argmin())
+    lo = max(centre - n, 0)
+    hi = min(centre + n + 1, len(strikes))
+    return strikes[lo:hi]
+
+# Underlying index symbol, option root and strike step per tradeable index
+INDEX_OPTION_PARAMS = {
+    "NIFTY": ("NSE:NIFTY50-INDEX", "NIFTY", 50),
+    "BANKNIFTY": ("NSE:NIFTYBANK-INDEX", "BANKNIFTY", 100),
+}
+
+def _index_option_params(index_name):
+    """Returns (underlying_symbol, base_symbol, strike_step) for an index name."""
+    name = index_name.upper()
+    if name in INDEX_OPTION_PARAMS:
+        return INDEX_OPTION_PARAMS[name]
+    return f"NSE:{name}-INDEX", name, 100
+
+def get_atm_strike(index_name, spot_price):
+    """Rounds a spot price to the nearest listed strike for the index."""
+    strike_step = _index_option_params(index_name)[2]
+    return round(spot_price / strike_step) * strike_step
+
+def get_option_symbols(index_name, strikes, option_types=("CE", "PE")):
+    """
+    Resolves nearest-expiry option symbols for many strikes via the option index.
+    Returns {(strike, option_type): fyers_symbol}; strikes missing from the master are omitted.
+    """
+    base_symbol = _index_option_params(index_name)[1]
+    result = {}
+    for strike in strikes:
+        for option_type in option_types:
+            symbol = lookup_option(base_symbol, option_type, strike)
+            if symbol is not None:
+                result[(float(strike), option_type)] = symbol
+    return result
+
 def find_option_by_offset(fyers_instance, index_name, option_type="CE", offset=0):
     """
     Finds an option for a given index (NIFTY or BANKNIFTY) by constructing
     and validating possible symbols using the Fyers symbol master.
     """
     try:
-        if index_name.upper() == "NIFTY":
-            underlying_symbol = "NSE:NIFTY50-INDEX"
-            base_symbol = "NIFTY"
-        elif index_name.upper() == "BANKNIFTY":
-            underlying_symbol = "NSE:NIFTYBANK-INDEX"
-            base_symbol = "BANKNIFTY"
-        else:
-            underlying_symbol = f"NSE:{index_name.upper()}-INDEX"
-            base_symbol = index_name.upper()
+        underlying_symbol, base_symbol, strike_step = _index_option_params(index_name)
         
         quote_data = {"symbols": underlying_symbol}
         quote = fyers_instance.quotes(data=quote_data)
@@ -153,36 +434,23 @@ def find_option_by_offset(fyers_instance, index_name, option_type="CE", offset=0
         spot_price = data['lp']
         logger.info(f"   ...{index_name} spot price is {spot_price}")
 
-        rounding = 50 if index_name.upper() == "NIFTY" else 100
-        strike_step = 50 if index_name.upper() == "NIFTY" else 100
-
-        atm_strike = round(spot_price / rounding) * rounding
+        atm_strike = get_atm_strike(index_name, spot_price)
         target_strike = atm_strike + (offset * strike_step) if option_type == "CE" else atm_strike - (offset * strike_step)
         logger.info(f"   ...Targeting strike price: {target_strike}")
         
-        # --- NEW LOGIC: Use Fyers Symbol Master to find exact symbol ---
-        df = _get_fyers_symbol_master()
-        if df is not None:
-            # Filter for the specific base, exact strike and option type
-            # 13: Underlying, 15: Strike Price, 16: Option Type (CE/PE/XX)
-            mask = (df[13] == base_symbol) & (df[15] == float(target_strike)) & (df[16] == option_type)
-            matching = df[mask]
-            
-            if not matching.empty:
-                # Sort by Expiry Epoch (Column 8)
-                matching = matching.sort_values(by=8)
-                best_symbol = matching.iloc[0][9]
-                
-                logger.debug(f"   ...Testing master symbol: {best_symbol}")
-                quote = fyers_instance.quotes({"symbols": best_symbol})
-                if quote.get('s') == 'ok' and quote.get('d') and quote['d'][0].get('v', {}).get('lp', 0) > 0:
-                    logger.info(f"   >>> SUCCESS: Valid symbol found from master: {best_symbol}")
-                    option_data = quote['d'][0]['v']
-                    return { "symbol": best_symbol, "ltp": option_data.get('lp'), "bid": option_data.get('bid'), "ask": option_data.get('ask'), "spot_price": spot_price}
-                else:
-                    logger.debug(f"   ...Symbol {best_symbol} from master returned invalid quote.")
+        # --- Use the symbol-master option index (nearest expiry, O(1)) ---
+        best_symbol = lookup_option(base_symbol, option_type, target_strike)
+        if best_symbol is not None:
+            logger.debug(f"   ...Testing master symbol: {best_symbol}")
+            quote = fyers_instance.quotes({"symbols": best_symbol})
+            if quote.get('s') == 'ok' and quote.get('d') and quote['d'][0].get('v', {}).get('lp', 0) > 0:
+                logger.info(f"   >>> SUCCESS: Valid symbol found from master: {best_symbol}")
+                option_data = quote['d'][0]['v']
+                return { "symbol": best_symbol, "ltp": option_data.get('lp'), "bid": option_data.get('bid'), "ask": option_data.get('ask'), "spot_price": spot_price}
             else:
-                 logger.debug(f"   ...No matching symbols found in master for {base_symbol} {target_strike} {option_type}")
+                logger.debug(f"   ...Symbol {best_symbol} from master returned invalid quote.")
+        else:
+             logger.debug(f"   ...No matching symbols found in master for {base_symbol} {target_strike} {option_type}")
         
         logger.debug(f">>> FAILURE: Could not find a valid instrument for {index_name} at strike {target_strike}.")
         return None
@@ -191,6 +459,78 @@ def find_option_by_offset(fyers_instance, index_name, option_type="CE", offset=0
         logger.error(f"An error occurred in find_option_by_offset: {e}", exc_info=True)
         return None
 
+def _quote_values(response):
+    """Maps each symbol in a quotes() response to its 'v' payload (only entries with a valid lp)."""
+    values = {}
+    for item in response.get('d') or []:
+        v = item.get('v') or {}
+        symbol = item.get('n') or v.get('symbol')
+        if symbol and v.get('lp', 0) > 0:
+            values[symbol] = v
+    return values
+
+def resolve_spread_quote(fyers_instance, index_name, option_type, spot_price=None, sell_offset=1, slack=1):
+    """
+    Resolves and prices an ATM / `sell_offset`-OTM debit spread in ONE quotes() call.
+
+    Candidate strikes are derived from the `spot_price` snapshot (e.g. the tick that
+    triggered the signal), padded by `slack` strikes either side so a small move
+    between the snapshot and the quote doesn't need a second round trip. Spot and
+    every candidate leg are quoted together; the legs are then picked from the
+    quoted spot. Without a snapshot the spot is fetched first (two calls).
+
+    Returns {"spot_price", "atm_strike", "buy_leg", "sell_leg", "net_debit"} with
+    legs shaped like find_option_by_offset, or None.
+    """
+    try:
+        underlying_symbol, base_symbol, strike_step = _index_option_params(index_name)
+        if spot_price is None:
+            spot_values = _quote_values(fyers_instance.quotes(data={"symbols": underlying_symbol}))
+            if underlying_symbol not in spot_values:
+                logger.error(f"Could not fetch spot price for {index_name}.")
+                return None
+            spot_price = spot_values[underlying_symbol]['lp']
+
+        direction = 1 if option_type == "CE" else -1
+        snapshot_atm = get_atm_strike(index_name, spot_price)
+        candidates = {}
+        for k in range(-slack, sell_offset + slack + 1):
+            strike = float(snapshot_atm + direction * k * strike_step)
+            symbol = lookup_option(base_symbol, option_type, strike)
+            if symbol is not None:
+                candidates[strike] = symbol
+        if not candidates:
+            logger.warning(f"[SPREAD] No {option_type} contracts in master around {snapshot_atm} for {index_name}")
+            return None
+
+        symbols = [underlying_symbol] + list(candidates.values())
+        values = _quote_values(fyers_instance.quotes(data={"symbols": ",".join(symbols)}))
+
+        quoted_spot = values.get(underlying_symbol, {}).get('lp', spot_price)
+        atm_strike = get_atm_strike(index_name, quoted_spot)
+        legs = []
+        for strike in (float(atm_strike), float(atm_strike + direction * sell_offset * strike_step)):
+            symbol = candidates.get(strike)
+            v = values.get(symbol) if symbol else None
+            if v is None:
+                logger.warning(f"[SPREAD] {index_name} {strike} {option_type} not priced "
+                               f"(spot {spot_price} -> {quoted_spot})")
+                return None
+            legs.append({"symbol": symbol, "ltp": v.get('lp'), "bid": v.get('bid'),
+                         "ask": v.get('ask'), "spot_price": quoted_spot})
+
+        buy_leg, sell_leg = legs
+        return {
+            "spot_price": quoted_spot,
+            "atm_strike": atm_strike,
+            "buy_leg": buy_leg,
+            "sell_leg": sell_leg,
+            "net_debit": buy_leg['ltp'] - sell_leg['ltp'],
+        }
+    except Exception as e:
+        logger.error(f"An error occurred in resolve_spread_quote: {e}", exc_info=True)
+        return None
+
 # --- Quote Functions ---
 
 def get_quotes(fyers_instance, symbols):
@@ -314,32 +654,237 @@ def place_market_order(fyers_instance, symbol, qty, side):
         logger.error(f"Exception during market order placement: {e}", exc_info=True)
         return {"status": "error", "message": str(e)}
 
+# Shared pool for fanning out independent order legs (kept warm across exits)
+_order_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="order-leg")
+
+def _timed_market_order(fyers_instance, symbol, qty, side):
+    """Runs place_market_order and returns (response, latency_ms)."""
+    start = time.perf_counter()
+    response = place_market_order(fyers_instance, symbol, qty, side)
+    return response, (time.perf_counter() - start) * 1000
+
+def close_spread_legs(fyers_instance, buy_symbol, sell_symbol, qty):
+    """
+    Closes both legs of a debit spread concurrently (sell-to-close the long leg,
+    buy-to-close the short leg) so the exit costs one REST round trip instead of two
+    and the position is never left naked between sequential calls.
+
+    Fyers multi-leg orders only accept IOC limit legs, so market exits are fanned out
+    over the shared order thread pool instead.
+
+    Returns a dict with overall status, per-leg results/latencies and total latency.
+    """
+    return close_legs(fyers_instance, [(buy_symbol, qty, -1), (sell_symbol, qty, 1)])
+
+def close_legs(fyers_instance, legs_to_close):
+    """
+    Market orders for [(symbol, qty, side), ...] fanned out over the shared order pool
+    (used directly to retry only the unfilled remainder of a spread exit).
+    Returns the same dict as close_spread_legs.
+    """
+    start = time.perf_counter()
+    futures = [
+        (symbol, side, _order_executor.submit(_timed_market_order, fyers_instance, symbol, qty, side))
+        for symbol, qty, side in legs_to_close
+    ]
+    legs = []
+    for symbol, side, future in futures:
+        try:
+            response, latency_ms = future.result()
+        except Exception as e:
+            response, latency_ms = {"status": "error", "message": str(e)}, None
+        legs.append({"symbol": symbol, "side": side, "response": response, "latency_ms": latency_ms})
+    total_latency_ms = (time.perf_counter() - start) * 1000
+
+    ok = all(leg["response"].get("status") == "success" for leg in legs)
+    if not ok:
+        logger.error(f"Spread exit incomplete: {[(leg['symbol'], leg['response'].get('message')) for leg in legs]}")
+    return {"status": "success" if ok else "error", "legs": legs, "total_latency_ms": total_latency_ms}
+
 # --- WebSocket Function (NON-BLOCKING) ---
-def start_level2_websocket(access_token, on_tick, symbols):
+class SimDataSocket:
+    """
+    FyersDataSocket look-alike for fyers_sim_server.py (JSON over WebSocket).
+    Same subscribe/unsubscribe/keep_running/close_connection/is_connected surface;
+    each server message is delivered to on_message as a list of SDK-shaped tick dicts.
+    """
+
+    PATH = "/socket"
+
+    def __init__(self, base_url, on_message, on_error=None, on_close=None):
+        self.url = base_url.replace("http://", "ws://").replace("https://", "wss://") + self.PATH
+        self.on_message = on_message
+        self.on_error = on_error
+        self.on_close = on_close
+        self.symbols = set()
+        self._connected = threading.Event()
+        self._running = False
+        self._ws = None
+
+    def connect(self):
+        self._ws = websocket.WebSocketApp(
+            self.url,
+            on_open=lambda ws: self._connected.set(),
+            on_message=self._handle,
+            on_error=lambda ws, err: self.on_error(err) if self.on_error else logger.error(f"Sim socket error: {err}"),
+            on_close=self._closed,
+        )
+        threading.Thread(target=self._ws.run_forever, daemon=True).start()
+        self._connected.wait(5)
+
+    def _handle(self, ws, raw):
+        message = json.loads(raw)
+        if message.get("T") == "ticks":
+            self.on_message(message["d"])
+
+    def _closed(self, ws, code, reason):
+        self._connected.clear()
+        if self.on_close:
+            self.on_close({"code": code, "message": reason})
+        else:
+            logger.warning(f"Sim socket closed: {code} {reason}")
+
+    def _send(self, kind, symbols, data_type):
+        if self._connected.is_set():
+            self._ws.send(json.dumps({"T": kind, "symbols": list(symbols), "data_type": data_type}))
+
+    def subscribe(self, symbols, data_type="SymbolUpdate", channel=11):
+        if data_type == "SymbolUpdate":
+            self.symbols.update(symbols)
+        self._send("SUB", symbols, data_type)
+
+    def unsubscribe(self, symbols, data_type="SymbolUpdate", channel=11):
+        if data_type == "SymbolUpdate":
+            self.symbols.difference_update(symbols)
+        self._send("UNSUB", symbols, data_type)
+
+    def keep_running(self):
+        self._running = True
+        while self._running:
+            time.sleep(0.5)
+
+    def close_connection(self):
+        self._running = False
+        if self._ws is not None:
+            self._ws.close()
+
+    def is_connected(self):
+        return self._connected.is_set()
+
+class SimOrderSocket(SimDataSocket):
+    """
+    FyersOrderSocket look-alike for fyers_sim_server.py: order and trade updates for
+    this account's orders, delivered flat (the SDK's "orders"/"trades" payloads).
+    """
+
+    PATH = "/order-socket"
+
+    def __init__(self, base_url, on_order, on_trade, on_error=None, on_close=None):
+        super().__init__(base_url, on_message=None, on_error=on_error, on_close=on_close)
+        self.on_order = on_order
+        self.on_trade = on_trade
+
+    def _handle(self, ws, raw):
+        message = json.loads(raw)
+        if message.get("T") == "orders":
+            self.on_order(message["d"])
+        elif message.get("T") == "trades":
+            self.on_trade(message["d"])
+
+def start_order_socket(access_token, on_order, on_trade, on_close=None):
+    """
+    Subscribes to the broker's order and trade update stream (NON-BLOCKING).
+    on_order/on_trade get the flat update dicts (see order_book.OrderBook), so fills,
+    partial fills and rejections arrive pushed instead of by polling the orderbook.
+    """
+    try:
+        if SIM_SERVER_URL:
+            sim_socket = SimOrderSocket(SIM_SERVER_URL, on_order=on_order, on_trade=on_trade, on_close=on_close)
+            sim_socket.connect()
+            logger.warning(f"🧪 SIMULATOR MODE: Order socket connected to {SIM_SERVER_URL}")
+            return sim_socket
+
+        def on_orders(message):
+            on_order(message.get("orders", message))
+
+        def on_trades(message):
+            on_trade(message.get("trades", message))
+
+        def on_socket_close(message):
+            logger.warning(f"Order Socket Closed: {message}")
+            if on_close:
+                on_close(message)
+
+        def on_open():
+            order_socket.subscribe(data_type="OnOrders,OnTrades")
+            logger.info("Order Socket Opened. Subscribed to order and trade updates.")
+
+        order_socket = FyersOrderSocket(
+            access_token=f"{config.FYERS_APP_ID}:{access_token}",
+            write_to_file=False,
+            log_path=os.path.join(os.getcwd(), "logs"),
+            on_orders=on_orders,
+            on_trades=on_trades,
+            on_error=lambda message: logger.error(f"Order Socket Error: {message}"),
+            on_connect=on_open,
+            on_close=on_socket_close,
+            reconnect=True
+        )
+        order_socket.connect()
+        return order_socket
+
+    except Exception as e:
+        logger.error(f"An error occurred in start_order_socket: {e}", exc_info=True)
+        return None
+
+def start_level2_websocket(access_token, on_tick, symbols, record_ticks=True, on_close=None, reconnect=True,
+                           client_id=None, subscribe_lock=None):
     """
     Connects to the Fyers WebSocket for Level 2 data.
     THIS IS NON-BLOCKING and requires a valid access token.
+    With `record_ticks`, every message is also appended to the tick journal.
+    `on_close` is called after the socket drops; pass reconnect=False when the caller
+    manages reconnection itself (see feed_manager.ResilientFeed).
+    `client_id` is the app the token belongs to (default: the primary app ID).
+    `subscribe_lock`, if given, is held around the on-connect subscribe so it can't
+    interleave with the caller's own (un)subscribe calls on the same socket.
     """
     try:
-        client_id = config.FYERS_APP_ID # Sockets use the primary app ID
+        client_id = client_id or config.FYERS_APP_ID # Sockets use the primary app ID unless told otherwise
         socket_access_token = f"{client_id}:{access_token}"
+        journal = tick_journal.get_journal() if record_ticks else None
 
         def on_message(message):
+            if journal is not None:
+                journal.record(message)
             on_tick(message)
 
+        if SIM_SERVER_URL:
+            sim_socket = SimDataSocket(SIM_SERVER_URL, on_message=on_message, on_close=on_close)
+            sim_socket.connect()
+            sim_socket.subscribe(symbols=symbols)
+            logger.warning(f"🧪 SIMULATOR MODE: Data socket connected to {SIM_SERVER_URL}")
+            return sim_socket
+
         def on_error(message):
             # print(f"[FYERS DEBUG] WebSocket Error: {message}")
             logger.error(f"WebSocket Error: {message}")
 
-        def on_close(message):
+        def on_socket_close(message):
             # print(f"[FYERS DEBUG] WebSocket Closed: {message}")
             logger.warning(f"WebSocket Connection Closed: {message}")
+            if on_close:
+                on_close(message)
 
         def on_open():
             # print("[FYERS DEBUG] WebSocket Opened. Subscribing...")
             logger.info("WebSocket Connection Opened. Subscribing to symbols...")
             # data_type not specified - rely on default
-            fyers_socket.subscribe(symbols=symbols)
+            if subscribe_lock is not None:
+                with subscribe_lock:
+                    fyers_socket.subscribe(symbols=symbols)
+            else:
+                fyers_socket.subscribe(symbols=symbols)
             # print(f"[FYERS DEBUG] Subscribed to: {symbols}")
             logger.info(f"Subscribed to: {symbols}")
 
@@ -348,8 +893,9 @@ def start_level2_websocket(access_token, on_tick, symbols):
             log_path=os.path.join(os.getcwd(), "logs"),
             on_message=on_message,
             on_error=on_error,
-            on_close=on_close,
-            on_connect=on_open
+            on_close=on_socket_close,
+            on_connect=on_open,
+            reconnect=reconnect
         )
 
         fyers_socket.connect()
@@ -361,6 +907,14 @@ def start_level2_websocket(access_token, on_tick, symbols):
         logger.error(f"An error occurred in start_level2_websocket: {e}", exc_info=True)
         return None
 
+def parse_available_margin(response):
+    """'Available Balance' equity amount from a funds() response, or None if absent/not ok."""
+    if response and response.get('s') == 'ok':
+        for fund in response.get('fund_limit', []):
+            if fund.get('id') == 10 or fund.get('title') == 'Available Balance':
+                return float(fund.get('equityAmount', 0.0))
+    return None
+
 def get_available_margin(fyers_instance):
     """
     Fetches the 'Available Balance' from the Fyers Funds API to ensure
@@ -368,11 +922,10 @@ def get_available_margin(fyers_instance):
     """
     try:
         response = fyers_instance.funds()
-        if response and response.get('s') == 'ok':
-            for fund in response.get('fund_limit', []):
-                if fund.get('id') == 10 or fund.get('title') == 'Available Balance':
-                    return float(fund.get('equityAmount', 0.0))
-                    
+        available = parse_available_margin(response)
+        if available is not None:
+            return available
+
         logger.error(f"Could not parse live available balance from Fyers: {response}")
         # Fallback to config balance if API string fails
         import config
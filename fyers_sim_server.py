@@ -0,0 +1,471 @@
+# fyers_sim_server.py - Local Stand-In Fyers Server (REST + Data WebSocket)
+# =========================================================================
+# Implements the slice of Fyers API v3 our agents use, so the whole stack can
+# be load- and latency-tested offline:
+#   REST  GET  /api/v3/profile, /api/v3/funds
+#         POST /api/v3/orders/sync, /api/v3/multileg/orders/sync
+#         GET  /data/quotes, /data/history, /data/depth, /data/marketStatus
+#   WS    /socket  (JSON: {"T": "SUB"|"UNSUB", "symbols": [...], "data_type": "SymbolUpdate"|"DepthUpdate"}
+#                   -> {"T": "ticks", "d": [...]}; DepthUpdate sends 5-level "dp" payloads)
+#   WS    /order-socket  (pushes {"T": "orders"|"trades", "d": {...}} for every placed order)
+#   GET   /sim/stats  (server-side counters)
+#
+# Prices are seeded random walks; option symbols are priced off their index.
+# Tick rate, injected REST latency/jitter, error rate and forced socket drops
+# are configurable, so feeds can be pushed to 10-100x real volumes.
+#
+# Placed orders are executed against the simulated depth shortly after the
+# ack: limit legs fill only at or better than their price and IOC remainders
+# are cancelled, so partial fills and misses can be provoked with a thin book
+# (--depth-scale) and RMS rejections with --reject-rate.
+#
+# Usage:
+#   python fyers_sim_server.py serve --tick-rate 20 --latency-ms 15 --jitter-ms 10 --error-rate 0.01
+#   FYERS_SIM_URL=http://127.0.0.1:8765 python options_scalper_main.py
+#   python fyers_sim_server.py bench --symbols 200 --seconds 20
+
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import math
+import os
+import random
+import re
+import time
+
+from aiohttp import web, WSMsgType
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8765
+INDEX_PRICES = {"NSE:NIFTY50-INDEX": 25000.0, "NSE:NIFTYBANK-INDEX": 56000.0, "NSE:FINNIFTY-INDEX": 26500.0}
+OPTION_UNDERLYINGS = {"NIFTY": ("NSE:NIFTY50-INDEX", 50), "BANKNIFTY": ("NSE:NIFTYBANK-INDEX", 100),
+                      "FINNIFTY": ("NSE:FINNIFTY-INDEX", 50)}
+_OPTION_RE = re.compile(r"^NSE:([A-Z]+?)(\d{2}[A-Z0-9]{3})(\d+)(CE|PE)$")
+
+
+class PriceBook:
+    """Seeded random-walk prices for every symbol the server has been asked about."""
+
+    def __init__(self, seed):
+        self.rng = random.Random(seed)
+        self.prices = {}
+        self.volumes = {}
+
+    def _base_price(self, symbol):
+        if symbol in INDEX_PRICES:
+            return INDEX_PRICES[symbol]
+        return 100.0 + (sum(map(ord, symbol)) * 7919) % 2900  # Deterministic per-symbol equity price
+
+    def _option_price(self, symbol):
+        match = _OPTION_RE.match(symbol)
+        if not match or match.group(1) not in OPTION_UNDERLYINGS:
+            return None
+        index_symbol, step = OPTION_UNDERLYINGS[match.group(1)]
+        spot = self.ltp(index_symbol)
+        strike, option_type = float(match.group(3)), match.group(4)
+        intrinsic = max(spot - strike, 0.0) if option_type == "CE" else max(strike - spot, 0.0)
+        time_value = 0.004 * spot * math.exp(-abs(spot - strike) / (4 * step))
+        return max(round((intrinsic + time_value) * 20) / 20, 0.05)
+
+    def ltp(self, symbol):
+        option_price = self._option_price(symbol)
+        if option_price is not None:
+            return option_price
+        if symbol not in self.prices:
+            self.prices[symbol] = self._base_price(symbol)
+        return self.prices[symbol]
+
+    def step(self, symbols):
+        """Advance every underlying one tick and return SDK-shaped tick dicts for `symbols`."""
+        now = int(time.time())
+        for symbol in list(self.prices):
+            price = self.prices[symbol]
+            self.prices[symbol] = round(max(price + self.rng.gauss(0, price * 0.00005), 0.05) * 20) / 20
+        ticks = []
+        for symbol in symbols:
+            ltp = self.ltp(symbol)
+            qty = self.rng.randint(1, 50)
+            self.volumes[symbol] = self.volumes.get(symbol, 0) + qty
+            ticks.append({
+                "symbol": symbol, "ltp": ltp, "type": "sf",
+                "bid_price": round(ltp - 0.05, 2), "ask_price": round(ltp + 0.05, 2),
+                "bid_size": self.rng.randint(25, 2000), "ask_size": self.rng.randint(25, 2000),
+                "last_traded_qty": qty, "vol_traded_today": self.volumes[symbol],
+                "last_traded_time": now, "exch_feed_time": now,
+            })
+        return ticks
+
+    def depth(self, symbol, levels=5, scale=1.0):
+        """(bids, asks) as [(price, volume), ...], best first, around the current LTP."""
+        ltp = self.ltp(symbol)
+        bids = [(round(ltp - 0.05 * i, 2), max(int(75 * (levels + 1 - i) * 4 * scale), 1)) for i in range(1, levels + 1)]
+        asks = [(round(ltp + 0.05 * i, 2), max(int(75 * (levels + 1 - i) * 4 * scale), 1)) for i in range(1, levels + 1)]
+        return bids, asks
+
+
+class FyersSimServer:
+    def __init__(self, tick_rate=1.0, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0,
+                 disconnect_every=0.0, seed=1, balance=100000.0, fill_latency_ms=2.0, reject_rate=0.0,
+                 depth_scale=1.0):
+        self.tick_rate = tick_rate
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.disconnect_every = disconnect_every
+        self.balance = balance
+        self.fill_latency_ms = fill_latency_ms
+        self.reject_rate = reject_rate
+        self.depth_scale = depth_scale
+        self.rng = random.Random(seed)
+        self.book = PriceBook(seed)
+        self.clients = {}  # ws -> set of subscribed symbols
+        self.depth_clients = {}  # ws -> set of symbols subscribed to DepthUpdate
+        self.order_clients = set()
+        self.orders = []
+        self.stats = {"rest_requests": 0, "rest_errors": 0, "ws_connects": 0, "ws_drops": 0,
+                      "tick_messages": 0, "ticks_sent": 0, "legs_filled": 0, "legs_partial": 0,
+                      "legs_unfilled": 0, "legs_rejected": 0, "order_updates": 0}
+
+    # --- REST ---
+
+    async def _inject(self):
+        """Injected latency and error rate; returns an error body or None."""
+        self.stats["rest_requests"] += 1
+        delay = self.latency_ms + (self.rng.uniform(0, self.jitter_ms) if self.jitter_ms else 0.0)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+        if self.error_rate and self.rng.random() < self.error_rate:
+            self.stats["rest_errors"] += 1
+            return web.json_response({"s": "error", "code": -429, "message": "Simulated error"}, status=429)
+        return None
+
+    def _route(self, handler):
+        async def wrapped(request):
+            error = await self._inject()
+            if error is not None:
+                return error
+            return web.json_response(await handler(request))
+        return wrapped
+
+    async def profile(self, request):
+        return {"s": "ok", "code": 200, "data": {"fy_id": "SIM0001", "name": "Fyers Simulator"}}
+
+    async def funds(self, request):
+        return {"s": "ok", "code": 200, "fund_limit": [
+            {"id": 10, "title": "Available Balance", "equityAmount": self.balance, "commodityAmount": 0.0}]}
+
+    async def market_status(self, request):
+        return {"s": "ok", "code": 200, "marketStatus": [{"exchange": 10, "segment": 11, "status": "OPEN"}]}
+
+    async def quotes(self, request):
+        symbols = [s for s in request.query.get("symbols", "").split(",") if s]
+        if not symbols:
+            return {"s": "error", "code": -300, "message": "Please provide a valid symbol"}
+        data = []
+        for symbol in symbols:
+            ltp = self.book.ltp(symbol)
+            data.append({"n": symbol, "s": "ok", "v": {
+                "symbol": symbol, "lp": ltp, "bid": round(ltp - 0.05, 2), "ask": round(ltp + 0.05, 2),
+                "volume": self.book.volumes.get(symbol, 0), "tt": int(time.time())}})
+        return {"s": "ok", "code": 200, "d": data}
+
+    async def depth(self, request):
+        symbol = request.query.get("symbol", "")
+        bids, asks = self.book.depth(symbol, scale=self.depth_scale)
+        return {"s": "ok", "d": {symbol: {
+            "ltp": self.book.ltp(symbol),
+            "bids": [{"price": price, "volume": volume, "ord": 5 - i} for i, (price, volume) in enumerate(bids)],
+            "ask": [{"price": price, "volume": volume, "ord": 5 - i} for i, (price, volume) in enumerate(asks)],
+        }}}
+
+    async def history(self, request):
+        symbol = request.query.get("symbol", "")
+        resolution = request.query.get("resolution", "5")
+        start = datetime.date.fromisoformat(request.query.get("range_from", datetime.date.today().isoformat()))
+        end = datetime.date.fromisoformat(request.query.get("range_to", start.isoformat()))
+        rng = random.Random(f"{symbol}|{resolution}|{start}")  # Same request -> same candles
+        minutes = 375 if resolution.upper() in ("D", "1D") else int(resolution)
+        price = self.book.ltp(symbol)
+        candles = []
+        day = start
+        while day <= end:
+            if day.weekday() < 5:
+                ts = datetime.datetime.combine(day, datetime.time(9, 15))
+                close = datetime.datetime.combine(day, datetime.time(15, 30))
+                now = datetime.datetime.now()
+                while ts < close and ts < now:
+                    o = price
+                    moves = [rng.gauss(0, price * 0.0004 * math.sqrt(minutes)) for _ in range(4)]
+                    path = [o + sum(moves[:i + 1]) for i in range(4)]
+                    c = round(path[-1], 2)
+                    candles.append([int(ts.timestamp()), round(o, 2), round(max([o] + path), 2),
+                                    round(min([o] + path), 2), c, rng.randint(1000, 100000)])
+                    price = c
+                    ts += datetime.timedelta(minutes=minutes)
+            day += datetime.timedelta(days=1)
+        if not candles:
+            return {"s": "no_data", "candles": []}
+        return {"s": "ok", "candles": candles}
+
+    async def _place(self, request):
+        data = await request.json()
+        order_id = f"SIM{len(self.orders) + 1:010d}"
+        self.orders.append({"id": order_id, "data": data, "ts": time.time()})
+        asyncio.get_running_loop().create_task(self._execute(order_id, data))
+        return {"s": "ok", "code": 1101, "message": "Order submitted successfully", "id": order_id}
+
+    # --- Order execution + order socket ---
+
+    async def _push(self, kind, payload):
+        message = json.dumps({"T": kind, "d": payload})
+        for ws in list(self.order_clients):
+            if not ws.closed:
+                try:
+                    await ws.send_str(message)
+                except ConnectionError:
+                    pass
+        self.stats["order_updates"] += 1
+
+    def _match(self, leg):
+        """Walks the opposite side of the book for one leg: [(price, qty), ...] it can fill."""
+        bids, asks = self.book.depth(leg["symbol"], scale=self.depth_scale)
+        levels = asks if leg["side"] == 1 else bids
+        market = leg.get("type") == 2
+        limit = float(leg.get("limitPrice") or 0)
+        remaining, fills = int(leg["qty"]), []
+        for price, volume in levels:
+            if remaining <= 0:
+                break
+            if not market and (price > limit if leg["side"] == 1 else price < limit):
+                break
+            take = min(volume, remaining)
+            fills.append((price, take))
+            remaining -= take
+        if market and remaining > 0:
+            fills.append((levels[-1][0], remaining))  # Market orders sweep past the visible depth
+        return fills
+
+    async def _execute(self, order_id, data):
+        """Fills (or rejects) every leg of a placed order and pushes order/trade updates."""
+        if self.fill_latency_ms > 0:
+            await asyncio.sleep(self.fill_latency_ms / 1000)
+        legs = data.get("legs") or [data]
+        rejected = self.reject_rate and self.rng.random() < self.reject_rate
+        for leg in legs:
+            update = {"id": order_id, "symbol": leg["symbol"], "qty": int(leg["qty"]), "side": leg["side"],
+                      "type": leg.get("type", 1), "limitPrice": leg.get("limitPrice", 0), "slNo": leg.get("slNo", 1),
+                      "filledQty": 0, "tradedPrice": 0.0, "orderDateTime": int(time.time())}
+            await self._push("orders", dict(update, status=6, message="Order pending"))
+            if rejected:
+                self.stats["legs_rejected"] += 1
+                await self._push("orders", dict(update, status=5, message="RMS: Simulated rejection"))
+                continue
+            fills = self._match(leg)
+            for price, qty in fills:
+                await self._push("trades", {"tradeNumber": f"T{order_id}-{leg.get('slNo', 1)}-{price}",
+                                            "orderNumber": order_id, "symbol": leg["symbol"], "side": leg["side"],
+                                            "tradedQty": qty, "tradePrice": price})
+            filled = sum(qty for _, qty in fills)
+            avg_price = round(sum(price * qty for price, qty in fills) / filled, 2) if filled else 0.0
+            if filled == update["qty"]:
+                self.stats["legs_filled"] += 1
+                status, message = 2, "Order filled"
+            else:
+                self.stats["legs_partial" if filled else "legs_unfilled"] += 1
+                status, message = 1, f"IOC remainder cancelled ({filled}/{update['qty']} filled)"
+            await self._push("orders", dict(update, status=status, message=message, filledQty=filled,
+                                            remainingQuantity=update["qty"] - filled, tradedPrice=avg_price))
+
+    async def order_socket(self, request):
+        ws = web.WebSocketResponse(heartbeat=30)
+        await ws.prepare(request)
+        self.order_clients.add(ws)
+        await ws.send_json({"T": "cn", "s": "ok", "message": "Connected to Fyers simulator order socket"})
+        try:
+            async for _ in ws:
+                pass
+        finally:
+            self.order_clients.discard(ws)
+        return ws
+
+    async def sim_stats(self, request):
+        return web.json_response(dict(self.stats, clients=len(self.clients), orders=len(self.orders),
+                                      symbols=len(set().union(*self.clients.values())) if self.clients else 0))
+
+    # --- Data socket ---
+
+    async def socket(self, request):
+        ws = web.WebSocketResponse(heartbeat=30)
+        await ws.prepare(request)
+        self.clients[ws] = set()
+        self.depth_clients[ws] = set()
+        self.stats["ws_connects"] += 1
+        await ws.send_json({"T": "cn", "s": "ok", "message": "Connected to Fyers simulator"})
+        try:
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    continue
+                payload = json.loads(msg.data)
+                symbols = payload.get("symbols") or []
+                subscribed = self.depth_clients[ws] if payload.get("data_type") == "DepthUpdate" else self.clients[ws]
+                if payload.get("T") == "SUB":
+                    subscribed.update(symbols)
+                    await ws.send_json({"T": "sub", "s": "ok", "symbols": symbols})
+                elif payload.get("T") == "UNSUB":
+                    subscribed.difference_update(symbols)
+                    await ws.send_json({"T": "unsub", "s": "ok", "symbols": symbols})
+        finally:
+            self.clients.pop(ws, None)
+            self.depth_clients.pop(ws, None)
+        return ws
+
+    def _depth_payload(self, symbol):
+        """SDK-shaped DepthUpdate message for one symbol."""
+        bids, asks = self.book.depth(symbol, 5, self.depth_scale)
+        payload = {"symbol": symbol, "type": "dp"}
+        for i, ((bid, bid_size), (ask, ask_size)) in enumerate(zip(bids, asks), start=1):
+            payload.update({f"bid_price{i}": bid, f"bid_size{i}": bid_size, f"ask_price{i}": ask, f"ask_size{i}": ask_size})
+        return payload
+
+    async def _send_depth(self, ticks):
+        """Pushes fresh depth for every depth-subscribed symbol that just ticked."""
+        for ws, symbols in list(self.depth_clients.items()):
+            batch = [self._depth_payload(s) for s in symbols if s in ticks]
+            if batch and not ws.closed:
+                try:
+                    await ws.send_str(json.dumps({"T": "ticks", "d": batch}))
+                    self.stats["tick_messages"] += 1
+                except ConnectionError:
+                    pass
+
+    async def _tick_loop(self):
+        interval = 1.0 / self.tick_rate
+        next_at = time.perf_counter()
+        next_drop = time.monotonic() + self.disconnect_every if self.disconnect_every else None
+        while True:
+            next_at += interval
+            if self.clients:
+                wanted = set().union(*self.clients.values())
+                ticks = {t["symbol"]: t for t in self.book.step(wanted)}
+                sent_ns = time.time_ns()
+                for tick in ticks.values():
+                    tick["sim_ts_ns"] = sent_ns  # Lets clients measure server -> callback latency
+                for ws, symbols in list(self.clients.items()):
+                    batch = [ticks[s] for s in symbols if s in ticks]
+                    if batch and not ws.closed:
+                        try:
+                            await ws.send_str(json.dumps({"T": "ticks", "d": batch}))
+                            self.stats["tick_messages"] += 1
+                            self.stats["ticks_sent"] += len(batch)
+                        except ConnectionError:
+                            pass
+                await self._send_depth(ticks)
+            if next_drop is not None and time.monotonic() >= next_drop:
+                next_drop = time.monotonic() + self.disconnect_every
+                for ws in list(self.clients):
+                    self.stats["ws_drops"] += 1
+                    await ws.close(message=b"Simulated drop")
+            await asyncio.sleep(max(next_at - time.perf_counter(), 0))
+
+    async def _start_background(self, app):
+        app["tick_task"] = asyncio.create_task(self._tick_loop())
+
+    async def _stop_background(self, app):
+        app["tick_task"].cancel()
+
+    def make_app(self):
+        app = web.Application()
+        app.router.add_get("/api/v3/profile", self._route(self.profile))
+        app.router.add_get("/api/v3/funds", self._route(self.funds))
+        app.router.add_post("/api/v3/orders/sync", self._route(self._place))
+        app.router.add_post("/api/v3/multileg/orders/sync", self._route(self._place))
+        app.router.add_get("/data/quotes", self._route(self.quotes))
+        app.router.add_get("/data/depth", self._route(self.depth))
+        app.router.add_get("/data/history", self._route(self.history))
+        app.router.add_get("/data/marketStatus", self._route(self.market_status))
+        app.router.add_get("/socket", self.socket)
+        app.router.add_get("/order-socket", self.order_socket)
+        app.router.add_get("/sim/stats", self.sim_stats)
+        app.on_startup.append(self._start_background)
+        app.on_cleanup.append(self._stop_background)
+        return app
+
+
+def serve(args):
+    server = FyersSimServer(tick_rate=args.tick_rate, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                            error_rate=args.error_rate, disconnect_every=args.disconnect_every, seed=args.seed,
+                            fill_latency_ms=args.fill_latency_ms, reject_rate=args.reject_rate,
+                            depth_scale=args.depth_scale)
+    logger.info(f"🧪 Fyers simulator on http://{args.host}:{args.port} | {args.tick_rate:g} ticks/s per symbol | "
+                f"latency {args.latency_ms:g}+{args.jitter_ms:g} ms | error rate {args.error_rate:.1%}")
+    logger.info(f"   Point agents at it with: FYERS_SIM_URL=http://{args.host}:{args.port}")
+    web.run_app(server.make_app(), host=args.host, port=args.port, print=None, access_log=None)
+
+
+def bench(args):
+    """Drive the simulator through fyers_client (the same code paths the agents use)."""
+    os.environ["FYERS_SIM_URL"] = args.url
+    import fyers_client
+    from latency_stats import LatencyRecorder
+
+    recorder = LatencyRecorder()
+    counters = {"messages": 0, "ticks": 0}
+
+    def on_tick(message):
+        now_ns = time.time_ns()
+        ticks = message if isinstance(message, list) else [message]
+        counters["messages"] += 1
+        counters["ticks"] += len(ticks)
+        for tick in ticks:
+            sent_ns = tick.get("sim_ts_ns")
+            if sent_ns:
+                recorder.record("ws.server_send->client_callback", now_ns - sent_ns)
+
+    fyers = fyers_client.get_fyers_model()
+    symbols = list(INDEX_PRICES) + [f"NSE:SIM{i:04d}-EQ" for i in range(max(args.symbols - len(INDEX_PRICES), 0))]
+    sock = fyers_client.start_level2_websocket(fyers.token, on_tick, symbols, record_ticks=False)
+    deadline = time.monotonic() + args.seconds
+    while time.monotonic() < deadline:
+        start = time.perf_counter_ns()
+        fyers.quotes(data={"symbols": ",".join(symbols[:50])})
+        recorder.record("rest.quotes", time.perf_counter_ns() - start)
+        time.sleep(args.quote_interval)
+    sock.close_connection()
+
+    print(f"Ticks: {counters['ticks']:,} in {counters['messages']:,} messages over {args.seconds:g} s "
+          f"-> {counters['ticks'] / args.seconds:,.0f} ticks/s")
+    for name, s in recorder.snapshot().items():
+        print(f"  ⏱️ {name:<36} n={s['count']:<8} p50 {s['p50_ms']:.3f}  p90 {s['p90_ms']:.3f}  "
+              f"p99 {s['p99_ms']:.3f}  max {s['max_ms']:.3f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local stand-in Fyers server for load and latency testing.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("serve", help="Run the simulator")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=DEFAULT_PORT)
+    p.add_argument("--tick-rate", type=float, default=1.0, help="Ticks per second per subscribed symbol")
+    p.add_argument("--latency-ms", type=float, default=0.0, help="Injected REST latency")
+    p.add_argument("--jitter-ms", type=float, default=0.0, help="Extra uniform random REST latency")
+    p.add_argument("--error-rate", type=float, default=0.0, help="Fraction of REST calls answered with an error")
+    p.add_argument("--disconnect-every", type=float, default=0.0, help="Drop all sockets every N seconds (0 = never)")
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--fill-latency-ms", type=float, default=2.0, help="Delay from order ack to its fill updates")
+    p.add_argument("--reject-rate", type=float, default=0.0, help="Fraction of orders rejected (all legs)")
+    p.add_argument("--depth-scale", type=float, default=1.0, help="Multiplier on simulated depth (< 1 provokes partial fills)")
+    p = sub.add_parser("bench", help="Measure tick throughput and REST latency against a running simulator")
+    p.add_argument("--url", default=f"http://127.0.0.1:{DEFAULT_PORT}")
+    p.add_argument("--symbols", type=int, default=100)
+    p.add_argument("--seconds", type=float, default=10.0)
+    p.add_argument("--quote-interval", type=float, default=0.05)
+    args = parser.parse_args(argv)
+    serve(args) if args.command == "serve" else bench(args)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    main()
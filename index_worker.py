@@ -0,0 +1,111 @@
+# index_worker.py - Per-Underlying Strategy Workers
+# =================================================
+# The scalper's dispatcher drains the conflated tick store and hands each tick
+# to the worker of the underlying it affects (the index tick itself, plus the
+# option-leg ticks of that index's open spreads). Every worker has its own
+# thread and inbound queue, so a NIFTY breakout blocked on REST calls (ORB
+# history, quotes, order placement) never delays BANKNIFTY exit checks.
+#
+# Batches that pile up while a worker is busy are merged when it picks them up
+# (latest tick per symbol wins), mirroring the conflating store upstream: a
+# worker that fell behind acts on current prices, not on a backlog.
+#
+# inline=True runs the handler on the submitting thread instead (used by the
+# deterministic replay harness).
+
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class IndexWorker:
+    """
+    Runs `handler(worker, dequeue_ns, batch)` for one underlying, where batch is a
+    list of (recv_ns, Tick). Handler errors are logged and the worker keeps going.
+    """
+
+    def __init__(self, index_name, index_symbol, handler, latency=None, inline=False):
+        self.index_name = index_name
+        self.index_symbol = index_symbol
+        self.handler = handler
+        self.latency = latency  # Optional LatencyRecorder: "worker.<index>.queue_wait"
+        self.inline = inline
+        self.stats = {"batches": 0, "merged": 0, "max_backlog": 0, "busy_ns": 0, "max_busy_ns": 0, "errors": 0}
+        self._pending = deque()  # (submit_ns, dequeue_ns, batch)
+        self._cond = threading.Condition(threading.Lock())
+        self._stopped = False
+        self._thread = None
+
+    def start(self):
+        if not self.inline:
+            self._thread = threading.Thread(target=self._run, name=f"worker-{self.index_name}", daemon=True)
+            self._thread.start()
+        return self
+
+    def submit(self, dequeue_ns, batch):
+        """Queues a batch for this underlying (or processes it right away when inline)."""
+        if self.inline:
+            self._process(dequeue_ns, batch)
+            return
+        with self._cond:
+            self._pending.append((time.monotonic_ns(), dequeue_ns, batch))
+            if len(self._pending) > self.stats["max_backlog"]:
+                self.stats["max_backlog"] = len(self._pending)
+            self._cond.notify()
+
+    def stop(self, timeout=5.0):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def log_report(self, logger):
+        batches = self.stats["batches"]
+        if batches:
+            logger.info(f"Worker {self.index_name}: {batches} batches ({self.stats['merged']} merged while busy) | "
+                        f"Busy avg {self.stats['busy_ns'] / batches / 1e6:.3f} ms, max {self.stats['max_busy_ns'] / 1e6:.1f} ms | "
+                        f"Max backlog {self.stats['max_backlog']} | Errors {self.stats['errors']}")
+
+    def _take(self):
+        """Blocks for pending work; returns one (submit_ns, dequeue_ns, batch) with any backlog merged in."""
+        with self._cond:
+            while not self._pending and not self._stopped:
+                self._cond.wait()
+            if self._stopped:
+                return None
+            pending, self._pending = self._pending, deque()
+        if len(pending) == 1:
+            return pending[0]
+        merged = {}
+        for _, _, batch in pending:
+            for item in batch:
+                merged[item[1].sym_id] = item
+        self.stats["merged"] += len(pending) - 1
+        return pending[0][0], pending[-1][1], list(merged.values())
+
+    def _run(self):
+        while True:
+            work = self._take()
+            if work is None:
+                return
+            submit_ns, dequeue_ns, batch = work
+            if self.latency is not None:
+                self.latency.record(f"worker.{self.index_name}.queue_wait", time.monotonic_ns() - submit_ns)
+            self._process(dequeue_ns, batch)
+
+    def _process(self, dequeue_ns, batch):
+        start_ns = time.monotonic_ns()
+        try:
+            self.handler(self, dequeue_ns, batch)
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.error(f"Error in {self.index_name} worker: {e}", exc_info=True)
+        busy_ns = time.monotonic_ns() - start_ns
+        self.stats["batches"] += 1
+        self.stats["busy_ns"] += busy_ns
+        if busy_ns > self.stats["max_busy_ns"]:
+            self.stats["max_busy_ns"] = busy_ns
@@ -0,0 +1,139 @@
+# latency_stats.py - Stage-Level Latency Histograms (Tick-to-Order Path)
+# =====================================================================
+# Every timestamp on the hot path comes from time.monotonic_ns(). A trace
+# follows one tick through WebSocket receive -> dequeue -> strategy decision
+# -> order send -> broker ack -> fill confirmation, and the gap between each
+# pair of consecutive marks lands in its own HDR-style (log-linear) histogram.
+# The slow loop logs p50/p90/p99/max per stage for the session so far.
+
+import threading
+import time
+
+SUB_BUCKET_BITS = 7  # 64-128 linear sub-buckets per power of two -> < 1% relative error
+
+# Canonical mark order for a trace; stages are the gaps between consecutive marks
+STAGES = ("ws_receive", "dequeue", "decision", "order_send", "broker_ack", "fill_confirm")
+
+
+def _bucket_index(value_ns):
+    if value_ns < (1 << SUB_BUCKET_BITS):
+        return value_ns
+    shift = value_ns.bit_length() - SUB_BUCKET_BITS
+    return (shift << (SUB_BUCKET_BITS - 1)) + (value_ns >> shift)
+
+
+def _bucket_value(index):
+    """Midpoint of the value range covered by a bucket index."""
+    if index < (1 << SUB_BUCKET_BITS):
+        return index
+    shift = (index >> (SUB_BUCKET_BITS - 1)) - 1
+    mantissa = index - (shift << (SUB_BUCKET_BITS - 1))
+    return (mantissa << shift) + ((1 << shift) >> 1)
+
+
+class LatencyHistogram:
+    """Log-linear histogram of nanosecond durations with constant-time record()."""
+
+    def __init__(self):
+        self.counts = {}  # bucket index -> count (sparse)
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def record(self, value_ns):
+        value_ns = max(int(value_ns), 0)
+        index = _bucket_index(value_ns)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total_ns += value_ns
+        if value_ns > self.max_ns:
+            self.max_ns = value_ns
+
+    def percentile(self, pct):
+        """Approximate value (ns) at the given percentile (0-100)."""
+        if self.count == 0:
+            return 0
+        target = max(1, int(round(self.count * pct / 100.0)))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= target:
+                return min(_bucket_value(index), self.max_ns)
+        return self.max_ns
+
+    def summary(self):
+        """{count, mean_ms, p50_ms, p90_ms, p99_ms, max_ms}"""
+        return {
+            "count": self.count,
+            "mean_ms": self.total_ns / self.count / 1e6 if self.count else 0.0,
+            "p50_ms": self.percentile(50) / 1e6,
+            "p90_ms": self.percentile(90) / 1e6,
+            "p99_ms": self.percentile(99) / 1e6,
+            "max_ms": self.max_ns / 1e6,
+        }
+
+
+class LatencyTrace:
+    """Monotonic timestamps for one tick's trip through the pipeline."""
+
+    __slots__ = ("path", "marks")
+
+    def __init__(self, path, recv_ns=None, dequeue_ns=None):
+        self.path = path  # e.g. "entry", "exit"
+        self.marks = {}
+        if recv_ns is not None:
+            self.marks["ws_receive"] = recv_ns
+        if dequeue_ns is not None:
+            self.marks["dequeue"] = dequeue_ns
+
+    def mark(self, stage):
+        self.marks[stage] = time.monotonic_ns()
+        return self
+
+
+class LatencyRecorder:
+    """Thread-safe set of named histograms for the session."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self.session_start = time.monotonic_ns()
+
+    def record(self, name, value_ns):
+        with self._lock:
+            hist = self._histograms.get(name)
+            if hist is None:
+                hist = self._histograms[name] = LatencyHistogram()
+            hist.record(value_ns)
+
+    def record_trace(self, trace):
+        """
+        Records each gap between consecutive marks as "<path>.<from>-><to>", plus
+        "<path>.total" from the first to the last mark. Missing marks are skipped
+        (e.g. paper trades have no order_send / broker_ack).
+        """
+        present = [(stage, trace.marks[stage]) for stage in STAGES if stage in trace.marks]
+        if len(present) < 2:
+            return
+        for (prev_stage, prev_ns), (stage, ns) in zip(present, present[1:]):
+            self.record(f"{trace.path}.{prev_stage}->{stage}", ns - prev_ns)
+        self.record(f"{trace.path}.total", present[-1][1] - present[0][1])
+
+    def snapshot(self):
+        """{histogram name: summary dict} for every stage seen this session."""
+        with self._lock:
+            return {name: hist.summary() for name, hist in sorted(self._histograms.items())}
+
+    def log_report(self, logger):
+        snapshot = self.snapshot()
+        if not snapshot:
+            return
+        logger.info(f"Latency (session, ms): {'stage':<34} {'count':>7} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}")
+        for name, s in snapshot.items():
+            logger.info(f"  ⏱️ {name:<36} {s['count']:>7} {s['p50_ms']:>8.3f} {s['p90_ms']:>8.3f} "
+                        f"{s['p99_ms']:>8.3f} {s['max_ms']:>8.3f}")
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {}
+            self.session_start = time.monotonic_ns()
@@ -0,0 +1,142 @@
+# limit_pricer.py - Book-Aware Limit Pricing for Multi-Leg IOC Entries
+# ====================================================================
+# Prices each leg of a debit-spread IOC at the tightest marketable limit for
+# the target quantity, from the book the data socket already streams into the
+# market data stores (no REST call):
+#
+#   buy leg  -> walk the asks until the cumulative size covers the quantity
+#   sell leg -> walk the bids the same way
+#
+# and rounds outward to the exchange tick. The limit is never allowed past
+# max_slippage_pct from the leg price the signal was built on: a book that
+# needs more than that is refused, and a book too thin to show the whole
+# quantity (or with no quote at all) is priced at that ceiling so the IOC can
+# sweep whatever sits behind the visible levels.
+#
+# The visible book is the leg's 5-level DepthUpdate book (market_data_store.
+# DepthStore; live trading subscribes the option ladder to depth) while that
+# is fresher than MAX_DEPTH_AGE. Without it, only the best bid/ask and its
+# size from the SymbolUpdate tick are visible, and a quantity larger than the
+# best level is priced at the ceiling.
+#
+# record_fill() keeps per-order fill rate, slippage against the signal prices
+# and price improvement against our own limits, so the pricing can be tuned.
+
+import logging
+import math
+
+logger = logging.getLogger(__name__)
+
+PRICE_TICK = 0.05               # NSE F&O option tick size
+MAX_ENTRY_SLIPPAGE_PCT = 1.0    # Ceiling per leg vs. the signal's leg price (the old fixed markup)
+MAX_DEPTH_AGE = 2.0             # Seconds; older depth is ignored in favour of the latest tick's best level
+
+
+class LimitPricer:
+    """Stateless pricing over a ConflatingMarketDataStore (and optional DepthStore), plus session fill statistics."""
+
+    def __init__(self, market_data, depth=None, max_slippage_pct=MAX_ENTRY_SLIPPAGE_PCT, tick=PRICE_TICK):
+        self.market_data = market_data
+        self.depth = depth
+        self.max_slippage_pct = max_slippage_pct
+        self.tick = tick
+        self.stats = {"priced": 0, "from_book": 0, "at_cap": 0, "too_wide": 0, "depth_legs": 0,
+                      "orders": 0, "filled": 0, "partial": 0, "missed": 0, "unconfirmed": 0,
+                      "qty_requested": 0, "qty_filled": 0, "slippage": 0.0, "improvement": 0.0}
+
+    def price_spread(self, buy_symbol, sell_symbol, qty, buy_ref, sell_ref):
+        """
+        Limit prices for buying `qty` of buy_symbol and selling `qty` of sell_symbol.
+        Returns a quote dict (buy_limit, sell_limit, refs, qty, source) or None if
+        either leg's book is wider than the slippage ceiling allows.
+
+        Each leg walks its fresh 5-level depth when the leg streams DepthUpdate, else
+        only the best bid/ask level of its latest tick: a quantity beyond what is
+        visible is priced at the ceiling (source "cap").
+        """
+        buy = self._price_leg(buy_symbol, qty, buy_ref, 1)
+        sell = self._price_leg(sell_symbol, qty, sell_ref, -1)
+        if buy is None or sell is None:
+            self.stats["too_wide"] += 1
+            return None
+        self.stats["priced"] += 1
+        from_book = buy[1] and sell[1]
+        self.stats["from_book" if from_book else "at_cap"] += 1
+        return {"buy_limit": buy[0], "sell_limit": sell[0], "buy_ref": buy_ref, "sell_ref": sell_ref,
+                "qty": qty, "source": "book" if from_book else "cap"}
+
+    def record_fill(self, quote, fill, buy_symbol, sell_symbol):
+        """Books one entry's outcome (fill: order_book.OrderState, or None if unconfirmed)."""
+        self.stats["orders"] += 1
+        qty = quote["qty"]
+        self.stats["qty_requested"] += qty
+        if fill is None:
+            self.stats["unconfirmed"] += 1
+            return
+        buy_leg, sell_leg = fill.legs.get(buy_symbol), fill.legs.get(sell_symbol)
+        filled = min(buy_leg.filled_qty if buy_leg else 0, sell_leg.filled_qty if sell_leg else 0)
+        self.stats["qty_filled"] += filled
+        if filled == 0:
+            self.stats["missed"] += 1
+            logger.info(f"📐 Entry IOC missed at {quote['buy_limit']:.2f} / {quote['sell_limit']:.2f} ({quote['source']})")
+            return
+        self.stats["filled" if filled >= qty else "partial"] += 1
+        debit = buy_leg.price - sell_leg.price
+        slippage = debit - (quote["buy_ref"] - quote["sell_ref"])            # + = paid more than the signal saw
+        improvement = (quote["buy_limit"] - quote["sell_limit"]) - debit     # + = filled inside our limits
+        self.stats["slippage"] += slippage * filled
+        self.stats["improvement"] += improvement * filled
+        logger.info(f"📐 Entry fill {filled}/{qty} at debit {debit:.2f} | vs signal {slippage:+.2f} | "
+                    f"inside limits {improvement:+.2f} ({quote['source']})")
+
+    def log_report(self, logger):
+        orders = self.stats["orders"]
+        if self.stats["priced"] or self.stats["too_wide"]:
+            fill_rate = self.stats["qty_filled"] / self.stats["qty_requested"] if self.stats["qty_requested"] else 0.0
+            logger.info(f"Entry pricing: {self.stats['priced']} priced ({self.stats['from_book']} from book, "
+                        f"{self.stats['at_cap']} at cap, {self.stats['depth_legs']} legs from depth), "
+                        f"{self.stats['too_wide']} refused as too wide | "
+                        f"{orders} orders: {self.stats['filled']} filled, {self.stats['partial']} partial, "
+                        f"{self.stats['missed']} missed, {self.stats['unconfirmed']} unconfirmed | "
+                        f"Fill rate {fill_rate:.0%} | Slippage ₹{self.stats['slippage']:,.2f}, "
+                        f"improvement ₹{self.stats['improvement']:,.2f}")
+
+    def _levels(self, symbol, side):
+        """Visible levels [(price, size), ...], best first, on the side a `side` order takes from."""
+        if self.depth is not None:
+            levels = self.depth.levels(symbol, side, MAX_DEPTH_AGE)
+            if levels:
+                self.stats["depth_legs"] += 1
+                return levels
+        tick = self.market_data.get(symbol)
+        if tick is None:
+            return []
+        price, size = (tick.ask, tick.ask_qty) if side == 1 else (tick.bid, tick.bid_qty)
+        if not price or price <= 0:
+            return []
+        return [(price, size or 0)]
+
+    def _price_leg(self, symbol, qty, ref, side):
+        """(limit, from_book) for one leg, or None if the book needs more than the ceiling."""
+        slip = self.max_slippage_pct / 100
+        # Ceiling rounded inward so it never exceeds max_slippage_pct
+        if side == 1:
+            cap = math.floor(ref * (1 + slip) / self.tick + 1e-9) * self.tick
+        else:
+            cap = math.ceil(ref * (1 - slip) / self.tick - 1e-9) * self.tick
+        covered, price = 0, None
+        for level_price, size in self._levels(symbol, side):
+            covered += size
+            if covered >= qty:
+                price = level_price
+                break
+        if price is None:
+            return round(cap, 2), False
+        if (side == 1 and price > cap + 1e-9) or (side == -1 and price < cap - 1e-9):
+            return None
+        # Marketable limit rounded outward onto the tick grid
+        if side == 1:
+            price = math.ceil(price / self.tick - 1e-9) * self.tick
+        else:
+            price = math.floor(price / self.tick + 1e-9) * self.tick
+        return round(price, 2), True
@@ -0,0 +1,158 @@
+# margin_service.py - Background-Refreshed Funds/Margin Cache
+# ===========================================================
+# Answers live pre-trade margin checks from memory instead of a synchronous
+# funds() REST call per entry. A background thread refreshes the broker's
+# available balance every MARGIN_REFRESH_INTERVAL seconds, and right away
+# after every fill, so the entry path never waits on the broker for funds.
+#
+# Orders in flight are charged locally: try_reserve() atomically checks
+# free margin (broker balance minus outstanding reservations) and holds the
+# estimated margin under the position key, so two workers can't both spend
+# the same rupees. A failed or dropped order releases its hold; a filled one
+# keeps it until a refresh that started after the fill has landed, by which
+# time the broker balance already reflects the position.
+#
+# A snapshot older than MARGIN_MAX_AGE blocks new entries rather than trading
+# on a balance we can no longer vouch for.
+#
+# inline=True refreshes synchronously on the calling thread when due
+# (deterministic replay on the simulated market_clock).
+
+import logging
+import threading
+import time
+
+import fyers_client
+import market_clock
+
+logger = logging.getLogger(__name__)
+
+MARGIN_REFRESH_INTERVAL = 15.0  # Seconds between background funds() polls
+MARGIN_MAX_AGE = 60.0           # Refuse entries if the last good snapshot is older than this
+
+
+class MarginService:
+    """Cached available margin with local reservations for orders in flight."""
+
+    def __init__(self, fyers_instance, refresh_interval=MARGIN_REFRESH_INTERVAL, max_age=MARGIN_MAX_AGE, inline=False):
+        self.fyers = fyers_instance
+        self.refresh_interval = refresh_interval
+        self.max_age = max_age
+        self.inline = inline
+        self.stats = {"checks": 0, "blocked": 0, "stale": 0, "refreshes": 0, "refresh_errors": 0, "max_refresh_ms": 0.0}
+        self._lock = threading.Lock()
+        self._available = None   # Broker 'Available Balance' from the last good refresh
+        self._refreshed_at = 0.0  # market_clock.monotonic() of that refresh
+        self._reservations = {}   # key -> [amount, fill_seq or None while the order is in flight]
+        self._fill_seq = 0
+        self._wake = threading.Event()
+        self._stopped = False
+        self._thread = None
+
+    def start(self):
+        """Takes the first snapshot synchronously, then starts the refresher thread."""
+        self.refresh()
+        if not self.inline:
+            self._thread = threading.Thread(target=self._run, name="margin-refresh", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped = True
+        self._wake.set()
+
+    def request_refresh(self):
+        """Asks for a refresh as soon as possible (immediately when inline)."""
+        if self.inline:
+            self.refresh()
+        else:
+            self._wake.set()
+
+    def refresh(self):
+        """One funds() round trip. Returns True if the snapshot was updated."""
+        with self._lock:
+            fill_seq = self._fill_seq  # Fills up to here are priced into the balance we're about to read
+        start_ns = time.monotonic_ns()
+        try:
+            available = fyers_client.parse_available_margin(self.fyers.funds())
+        except Exception as e:
+            logger.error(f"Error refreshing live funds: {e}")
+            available = None
+        elapsed_ms = (time.monotonic_ns() - start_ns) / 1e6
+        with self._lock:
+            if available is None:
+                self.stats["refresh_errors"] += 1
+                return False
+            self._available = available
+            self._refreshed_at = market_clock.monotonic()
+            self._reservations = {key: held for key, held in self._reservations.items()
+                                  if held[1] is None or held[1] > fill_seq}
+            self.stats["refreshes"] += 1
+            if elapsed_ms > self.stats["max_refresh_ms"]:
+                self.stats["max_refresh_ms"] = elapsed_ms
+        return True
+
+    def free(self):
+        """Available margin net of local reservations, or None before the first good refresh."""
+        with self._lock:
+            return self._free()
+
+    def try_reserve(self, key, amount):
+        """
+        Pre-trade check: holds `amount` under `key` if the cached free margin covers it.
+        Returns True if reserved; False if short of margin, the snapshot is stale or
+        `key` already holds a reservation.
+        """
+        if self.inline and market_clock.monotonic() - self._refreshed_at >= self.refresh_interval:
+            self.refresh()
+        with self._lock:
+            self.stats["checks"] += 1
+            if self._available is None or market_clock.monotonic() - self._refreshed_at > self.max_age:
+                self.stats["stale"] += 1
+                return False
+            if key in self._reservations or self._free() < amount:
+                self.stats["blocked"] += 1
+                return False
+            self._reservations[key] = [amount, None]
+            return True
+
+    def release(self, key):
+        """Drops the hold of an order that was refused, failed or never sent."""
+        with self._lock:
+            self._reservations.pop(key, None)
+
+    def on_fill(self, key=None):
+        """
+        An entry (key's reservation) or exit (key=None) filled: keep the entry's hold until
+        the broker balance reflects it, and refresh now.
+        """
+        with self._lock:
+            self._fill_seq += 1
+            held = self._reservations.get(key)
+            if held is not None:
+                held[1] = self._fill_seq
+        self.request_refresh()
+
+    def log_report(self, logger):
+        with self._lock:
+            free = self._free()
+            age = market_clock.monotonic() - self._refreshed_at
+            held = len(self._reservations)
+        if free is None:
+            logger.info(f"Margin: no funds snapshot yet ({self.stats['refresh_errors']} failed refreshes)")
+            return
+        logger.info(f"Margin: ₹{free:,.0f} free ({held} held) | Snapshot age {age:.1f}s | "
+                    f"Checks {self.stats['checks']} ({self.stats['blocked']} short, {self.stats['stale']} stale) | "
+                    f"Refreshes {self.stats['refreshes']} ({self.stats['refresh_errors']} failed, max {self.stats['max_refresh_ms']:.0f} ms)")
+
+    def _free(self):
+        if self._available is None:
+            return None
+        return self._available - sum(held[0] for held in self._reservations.values())
+
+    def _run(self):
+        while not self._stopped:
+            self._wake.wait(self.refresh_interval)
+            self._wake.clear()
+            if not self._stopped:
+                self.refresh()
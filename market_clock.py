@@ -0,0 +1,73 @@
+# market_clock.py - Swappable Wall Clock (Live vs. Simulated Time)
+# ===============================================================
+# Strategy and loop code asks this module for "now" instead of calling
+# datetime.now()/time.time() directly. Live, it is a thin pass-through; the
+# replay harness installs a SimulatedClock so the real trading loop runs on
+# recorded/synthetic session time, deterministically and at any speed.
+#
+# Latency measurement is NOT routed through here: time.monotonic_ns() always
+# measures real elapsed processing time.
+
+import datetime
+import time as _time
+
+_sim = None  # Active SimulatedClock, or None for live wall-clock time
+_day = (0.0, 0.0, None)  # (start_ts, end_ts, date) of the local day today() last resolved
+
+
+class SimulatedClock:
+    """Epoch-seconds clock that only moves when the replay driver sets/advances it."""
+
+    def __init__(self, start_ts):
+        self.ts = float(start_ts)
+
+    def set(self, ts):
+        if ts > self.ts:  # Never run backwards (out-of-order recv timestamps)
+            self.ts = float(ts)
+
+    def advance(self, seconds):
+        self.ts += seconds
+
+
+def use(clock):
+    """Install a SimulatedClock (or None to return to live time)."""
+    global _sim
+    _sim = clock
+
+
+def is_simulated():
+    return _sim is not None
+
+
+def time():
+    """Epoch seconds (time.time() equivalent)."""
+    return _sim.ts if _sim is not None else _time.time()
+
+
+def monotonic():
+    """Seconds for interval/staleness checks (time.monotonic() equivalent)."""
+    return _sim.ts if _sim is not None else _time.monotonic()
+
+
+def now():
+    """Local naive datetime (datetime.datetime.now() equivalent)."""
+    if _sim is not None:
+        return datetime.datetime.fromtimestamp(_sim.ts)
+    return datetime.datetime.now()
+
+
+def today():
+    """
+    Local date (datetime.date.today() equivalent). Cached for the rest of the day,
+    so hot-path callers pay a float comparison, not a datetime construction.
+    """
+    global _day
+    ts = time()
+    start, end, date = _day
+    if start <= ts < end:
+        return date
+    date = datetime.date.fromtimestamp(ts)
+    start = datetime.datetime.combine(date, datetime.time.min).timestamp()
+    end = datetime.datetime.combine(date + datetime.timedelta(days=1), datetime.time.min).timestamp()
+    _day = (start, end, date)
+    return date
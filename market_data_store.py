@@ -0,0 +1,151 @@
+# market_data_store.py - Latest-Value (Conflating) Market Data Store
+# ==================================================================
+# Replaces an unbounded tick queue between the WebSocket callback thread and
+# the strategy thread. Only the LATEST tick per symbol is kept, so during fast
+# markets the consumer never works through stale intermediate prices and
+# memory is bounded by the number of subscribed symbols. Values are
+# tick_types.Tick objects (converted once at ingestion).
+#
+# DepthStore keeps the latest 5-level book per symbol from the socket's
+# DepthUpdate ("dp") messages, for pricing orders larger than the best level.
+
+import threading
+import time
+import market_clock
+
+
+class ConflatingMarketDataStore:
+    """
+    Thread-safe latest-tick store keyed by symbol.
+
+    - Producer (WebSocket thread) calls `update()` / `update_many()`.
+    - The primary consumer (strategy loop) calls `wait_for_updates()`, which blocks
+      until something changes and returns only the symbols that are dirty.
+    - Secondary readers (e.g. dashboards) call `changed_since(seq)` to pull only what
+      changed since their last read, without disturbing the primary consumer's dirty set.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._latest = {}   # symbol -> (seq, recv_ns, tick, market_clock.monotonic() at receive)
+        self._dirty = {}    # symbol -> recv_ns of the first unread update (insertion-ordered)
+        self._seq = 0
+        self.stats = {"updates": 0, "conflated": 0, "reads": 0, "delivered": 0}
+
+    def update(self, tick, recv_ns=None):
+        """Store one Tick (None is ignored)."""
+        if tick is None:
+            return
+        if recv_ns is None:
+            recv_ns = time.monotonic_ns()
+        with self._cond:
+            self._put(tick, recv_ns)
+            self._cond.notify()
+
+    def update_many(self, ticks, recv_ns=None):
+        """Store a batch of Ticks from one WebSocket message under a single lock."""
+        if not ticks:
+            return
+        if recv_ns is None:
+            recv_ns = time.monotonic_ns()
+        with self._cond:
+            for tick in ticks:
+                self._put(tick, recv_ns)
+            if self._dirty:
+                self._cond.notify()
+
+    def _put(self, tick, recv_ns):
+        symbol = tick.symbol
+        self._seq += 1
+        self._latest[symbol] = (self._seq, recv_ns, tick, market_clock.monotonic())
+        self.stats["updates"] += 1
+        if symbol in self._dirty:
+            self.stats["conflated"] += 1  # Previous value was overwritten before anyone read it
+        else:
+            self._dirty[symbol] = recv_ns
+
+    def wait_for_updates(self, timeout=None, with_recv_ns=False):
+        """
+        Block up to `timeout` seconds until at least one symbol is dirty, then return
+        (oldest_recv_ns, [latest tick per changed symbol]) and clear the dirty flags.
+        With `with_recv_ns`, each entry is (recv_ns of that latest tick, tick) instead.
+        Returns (None, []) on timeout.
+        """
+        with self._cond:
+            if not self._dirty:
+                self._cond.wait(timeout)
+            if not self._dirty:
+                return None, []
+            dirty = self._dirty
+            self._dirty = {}
+            if with_recv_ns:
+                ticks = [self._latest[symbol][1:3] for symbol in dirty]
+            else:
+                ticks = [self._latest[symbol][2] for symbol in dirty]
+            self.stats["reads"] += 1
+            self.stats["delivered"] += len(ticks)
+            return min(dirty.values()), ticks
+
+    def changed_since(self, last_seq=0):
+        """Returns ({symbol: tick} changed after `last_seq`, current_seq) for secondary readers."""
+        with self._cond:
+            changed = {sym: entry[2] for sym, entry in self._latest.items() if entry[0] > last_seq}
+            return changed, self._seq
+
+    def get(self, symbol):
+        """Latest Tick for a symbol, or None."""
+        entry = self._latest.get(symbol)
+        return entry[2] if entry else None
+
+    def get_ltp(self, symbol, default=0):
+        """Latest traded price for a symbol."""
+        entry = self._latest.get(symbol)
+        return entry[2].ltp if entry else default
+
+    def age(self, symbol):
+        """Seconds since the latest tick for `symbol` was received (None if never seen), on the market clock."""
+        entry = self._latest.get(symbol)
+        return market_clock.monotonic() - entry[3] if entry else None
+
+    def __len__(self):
+        return len(self._latest)
+
+
+DEPTH_LEVELS = 5  # Fyers DepthUpdate carries the top 5 bid/ask levels
+_BID_KEYS = tuple((f"bid_price{i}", f"bid_size{i}") for i in range(1, DEPTH_LEVELS + 1))
+_ASK_KEYS = tuple((f"ask_price{i}", f"ask_size{i}") for i in range(1, DEPTH_LEVELS + 1))
+
+
+class DepthStore:
+    """
+    Latest market depth per symbol: up to DEPTH_LEVELS (price, size) levels a side,
+    best first. Written by the WebSocket thread, read by order pricing; each update
+    swaps in a new tuple, so readers need no lock.
+    """
+
+    def __init__(self):
+        self._latest = {}  # symbol -> (bids, asks, market_clock.monotonic() at receive)
+        self.stats = {"updates": 0}
+
+    def update_message(self, message):
+        """Stores every depth payload in one SDK socket message (a dict or a list); anything else is skipped."""
+        for payload in message if isinstance(message, list) else (message,):
+            if isinstance(payload, dict) and payload.get("type") == "dp" and "symbol" in payload:
+                get = payload.get
+                bids = tuple((get(price), get(size) or 0) for price, size in _BID_KEYS if get(price))
+                asks = tuple((get(price), get(size) or 0) for price, size in _ASK_KEYS if get(price))
+                self._latest[payload["symbol"]] = (bids, asks, market_clock.monotonic())
+                self.stats["updates"] += 1
+
+    def levels(self, symbol, side, max_age=None):
+        """
+        [(price, size), ...] best first on the side a `side` order takes from (1 = buy ->
+        asks, -1 = sell -> bids). Empty if there is no depth or it is older than max_age seconds.
+        """
+        entry = self._latest.get(symbol)
+        if entry is None or (max_age is not None and market_clock.monotonic() - entry[2] > max_age):
+            return []
+        return list(entry[1] if side == 1 else entry[0])
+
+    def __len__(self):
+        return len(self._latest)
@@ -0,0 +1,86 @@
+# option_ladder.py - Streaming ATM±N Option Ladder
+# ================================================
+# Once the opening range forms, the scalper keeps the nearest-expiry CE/PE
+# strikes around spot subscribed on the WebSocket. When a breakout fires, both
+# spread legs (and the net debit) are priced from in-memory ticks, so the
+# entry path needs zero REST calls. The ladder re-centres as spot drifts.
+
+import logging
+import fyers_client
+
+logger = logging.getLogger(__name__)
+
+LADDER_STRIKES = 5            # Strikes each side of ATM (per option type)
+RECENTER_THRESHOLD = 2        # Re-centre once ATM moves this many strikes from the ladder centre
+MAX_QUOTE_AGE = 10.0          # Seconds; older option ticks are not trusted for pricing
+
+
+class OptionLadder:
+    """
+    Nearest-expiry CE/PE strikes around spot for one index, priced from a
+    ConflatingMarketDataStore that the WebSocket feed keeps up to date.
+    """
+
+    def __init__(self, index_name, market_data, strikes_each_side=LADDER_STRIKES):
+        self.index_name = index_name
+        self.market_data = market_data
+        self.strikes_each_side = strikes_each_side
+        self.strike_step = fyers_client.INDEX_OPTION_PARAMS.get(index_name, (None, None, 100))[2]
+        self.center_strike = None
+        self.symbols = {}  # (strike, "CE"/"PE") -> fyers symbol
+
+    def recenter(self, spot_price):
+        """
+        Rebuild the ladder around `spot_price` if it has drifted far enough (or was never built).
+        Returns (symbols_to_subscribe, symbols_to_unsubscribe); both empty if nothing changed.
+        """
+        atm = fyers_client.get_atm_strike(self.index_name, spot_price)
+        if self.center_strike is not None and abs(atm - self.center_strike) < RECENTER_THRESHOLD * self.strike_step:
+            return [], []
+
+        base_symbol = fyers_client.INDEX_OPTION_PARAMS.get(self.index_name, (None, self.index_name, None))[1]
+        strikes = fyers_client.strikes_around(base_symbol, spot_price, self.strikes_each_side)
+        if len(strikes) == 0:
+            strikes = [atm + i * self.strike_step for i in range(-self.strikes_each_side, self.strikes_each_side + 1)]
+        new_symbols = fyers_client.get_option_symbols(self.index_name, strikes)
+        if not new_symbols:
+            logger.warning(f"[LADDER] {self.index_name}: No option symbols found around {atm}")
+            return [], []
+
+        old_set = set(self.symbols.values())
+        new_set = set(new_symbols.values())
+        self.symbols = new_symbols
+        self.center_strike = atm
+        logger.info(f"[LADDER] {self.index_name}: Centred at {atm} ({len(new_set)} symbols)")
+        return sorted(new_set - old_set), sorted(old_set - new_set)
+
+    def get_leg(self, option_type, offset, spot_price):
+        """
+        Price the option `offset` strikes OTM from ATM (0 = ATM) from streamed ticks.
+        Returns the same shape as fyers_client.find_option_by_offset, or None if the
+        strike isn't on the ladder or its tick is missing/stale.
+        """
+        atm = fyers_client.get_atm_strike(self.index_name, spot_price)
+        strike = atm + offset * self.strike_step if option_type == "CE" else atm - offset * self.strike_step
+        symbol = self.symbols.get((float(strike), option_type))
+        if symbol is None:
+            return None
+        tick = self.market_data.get(symbol)
+        age = self.market_data.age(symbol)
+        if tick is None or age is None or age > MAX_QUOTE_AGE or tick.ltp <= 0:
+            return None
+        return {
+            "symbol": symbol,
+            "ltp": tick.ltp,
+            "bid": tick.bid,
+            "ask": tick.ask,
+            "spot_price": spot_price,
+        }
+
+    def get_spread_legs(self, option_type, spot_price, sell_offset=1):
+        """Returns (buy_leg, sell_leg) for an ATM / `sell_offset`-OTM debit spread, or None."""
+        buy_leg = self.get_leg(option_type, 0, spot_price)
+        sell_leg = self.get_leg(option_type, sell_offset, spot_price)
+        if buy_leg is None or sell_leg is None:
+            return None
+        return buy_leg, sell_leg
@@ -3,18 +3,40 @@
 # Uses Opening Range Breakout to detect momentum, then enters debit spreads
 # (buy ATM + sell 1-strike OTM) for defined-risk, small-capital trades.
 # Only trades 9:30 AM - 11:15 AM when momentum is strongest.
+#
+# Threads: the WebSocket thread feeds the conflating store; the dispatcher
+# (analysis_and_trading_loop) drains it, runs the slow loop / EOD and routes
+# ticks to one IndexWorker per underlying, which runs that index's exits,
+# option ladder and a cache-only ORB breakout check. Breakout candidates go
+# to the EntryPipeline thread pool (leg quotes, margin, order placement), so
+# exit checks keep running on every tick of every index meanwhile.
 
 import fyers_client
 import logger_setup
 import logging
 import orb_scalper_strategy
 from paper_trader import PaperAccount
+from market_data_store import ConflatingMarketDataStore, DepthStore
+from option_ladder import OptionLadder
+from bar_builder import BarBuilder
+from latency_stats import LatencyRecorder, LatencyTrace
+from feed_manager import ResilientFeed
+from sharded_feed import ShardedFeed
+from tick_types import SYMBOLS, ticks_from_message
+from index_worker import IndexWorker
+from order_gateway import OrderGateway
+from margin_service import MarginService
+from order_book import OrderBook
+from limit_pricer import LimitPricer
+from entry_pipeline import EntryPipeline
+from scheduler import Scheduler
 import risk_manager
 import config
+import market_clock
 import time
 import datetime
 import threading
-import queue
+from collections import deque
 
 logger = logger_setup.setup_logger()
 
@@ -23,299 +45,725 @@ SYMBOLS_TO_TRADE = {
     "NIFTY": "NSE:NIFTY50-INDEX",
     "BANKNIFTY": "NSE:NIFTYBANK-INDEX"
 }
+INDEX_NAMES = {v: k for k, v in SYMBOLS_TO_TRADE.items()}  # "NSE:NIFTY50-INDEX" -> "NIFTY"
 MAX_OPEN_POSITIONS = 4  # 1 per index max (spread = 1 position)
 RISK_PERCENTAGE = 1.0
 ANALYSIS_INTERVAL = 30  # Check every 30 seconds (faster for breakout detection)
 LIVE_TRADING = False    # Set to True to send real orders to the broker
+TICK_WAIT_TIMEOUT = 0.5 # Max seconds to block waiting for ticks (slow loop still runs when the feed is quiet)
+ENTRY_MAX_DEBIT_DRIFT_PCT = 5.0  # Drop a resolved entry if the spread got this much dearer before submission
+EOD_SQUARE_OFF_TIME = datetime.time(15, 0)
+_EXIT_REASONS = {"SL": "STOP-LOSS", "TARGET": "TAKE-PROFIT"}  # Exit label -> paper close reason
+FEED_SHARDS = 1         # >1 spreads subscriptions over several socket connections (one process each)
 
 # --- Global State ---
 paper_account = None
 fyers_model = None
-tick_queue = queue.Queue()
+order_gateway = None  # OrderGateway shared by the index workers (live orders)
+margin_service = None  # MarginService: cached funds for live pre-trade checks
+order_book = None  # OrderBook fed by the order-update socket (live fill confirmation)
+order_socket = None
+entry_pipeline = None  # EntryPipeline: breakout candidates -> resolved, rechecked, submitted orders
+market_data = ConflatingMarketDataStore()  # Latest tick per symbol (conflated), fed by the WebSocket thread
+depth_book = DepthStore()  # Latest 5-level depth of the option ladder (live trading only)
+limit_pricer = LimitPricer(market_data, depth_book)  # IOC entry limits from the streamed book
+bar_builder = BarBuilder()  # Live OHLCV bars, fed with every raw tick before conflation (ORB source)
+latency = LatencyRecorder()  # Session histograms: WebSocket receive -> dequeue -> decision -> order send -> broker ack
 
-# Track latest index LTPs from ticks
-_latest_ltp = {}  # {"NIFTY": 25500.0, "BANKNIFTY": 61000.0}
+# Tick intake stats since the last slow-loop report (wake-up latency = WebSocket receive -> consumer wake-up)
+_intake_stats = {"batches": 0, "unique": 0, "wake_ns_total": 0, "wake_ns_max": 0}
+
+# Track latest LTPs from ticks, keyed by interned symbol id (tick_types.SYMBOLS)
+_latest_ltp = {}  # {0: 25500.0, 1: 61000.0, ...}
+currently_subscribed = set()
+depth_subscribed = set()  # Symbols also streaming DepthUpdate (the option ladders, when live)
+_option_ladders = {}  # index name -> OptionLadder (built once the ORB has formed)
+scheduler = None  # Scheduler: slow loop, trading window and EOD square-off (see _schedule_session)
+_entries_open = False  # Inside TRADING_START - TRADING_END (flipped by the scheduler)
+_session_over = False  # Set by the EOD square-off
+_feed_gaps = deque()  # Outage reports from the feed recovery thread, handled on the dispatcher thread
+_workers = {}  # index name -> IndexWorker (own thread, inbound queue, ORB state and positions)
+_pending_entries = {}  # buy symbol -> resolved order acked live but not yet confirmed (see _settle_pending_entries)
+_subscription_lock = threading.Lock()  # currently_subscribed is updated from every worker
 
 
 def on_index_tick(tick_data):
-    """Fast callback: just push ticks into the queue for processing."""
-    if isinstance(tick_data, list):
-        for tick in tick_data:
-            tick_queue.put(tick)
+    """
+    Fast callback: convert the SDK payload to Ticks once, build bars from every raw
+    tick, then overwrite the latest tick per symbol. Payloads that aren't ticks
+    (depth updates) are offered to the depth book.
+    """
+    ticks = ticks_from_message(tick_data)
+    for tick in ticks:
+        bar_builder.on_tick(tick)
+    market_data.update_many(ticks)
+    if len(ticks) != (len(tick_data) if isinstance(tick_data, list) else 1):
+        depth_book.update_message(tick_data)
+
+
+def _drain_tick_batch(timeout=TICK_WAIT_TIMEOUT):
+    """
+    Blocks up to `timeout` until any symbol has a new tick, then returns
+    (dequeue_ns, [(recv_ns, tick)]) with the latest tick for every symbol that changed
+    since the last call (intermediate ticks are conflated away by the store).
+    Returns (None, []) on timeout.
+    """
+    oldest_recv_ns, batch = market_data.wait_for_updates(timeout, with_recv_ns=True)
+    if not batch:
+        return None, []
+    dequeue_ns = time.monotonic_ns()
+    wake_ns = dequeue_ns - oldest_recv_ns
+    for recv_ns, _ in batch:
+        latency.record("feed.ws_receive->dequeue", dequeue_ns - recv_ns)
+
+    _intake_stats["batches"] += 1
+    _intake_stats["unique"] += len(batch)
+    _intake_stats["wake_ns_total"] += wake_ns
+    _intake_stats["wake_ns_max"] = max(_intake_stats["wake_ns_max"], wake_ns)
+    return dequeue_ns, batch
+
+
+def _report_intake_stats():
+    """Log and reset the tick intake counters (called from the slow loop)."""
+    batches = _intake_stats["batches"]
+    if batches == 0:
+        logger.info("Tick intake: no ticks since last report")
+        return
+    avg_wake_ms = _intake_stats["wake_ns_total"] / batches / 1e6
+    feed = market_data.stats
+    logger.info(f"Tick intake: {_intake_stats['unique']} symbol updates in {batches} batches | "
+                f"Feed total: {feed['updates']} ticks, {feed['conflated']} conflated | "
+                f"Wake-up latency avg {avg_wake_ms:.3f} ms, max {_intake_stats['wake_ns_max'] / 1e6:.3f} ms")
+    for key in _intake_stats:
+        _intake_stats[key] = 0
+
+
+def _socket_subscribe(symbols, data_type="SymbolUpdate"):
+    """
+    Subscribe off the trading thread (the SDK sleeps 0.5 s per subscribe call).
+    Returns the symbols that weren't streaming `data_type` yet.
+    """
+    subscribed = depth_subscribed if data_type == "DepthUpdate" else currently_subscribed
+    with _subscription_lock:
+        symbols = [s for s in symbols if s not in subscribed]
+        subscribed.update(symbols)
+    if symbols:
+        SYMBOLS.register(symbols)  # Parse/classify once, before the first tick arrives
+        threading.Thread(target=fyers_socket.subscribe, kwargs={"symbols": symbols, "data_type": data_type},
+                         daemon=True).start()
+    return symbols
+
+
+def _socket_unsubscribe(symbols, data_type="SymbolUpdate"):
+    """Unsubscribe off the trading thread (symbols not currently streaming `data_type` are skipped)."""
+    subscribed = depth_subscribed if data_type == "DepthUpdate" else currently_subscribed
+    with _subscription_lock:
+        symbols = [s for s in symbols if s in subscribed]
+        subscribed.difference_update(symbols)
+    if symbols:
+        threading.Thread(target=fyers_socket.unsubscribe, kwargs={"symbols": symbols, "data_type": data_type},
+                         daemon=True).start()
+
+
+def _sync_subscriptions():
+    """Subscribe to any position leg/index symbol the account tracks but the socket doesn't stream yet."""
+    new_subs = _socket_subscribe(paper_account.tracked_symbols())
+    if new_subs:
+        logger.info(f"Dynamically subscribing to new options: {new_subs}")
+
+
+def _handle_feed_gaps():
+    """
+    Flags positions whose exit checks were blind during a feed outage, and warns if
+    the index traded through a stop-loss while we couldn't see it. The backfilled
+    quotes are already in the tick stream, so the normal exit checks run right after.
+    """
+    while _feed_gaps:
+        gap = _feed_gaps.popleft()
+        flagged = paper_account.flag_blind_positions(gap['symbols'], gap['blind_seconds'])
+        for key in flagged:
+            pos = paper_account.positions.get(key)
+            if pos is None:
+                continue  # Closed by its worker in the meantime
+            logger.warning(f"   ⚠️ {key}: exit checks were blind for {gap['blind_seconds']:.1f}s (feed outage)")
+            extremes = gap['extremes'].get(pos.get('index_symbol'))
+            if not (pos.get('is_spread') and extremes):
+                continue
+            low, high = extremes
+            breached = low <= pos['index_stop_loss_price'] if "(LONG)" in pos['direction'] \
+                else high >= pos['index_stop_loss_price']
+            if breached:
+                pos['sl_breached_while_blind'] = True
+                logger.critical(f"   🚨 {key}: index traded through stop-loss {pos['index_stop_loss_price']} "
+                                f"during the outage (range {low} - {high})")
+
+
+def _update_option_ladder(index_name, index_ltp):
+    """
+    Once the ORB has formed, keep ATM±N nearest-expiry options streaming for this index
+    and re-centre the ladder as spot drifts. Symbols still needed by open positions
+    are never unsubscribed. When live, the ladder also streams 5-level depth so entry
+    limits can be priced past the best level (limit_pricer).
+    """
+    if orb_scalper_strategy.get_formed_orb(index_name) is None:
+        return
+    ladder = _option_ladders.get(index_name)
+    if ladder is None:
+        ladder = _option_ladders[index_name] = OptionLadder(index_name, market_data)
+    to_subscribe, to_unsubscribe = ladder.recenter(index_ltp)
+    if to_subscribe:
+        _socket_subscribe(to_subscribe)
+        if LIVE_TRADING:
+            _socket_subscribe(to_subscribe, "DepthUpdate")
+    if to_unsubscribe and LIVE_TRADING:
+        _socket_unsubscribe(to_unsubscribe, "DepthUpdate")  # Exits are at market: held legs don't need depth
+    held = paper_account.tracked_symbols()
+    to_unsubscribe = [s for s in to_unsubscribe if s not in held]
+    if to_unsubscribe:
+        _socket_unsubscribe(to_unsubscribe)
+
+
+def _exit_spread_live(buy_sym, sell_sym, qty, label, trace=None):
+    """
+    Sends the exit legs through the order gateway and logs per-leg and total broker
+    latency. Returns (closed, exit_value):
+      - (True, value) once both legs are confirmed filled in full (value = long-leg
+        fill minus short-leg fill),
+      - (True, None) without an order book (the ack is all we know),
+      - (False, None) if a leg is short, rejected or unconfirmed, or an order for this
+        spread is already in flight. The position must then stay open: the gateway
+        keeps the exit and _finish_pending_exit() works off the remainder.
+    """
+    result = order_gateway.close_spread(buy_sym, sell_sym, qty, trace, label)
+    if result is None:
+        return False, None
+    if result['legs']:
+        if result['status'] == 'success':
+            margin_service.on_fill()  # Margin freed: pick up the new balance now rather than at the next poll
+        leg_text = " | ".join(
+            f"{leg['symbol']}: {leg['latency_ms']:.2f} ms" if leg['latency_ms'] is not None else f"{leg['symbol']}: failed"
+            for leg in result['legs']
+        )
+        logger.warning(f"  ⏱️ FYERS API {label} EXECUTION LATENCY: {result['total_latency_ms']:.2f} ms (parallel legs — {leg_text})")
+    if "closed" not in result:
+        return True, None
+    if not result["closed"]:
+        if result["sent"]:  # Throttled retries and confirmation waits stay quiet until the next send
+            open_text = ", ".join(f"{symbol} {remaining} open" for symbol, remaining in result["remaining"].items())
+            logger.error(f"❌ {label} exit incomplete ({open_text}). Position kept open; the remainder will be retried.")
+        return False, None
+    logger.info(f"  ✅ {label} exit filled: spread {result['exit_value']:.2f}")
+    return True, result["exit_value"]
+
+
+def _finish_pending_exit(spread):
+    """Keeps working a live exit the broker hasn't completed; closes on paper once it has."""
+    label = order_gateway.exit_label(spread.key)
+    closed, exit_value = _exit_spread_live(spread.key, spread.sell_symbol, spread.qty, label)
+    if closed:
+        paper_account._close_position(spread.key, _EXIT_REASONS.get(label, label), exit_value)
+
+
+def _start_workers(inline=False):
+    """
+    (Re)creates one IndexWorker per traded index and the entry pipeline.
+    inline=True runs both on the dispatcher thread (replay).
+    """
+    global entry_pipeline
+    _stop_workers()
+    entry_pipeline = EntryPipeline(_resolve_entry, _recheck_entry, _submit_entry, inline=inline)
+    for index_name, index_symbol in SYMBOLS_TO_TRADE.items():
+        _workers[index_name] = IndexWorker(index_name, index_symbol, process_index_batch,
+                                           latency=latency, inline=inline).start()
+
+
+def _stop_workers(drain=False):
+    """drain=True also waits for entries already in the pipeline to finish (EOD)."""
+    for worker in _workers.values():
+        worker.stop()
+    _workers.clear()
+    if entry_pipeline is not None:
+        entry_pipeline.shutdown(wait=drain)
+
+
+def _route_batch(dequeue_ns, batch):
+    """
+    Splits a drained batch by underlying (one SymbolInfo lookup per tick) and hands each
+    part to that index's worker: the index tick itself, plus option-leg ticks of open
+    spreads. Other ticks (ladder quotes) only update the LTP map.
+    """
+    symbol_info = SYMBOLS.info
+    routed = {}
+    for item in batch:
+        tick = item[1]
+        index_name = symbol_info[tick.sym_id].underlying
+        if index_name not in _workers:
+            continue
+        if symbol_info[tick.sym_id].is_index or paper_account.spreads_for_symbol(tick.symbol):
+            routed.setdefault(index_name, []).append(item)
+    for index_name, items in routed.items():
+        _workers[index_name].submit(dequeue_ns, items)
+
+
+def _slow_loop():
+    """Scheduled every ANALYSIS_INTERVAL: hot-reload, subscriptions, bar roll and session reports."""
+    # Hot-reload: pick up positions added/removed via web dashboard
+    paper_account.sync_positions()
+    _sync_subscriptions()
+    bar_builder.roll()
+
+    logger.info("=" * 50)
+    logger.info(f"[{market_clock.now().strftime('%H:%M:%S')}] Active Subscriptions: {len(currently_subscribed)} | Positions: {len(paper_account.positions)}/{MAX_OPEN_POSITIONS}")
+    stats = paper_account.get_stats()
+    logger.info(f"P&L: ₹{stats['realized_pnl']:,.2f} | Trades: {stats['total_trades']} (W {stats['wins']} / L {stats['losses']}) | "
+                f"PF: {stats['profit_factor']:.2f} | Margin: ₹{stats['used_margin']:,.0f} | Equity High: ₹{stats['equity_high']:,.2f}")
+    _report_intake_stats()
+    latency.log_report(logger)
+    http = fyers_client.get_http_metrics()
+    logger.info(f"REST: {http['requests']} calls ({http['errors']} errors, {http['timeouts']} timeouts) | "
+                f"Handshakes: {http['handshakes']} | Connection reuse: {http['reuse_rate']:.1%}")
+    if isinstance(fyers_socket, (ResilientFeed, ShardedFeed)):
+        fyers_socket.log_report(logger)
+    for worker in _workers.values():
+        worker.log_report(logger)
+    if entry_pipeline is not None:
+        entry_pipeline.log_report(logger)
+    if order_gateway is not None:
+        order_gateway.log_report(logger)
+    if margin_service is not None:
+        margin_service.log_report(logger)
+    if order_book is not None:
+        order_book.log_report(logger)
+    if LIVE_TRADING:
+        limit_pricer.log_report(logger)
+
+
+def _set_entries_open(is_open):
+    global _entries_open
+    _entries_open = is_open
+    logger.info(f"--- Trading window {'open' if is_open else 'closed'} for new entries ---")
+
+
+def _eod_square_off():
+    """Scheduled at EOD_SQUARE_OFF_TIME: stop the workers, close everything at market and end the session."""
+    global _session_over, _entries_open
+    logger.warning(f"It is {market_clock.now().strftime('%H:%M')}. Initiating EOD Auto-Square-Off.")
+    _entries_open = False  # Candidates still in the pipeline bail out before placing anything
+    _stop_workers(drain=True)  # No entries/exits racing the square-off; in-flight orders settle first
+    if _pending_entries:
+        _settle_pending_entries()
+        for key, order in _pending_entries.items():
+            logger.critical(f"   🚨 Entry {order['order_id']} ({key}) still unconfirmed at EOD: check the broker position manually")
+    symbols_to_quote = set(paper_account.positions.keys())
+    for pos in paper_account.positions.values():
+        if pos.get('is_spread') and pos.get('sell_symbol'):
+            symbols_to_quote.add(pos['sell_symbol'])
+    
+    if symbols_to_quote:
+        try:
+            quotes = fyers_model.quotes(data={"symbols": ",".join(symbols_to_quote)})
+            if quotes.get('s') == 'ok':
+                current_prices = {}
+                for q in quotes['d']:
+                    current_prices[q['n']] = q['v'].get('lp', 0)
+                paper_account.close_all_positions(reason="EOD_SQUARE_OFF", current_prices=current_prices)
+        except Exception as e:
+            logger.error(f"Error during EOD Square-Off: {e}")
+    
+    logger.info("--- EOD Square-Off Complete. Exiting. ---")
+    paper_account.get_summary()
+    latency.log_report(logger)
+    _session_over = True
+
+
+def _schedule_session():
+    """(Re)builds the session timetable: slow loop, trading window and EOD square-off."""
+    global scheduler, _entries_open, _session_over
+    _entries_open = False
+    _session_over = False
+    scheduler = Scheduler()
+    scheduler.every(ANALYSIS_INTERVAL, _slow_loop, "slow-loop")
+    scheduler.at(orb_scalper_strategy.TRADING_START, lambda: _set_entries_open(True), "trading-start")
+    scheduler.at(orb_scalper_strategy.TRADING_END, lambda: _set_entries_open(False), "trading-end")
+    scheduler.at(EOD_SQUARE_OFF_TIME, _eod_square_off, "eod-square-off")
+
+
+def _next_wait():
+    """How long the dispatcher may block for ticks without delaying a scheduled task."""
+    due_in = scheduler.time_until_next()
+    return TICK_WAIT_TIMEOUT if due_in is None else min(TICK_WAIT_TIMEOUT, due_in)
+
+
+def process_tick_batch(dequeue_ns, batch):
+    """
+    One dispatcher pass over a drained batch (possibly empty): due scheduled tasks
+    (slow loop, trading window, EOD square-off), LTP map update, then routing to
+    the per-index workers. No datetime work happens here.
+    Returns False once the EOD square-off has run and the session is over.
+    Shared by the live loop and the offline replay harness (replay_scalper.py).
+    """
+    if _feed_gaps:
+        _handle_feed_gaps()
+
+    scheduler.run_pending()
+    if _session_over:
+        return False
+
+    # Apply the whole batch to the LTP map first, so spread checks below
+    # see both legs at their latest price regardless of tick order
+    latest_ltp = _latest_ltp
+    for _, tick in batch:
+        latest_ltp[tick.sym_id] = tick.ltp
+
+    if batch:
+        _route_batch(dequeue_ns, batch)
+    return True
+
+
+def process_index_batch(worker, dequeue_ns, batch):
+    """
+    Runs on one IndexWorker: exits for this index's spreads, its option ladder and
+    ORB entry scanning. `batch` only holds this index's tick and its spreads' legs.
+    """
+    latest_ltp = _latest_ltp
+    if _pending_entries:
+        _settle_pending_entries(worker.index_name)
+
+    for recv_ns, tick in batch:
+        # --- TICK PROCESSING ---
+        sym = tick.symbol
+        tick_index_name = None
+        index_symbol = None
+        index_ltp = 0
+
+        # Identify if this tick is from this worker's index
+        if sym == worker.index_symbol:
+            tick_index_name = worker.index_name
+            index_symbol = sym
+            index_ltp = tick.ltp
+
+        # --- FAST LOOP: Position Management (Exits) ---
+        # Evaluate exits on every tick, but only for spreads this symbol can affect
+        # (index tick -> SL check, leg tick -> TP check) via the account's reverse index.
+        for spread in paper_account.spreads_for_symbol(sym):
+            if spread.index_symbol != worker.index_symbol:
+                continue  # Another worker's position
+            buy_sym = spread.key
+
+            # 0. A live exit already under way is finished first, whatever the price does now
+            if LIVE_TRADING and order_gateway.exit_pending(buy_sym):
+                _finish_pending_exit(spread)
+                continue
+
+            # 1. Check Index-Based Stop Loss (if index tick)
+            if tick.sym_id == spread.index_id:
+                index_live = latest_ltp.get(spread.index_id, 0)
+                if index_live > 0:
+                    # Call spread ("(LONG)") stops below the level, put spread ("(SHORT)") above it
+                    if spread.is_call:
+                        sl_hit = index_live <= spread.index_stop_loss
+                    else:
+                        sl_hit = index_live >= spread.index_stop_loss
+
+                    if sl_hit:
+                        trace = LatencyTrace("exit", recv_ns, dequeue_ns).mark("decision")
+                        logger.warning(f"   [{INDEX_NAMES.get(spread.index_symbol)}] 🔴 ORB STOP-LOSS HIT at {index_live}")
+                        filled_value = None
+                        if LIVE_TRADING:
+                            logger.warning(f"🚨 LIVE TRADING: Executing Stop-Loss market orders for {spread.qty} qty")
+                            closed, filled_value = _exit_spread_live(buy_sym, spread.sell_symbol, spread.qty, "SL", trace)
+                            if not closed:
+                                latency.record_trace(trace)
+                                continue  # Broker position still open: keep it on the book
+                        latency.record_trace(trace)
+
+                        # Close on paper account (at the confirmed fills when live)
+                        buy_val = latest_ltp.get(spread.buy_id, 0)
+                        sell_val = latest_ltp.get(spread.sell_id, 0)
+                        exit_price = (buy_val - sell_val) if (buy_val > 0 and sell_val > 0) else spread.sim_stop_loss
+                        if filled_value is not None:
+                            exit_price = filled_value
+                        paper_account._close_position(buy_sym, "STOP-LOSS", exit_price)
+                        continue
+
+            # 2. Check Premium-Based Take Profit (Requires Option Ticks)
+            # This executes instantly when the option leg ticks
+            buy_ltp = latest_ltp.get(spread.buy_id, 0)
+            sell_ltp = latest_ltp.get(spread.sell_id, 0)
+
+            if buy_ltp > 0 and sell_ltp > 0:
+                current_spread_value = buy_ltp - sell_ltp
+
+                if current_spread_value >= spread.take_profit:
+                    trace = LatencyTrace("exit", recv_ns, dequeue_ns).mark("decision")
+                    logger.info(f"   [{INDEX_NAMES.get(spread.index_symbol)}] 🟢 SPREAD TARGET HIT at Rs {current_spread_value:.2f} (Target: Rs {spread.take_profit:.2f})")
+                    filled_value = None
+                    if LIVE_TRADING:
+                        logger.warning(f"🚨 LIVE TRADING: Executing Take-Profit market orders for {spread.qty} qty")
+                        closed, filled_value = _exit_spread_live(buy_sym, spread.sell_symbol, spread.qty, "TARGET", trace)
+                        if not closed:
+                            latency.record_trace(trace)
+                            continue  # Broker position still open: keep it on the book
+                    latency.record_trace(trace)
+
+                    paper_account._close_position(buy_sym, "TAKE-PROFIT",
+                                                  filled_value if filled_value is not None else current_spread_value)
+
+
+        # Keep the option ladder streaming around spot (after the ORB has formed)
+        if tick_index_name and index_ltp > 0:
+            _update_option_ladder(tick_index_name, index_ltp)
+
+        # --- 3. New Trade Scanning (ORB Strategy) ---
+        if len(paper_account.positions) >= MAX_OPEN_POSITIONS:
+            continue
+    
+        # Only scan during trading window (opened/closed by the scheduler)
+        if not _entries_open:
+            continue
+        
+        # Cheap cache-only breakout check; leg pricing, margin and orders run in the entry pipeline
+        if tick_index_name and index_symbol and index_ltp > 0 \
+                and orb_scalper_strategy.breakout_candidate(tick_index_name, index_ltp):
+            entry_pipeline.offer(tick_index_name, {
+                "index_name": tick_index_name,
+                "index_symbol": index_symbol,
+                "index_ltp": index_ltp,
+                "trace": LatencyTrace("entry", recv_ns, dequeue_ns),
+            })
+
+
+def _resolve_entry(candidate):
+    """
+    Entry pipeline stage 1 (off the tick loop): ORB breakout signal with priced spread
+    legs, risk budget and live margin check. Returns the resolved order dict or None.
+    """
+    index_name = candidate["index_name"]
+    eval_start_ns = time.monotonic_ns()
+    signal = orb_scalper_strategy.get_orb_trade_signal(
+        fyers_model, index_name, candidate["index_symbol"], candidate["index_ltp"],
+        option_ladder=_option_ladders.get(index_name),
+        bar_builder=bar_builder
+    )
+    latency.record("strategy.signal_eval", time.monotonic_ns() - eval_start_ns)
+    if signal is None:
+        return None
+
+    logger.info(f"   [{index_name}] 🎯 BREAKOUT DETECTED: {signal['direction']}")
+
+    # Spread risk check: max loss = net_debit × quantity
+    # For spreads, we DON'T use index SL points (that's for naked options)
+    lot_size = risk_manager.LOT_SIZES.get(index_name, 65)
+    max_risk_per_trade = paper_account.balance * (RISK_PERCENTAGE / 100)
+    max_loss_per_lot = signal["net_debit"] * lot_size  # e.g. ₹26 × 75 = ₹1,950
+
+    if max_loss_per_lot > max_risk_per_trade:
+        logger.warning(f"   [{index_name}] Spread cost ₹{max_loss_per_lot:,.0f}/lot exceeds risk budget ₹{max_risk_per_trade:,.0f}")
+        return None
+
+    lots = 1  # Conservative: 1 lot per spread
+    order = dict(signal, index_name=index_name, index_symbol=candidate["index_symbol"], trace=candidate["trace"],
+                 quantity=lots * lot_size, direction="LONG" if signal["trade_type"] == "CE" else "SHORT")
+    logger.info(f"   [{index_name}] Risk OK: Max loss ₹{max_loss_per_lot:,.0f}/lot (budget: ₹{max_risk_per_trade:,.0f})")
+
+    if LIVE_TRADING:
+        # --- LIVE MARGIN CHECK ---
+        # Calculate approximated margin required for this specific index's spread
+        min_margin_required = fyers_client.calculate_spread_margin(index_name)
+
+        # Answered from the cached funds snapshot; the hold is released or settled in _recheck_entry/_submit_entry
+        if not margin_service.try_reserve(order["buy_symbol"], min_margin_required):
+            free = margin_service.free()
+            free_text = f"₹{free:,.2f}" if free is not None else "unknown"
+            logger.warning(f"🚨 LIVE TRADING BLOCKED: Insufficient or stale free margin ({free_text}). Need estimated ₹{min_margin_required:,.0f} for a new {index_name} spread.")
+            return None
+    return order
+
+
+def _recheck_entry(order):
+    """
+    Entry pipeline stage 2: last look against the latest streamed prices, since ticks
+    kept flowing while the order was resolved. Drops it (and its margin hold) if the
+    trading window has closed or the EOD square-off has begun, the breakout has faded
+    back into the range, the spread got more than
+    ENTRY_MAX_DEBIT_DRIFT_PCT dearer or (live) the legs' book is too wide to price.
+    Live orders get their IOC limits here, from the freshest streamed book.
+    """
+    if not _entries_open or _session_over or not _entry_still_valid(order):
+        if LIVE_TRADING:
+            margin_service.release(order["buy_symbol"])
+        return False
+    if LIVE_TRADING:
+        quote = limit_pricer.price_spread(order["buy_symbol"], order["sell_symbol"], order["quantity"],
+                                          order["buy_ltp"], order["sell_ltp"])
+        if quote is None:
+            margin_service.release(order["buy_symbol"])
+            logger.warning(f"   [{order['index_name']}] Leg book wider than {limit_pricer.max_slippage_pct:g}% slippage. Entry dropped.")
+            return False
+        order["buy_limit"], order["sell_limit"], order["limit_quote"] = quote["buy_limit"], quote["sell_limit"], quote
+    order["trace"].mark("decision")
+    return True
+
+
+def _entry_still_valid(order):
+    index_name = order["index_name"]
+    if len(paper_account.positions) >= MAX_OPEN_POSITIONS:
+        return False
+    # One trade per index per day, and never a second spread on an index that still has one open
+    if orb_scalper_strategy.has_breakout_today(index_name):
+        return False
+    if order["buy_symbol"] in paper_account.positions or paper_account.spreads_for_symbol(order["index_symbol"]):
+        return False
+    index_ltp = _latest_ltp.get(SYMBOLS.intern(order["index_symbol"]), 0)
+    if index_ltp > 0:
+        still_out = index_ltp > order["orb_high"] if order["trade_type"] == "CE" else index_ltp < order["orb_low"]
+        if not still_out:
+            logger.warning(f"   [{index_name}] Breakout faded before submission (index {index_ltp}). Entry dropped.")
+            return False
+    buy_ltp = _latest_ltp.get(SYMBOLS.intern(order["buy_symbol"]), 0)
+    sell_ltp = _latest_ltp.get(SYMBOLS.intern(order["sell_symbol"]), 0)
+    if buy_ltp > 0 and sell_ltp > 0:
+        max_debit = order["net_debit"] * (1 + ENTRY_MAX_DEBIT_DRIFT_PCT / 100)
+        if buy_ltp - sell_ltp > max_debit:
+            logger.warning(f"   [{index_name}] Spread repriced to ₹{buy_ltp - sell_ltp:.2f} (resolved ₹{order['net_debit']:.2f}). Entry dropped.")
+            return False
+    return True
+
+
+def _book_live_entry(order, order_id, fill):
+    """
+    Books a live entry on paper from its confirmed fills (fill: order_book.OrderState).
+    fill=None only without an order book, where the acked IOC limits are all we know.
+    """
+    buy_symbol, sell_symbol = order["buy_symbol"], order["sell_symbol"]
+    limit_pricer.record_fill(order["limit_quote"], fill, buy_symbol, sell_symbol)
+    quantity, buy_price, sell_price = order["quantity"], order["buy_limit"], order["sell_limit"]
+    if fill is not None:
+        buy_leg, sell_leg = fill.legs.get(buy_symbol), fill.legs.get(sell_symbol)
+        quantity = min(buy_leg.filled_qty if buy_leg else 0, sell_leg.filled_qty if sell_leg else 0)
+        if quantity == 0:
+            margin_service.release(buy_symbol)
+            if fill.outcome == "PARTIAL":
+                margin_service.on_fill()  # A leg traded and was flattened
+            logger.error(f"❌ Live spread not filled ({fill.outcome}): {fill.message or 'IOC cancelled'}")
+            return
+        buy_price, sell_price = buy_leg.price, sell_leg.price
+
+    logger.info(f"✅ Live spread filled: {order_id} | {quantity} qty @ "
+                f"{buy_price:.2f} / {sell_price:.2f} (limits {order['buy_limit']:.2f} / {order['sell_limit']:.2f})")
+    margin_service.on_fill(buy_symbol)  # Hold stays until the refreshed balance shows it
+
+    # Also record it in paper account for dashboard tracking
+    paper_account.execute_spread(
+        buy_symbol=buy_symbol,
+        sell_symbol=sell_symbol,
+        quantity=quantity,
+        buy_premium=buy_price,
+        sell_premium=sell_price,
+        net_debit=buy_price - sell_price,
+        max_profit=order["spread_width"] - (buy_price - sell_price),
+        profit_target=order["profit_target"],
+        index_entry_price=order["breakout_price"],
+        index_stop_loss_price=order["index_stop_loss"],
+        spread_width=order["spread_width"],
+        direction=order["direction"],
+        index_symbol=order["index_symbol"]
+    )
+
+
+def _settle_pending_entries(index_name=None):
+    """Books (or drops) live entries whose fill confirmation arrived after the gateway stopped waiting."""
+    for key, order in list(_pending_entries.items()):
+        if index_name is not None and order["index_name"] != index_name:
+            continue
+        fill = order_gateway.settle_entry(key)
+        if fill is None:
+            continue
+        _pending_entries.pop(key, None)
+        logger.warning(f"📬 Late fill confirmation for {order['order_id']}: {fill.outcome}")
+        _book_live_entry(order, order["order_id"], fill)
+        _sync_subscriptions()
+
+
+def _submit_entry(order):
+    """Entry pipeline stage 3: live order through the gateway (then booked on paper), or a paper fill."""
+    index_name = order["index_name"]
+    trace = order["trace"]
+    quantity = order["quantity"]
+
+    if not _entries_open or _session_over:
+        # The window closed (or EOD started) while this order was being priced
+        if LIVE_TRADING:
+            margin_service.release(order["buy_symbol"])
+        logger.warning(f"   [{index_name}] Trading window closed before submission. Entry dropped.")
+        return
+
+    if LIVE_TRADING:
+        # ---------------- LIVE TRADE EXECUTION ----------------
+        buy_limit, sell_limit = order["buy_limit"], order["sell_limit"]
+        logger.warning(f"🚨 LIVE TRADING: Placing Multi-Leg Order for {quantity} qty")
+
+        order_response = order_gateway.open_spread(
+            order["buy_symbol"], order["sell_symbol"], quantity, buy_limit, sell_limit, trace)
+        if order_response is None:
+            margin_service.release(order["buy_symbol"])
+            return
+        latency_ms = (trace.marks["broker_ack"] - trace.marks["order_send"]) / 1e6
+        logger.warning(f"  ⏱️ FYERS API ENTRY EXECUTION LATENCY: {latency_ms:.2f} ms")
+
+        accepted = order_response.get("s") == "ok" or order_response.get("status") == "success"
+        if not accepted:
+            margin_service.release(order["buy_symbol"])
+            logger.error(f"❌ Live spread execution failed: {order_response['message']}")
+        elif order_gateway.entry_pending(order["buy_symbol"]):
+            # Acked, but no fill confirmation in time: book nothing (and keep the margin hold)
+            # until the order stream says what actually filled
+            order["order_id"] = order_response["order_id"]
+            _pending_entries[order["buy_symbol"]] = order
+            logger.warning(f"⏳ Live spread {order_response['order_id']} unconfirmed. Booking held until its fills arrive.")
+        else:
+            _book_live_entry(order, order_response["order_id"], order_response.get("fill"))
     else:
-        tick_queue.put(tick_data)
+        # ---------------- PAPER TRADE EXECUTION ----------------
+        paper_account.execute_spread(
+            buy_symbol=order["buy_symbol"],
+            sell_symbol=order["sell_symbol"],
+            quantity=quantity,
+            buy_premium=order["buy_ltp"],
+            sell_premium=order["sell_ltp"],
+            net_debit=order["net_debit"],
+            max_profit=order["max_profit"],
+            profit_target=order["profit_target"],
+            index_entry_price=order["breakout_price"],
+            index_stop_loss_price=order["index_stop_loss"],
+            spread_width=order["spread_width"],
+            direction=order["direction"],
+            index_symbol=order["index_symbol"]
+        )
+
+    latency.record_trace(trace)
 
+    # Mark this breakout as taken (1 trade per index per day)
+    orb_scalper_strategy.mark_breakout_taken(index_name)
+    _sync_subscriptions()
 
 def analysis_and_trading_loop():
     """Main logic loop — processes ticks and runs ORB strategy."""
-    global paper_account, fyers_model, _latest_ltp
-    last_analysis_time = 0
-
     # Track which symbols we are currently subscribed to
     global currently_subscribed
     currently_subscribed = set(SYMBOLS_TO_TRADE.values())
+    _sync_subscriptions()  # Positions restored from disk
+    _start_workers()
+    _schedule_session()
 
     while True:
         try:
-            tick = tick_queue.get_nowait()
-            
-            # --- TICK PROCESSING ---
-            tick_index_name = None
-            index_symbol = None
-            index_ltp = 0
-            if isinstance(tick, dict) and 'symbol' in tick and 'ltp' in tick:
-                sym = tick['symbol']
-                ltp = tick['ltp']
-                
-                # Update latest LTP from tick
-                _latest_ltp[sym] = ltp
-                
-                # Identify if this tick is from an index
-                if "NIFTY50" in sym:
-                    tick_index_name = "NIFTY"
-                    index_symbol = sym
-                    index_ltp = ltp
-                elif "NIFTYBANK" in sym:
-                    tick_index_name = "BANKNIFTY"
-                    index_symbol = sym
-                    index_ltp = ltp
-            
-            # Hot-reload: pick up positions added/removed via web dashboard occasionally
-            # (We don't need to do this every millisecond, so we can do it during the throttle,
-            # but we need the positions object during the fast loop)
-            
-            # --- FAST LOOP: Position Management (Exits) ---
-            # Evaluate exits EVERY single time a new price tick arrives for millisecond execution
-            active_positions = list(paper_account.positions.items())
-            for sym, pos in active_positions:
-                
-                # We only process spreads
-                if not pos.get('is_spread'):
-                    continue
-                    
-                buy_sym = sym
-                sell_sym = pos['sell_symbol']
-                
-                # Subscribe to options if we haven't already
-                if buy_sym not in currently_subscribed or sell_sym not in currently_subscribed:
-                    new_subs = [s for s in [buy_sym, sell_sym] if s not in currently_subscribed]
-                    if new_subs:
-                        logger.info(f"Dynamically subscribing to new options: {new_subs}")
-                        fyers_socket.subscribe(symbols=new_subs)
-                        for s in new_subs:
-                            currently_subscribed.add(s)
-                
-                # Map to proper index
-                is_nifty_pos = 'NIFTY' in buy_sym and 'BANK' not in buy_sym
-                is_banknifty_pos = 'BANKNIFTY' in buy_sym
-                
-                pos_index_name = "NIFTY" if is_nifty_pos else ("BANKNIFTY" if is_banknifty_pos else None)
-                
-                # 1. Check Index-Based Stop Loss (if index tick)
-                if tick_index_name and pos_index_name == tick_index_name:
-                    index_live = _latest_ltp.get(pos_index_name, 0)
-                    if index_live > 0:
-                        sl_hit = False
-                        # Format is "LONG SPREAD (LONG)" or "LONG SPREAD (SHORT)"
-                        if "(LONG)" in pos['direction']: # Call Spread
-                            if index_live <= pos['index_stop_loss_price']:
-                                sl_hit = True
-                        else: # Put Spread -> "(SHORT)"
-                            if index_live >= pos['index_stop_loss_price']:
-                                sl_hit = True
-                                
-                        if sl_hit:
-                            logger.warning(f"   [{pos_index_name}] 🔴 ORB STOP-LOSS HIT at {index_live}")
-                            if LIVE_TRADING:
-                                logger.warning(f"🚨 LIVE TRADING: Executing Stop-Loss market orders for {pos['qty']} qty")
-                                _sl_start = time.time()
-                                # Close the long leg (sell to close)
-                                fyers_client.place_market_order(fyers_model, buy_sym, pos['qty'], -1)
-                                # Close the short leg (buy to close)
-                                fyers_client.place_market_order(fyers_model, sell_sym, pos['qty'], 1)
-                                _sl_end = time.time()
-                                logger.warning(f"  ⏱️ FYERS API SL EXECUTION LATENCY: {(_sl_end - _sl_start) * 1000:.2f} ms")
-                            
-                            # Close on paper account
-                            buy_val = _latest_ltp.get(buy_sym, 0)
-                            sell_val = _latest_ltp.get(sell_sym, 0)
-                            exit_price = (buy_val - sell_val) if (buy_val > 0 and sell_val > 0) else pos['sim_stop_loss_price']
-                            paper_account._close_position(buy_sym, "STOP-LOSS", exit_price)
-                            continue
-                
-                # 2. Check Premium-Based Take Profit (Requires Option Ticks)
-                # This executes instantly when the option leg ticks
-                buy_ltp = _latest_ltp.get(buy_sym, 0)
-                sell_ltp = _latest_ltp.get(sell_sym, 0)
-                
-                if buy_ltp > 0 and sell_ltp > 0:
-                    current_spread_value = buy_ltp - sell_ltp
-                    
-                    if current_spread_value >= pos['sim_take_profit_price']:
-                        logger.info(f"   [{pos_index_name}] 🟢 SPREAD TARGET HIT at Rs {current_spread_value:.2f} (Target: Rs {pos['sim_take_profit_price']:.2f})")
-                        if LIVE_TRADING:
-                            logger.warning(f"🚨 LIVE TRADING: Executing Take-Profit market orders for {pos['qty']} qty")
-                            _tp_start = time.time()
-                            # Close the long leg (sell to close)
-                            fyers_client.place_market_order(fyers_model, buy_sym, pos['qty'], -1)
-                            # Close the short leg (buy to close)
-                            fyers_client.place_market_order(fyers_model, sell_sym, pos['qty'], 1)
-                            _tp_end = time.time()
-                            logger.warning(f"  ⏱️ FYERS API TARGET EXECUTION LATENCY: {(_tp_end - _tp_start) * 1000:.2f} ms")
-                            
-                        paper_account._close_position(buy_sym, "TAKE-PROFIT", current_spread_value)
-
-
-            # --- SLOW LOOP: Summary printing and Auto Square-Off ---
-            now = datetime.datetime.now().time()
-            current_time = time.time()
-            if current_time - last_analysis_time >= ANALYSIS_INTERVAL:
-                last_analysis_time = current_time
-            
-            # Hot-reload: pick up positions added/removed via web dashboard
-                paper_account.sync_positions()
-            
-                logger.info("=" * 50)
-                logger.info(f"[{now.strftime('%H:%M:%S')}] Active Subscriptions: {len(currently_subscribed)} | Positions: {len(paper_account.positions)}/{MAX_OPEN_POSITIONS}")
-            
-            # --- EOD Auto-Square-Off ---
-            if now >= datetime.time(15, 0):
-                logger.warning(f"It is {now.strftime('%H:%M')}. Initiating EOD Auto-Square-Off.")
-                symbols_to_quote = set(paper_account.positions.keys())
-                for pos in paper_account.positions.values():
-                    if pos.get('is_spread') and pos.get('sell_symbol'):
-                        symbols_to_quote.add(pos['sell_symbol'])
-                
-                if symbols_to_quote:
-                    try:
-                        quotes = fyers_model.quotes(data={"symbols": ",".join(symbols_to_quote)})
-                        if quotes.get('s') == 'ok':
-                            current_prices = {}
-                            for q in quotes['d']:
-                                current_prices[q['n']] = q['v'].get('lp', 0)
-                            paper_account.close_all_positions(reason="EOD_SQUARE_OFF", current_prices=current_prices)
-                    except Exception as e:
-                        logger.error(f"Error during EOD Square-Off: {e}")
-                
-                logger.info("--- EOD Square-Off Complete. Exiting. ---")
-                paper_account.get_summary()
+            # Block until ticks arrive or the next scheduled task is due, then take the latest tick of every changed symbol
+            dequeue_ns, batch = _drain_tick_batch(_next_wait())
+            if not process_tick_batch(dequeue_ns, batch):
+                _stop_workers()
                 exit(0)
-                
-            # --- 3. New Trade Scanning (ORB Strategy) ---
-            if len(paper_account.positions) >= MAX_OPEN_POSITIONS:
-                continue
-            
-            # Only scan during trading window
-            if now < orb_scalper_strategy.TRADING_START:
-                continue
-            if now > orb_scalper_strategy.TRADING_END:
-                continue
-                
-            # Check for ORB breakout (only if this tick is an index update)
-            if tick_index_name and index_symbol and index_ltp > 0:
-                signal = orb_scalper_strategy.get_orb_trade_signal(
-                    fyers_model, tick_index_name, index_symbol, index_ltp
-                )
-                
-                if signal is None:
-                    continue
-                
-                # --- Execute the spread trade ---
-                logger.info(f"   [{tick_index_name}] 🎯 BREAKOUT DETECTED: {signal['direction']}")
-                
-                # Spread risk check: max loss = net_debit × quantity
-                # For spreads, we DON'T use index SL points (that's for naked options)
-                lot_size = risk_manager.LOT_SIZES.get(tick_index_name, 65)
-                max_risk_per_trade = paper_account.balance * (RISK_PERCENTAGE / 100)
-                max_loss_per_lot = signal["net_debit"] * lot_size  # e.g. ₹26 × 75 = ₹1,950
-                
-                if max_loss_per_lot > max_risk_per_trade:
-                    logger.warning(f"   [{tick_index_name}] Spread cost ₹{max_loss_per_lot:,.0f}/lot exceeds risk budget ₹{max_risk_per_trade:,.0f}")
-                    continue
-                
-                lots = 1  # Conservative: 1 lot per spread
-                quantity = lots * lot_size
-                
-                logger.info(f"   [{tick_index_name}] Risk OK: Max loss ₹{max_loss_per_lot:,.0f}/lot (budget: ₹{max_risk_per_trade:,.0f})")
-            
-                # Execute the spread
-                direction = "LONG" if signal["trade_type"] == "CE" else "SHORT"
-                
-                if LIVE_TRADING:
-                    # --- LIVE MARGIN CHECK ---
-                    # Calculate approximated margin required for this specific index's spread
-                    min_margin_required = fyers_client.calculate_spread_margin(tick_index_name)
-                    
-                    live_balance = fyers_client.get_available_margin(fyers_model)
-                    if live_balance < min_margin_required:
-                        logger.warning(f"🚨 LIVE TRADING BLOCKED: Insufficient free margin (₹{live_balance:,.2f}). Need estimated ₹{min_margin_required:,.0f} for a new {tick_index_name} spread.")
-                        continue
-                        
-                    # ---------------- LIVE TRADE EXECUTION ----------------
-                    # Calculate limit prices with a 1% markup/markdown to ensure IOC execution against L1 quotes
-                    buy_limit = round(signal["buy_ltp"] * 1.01, 2)
-                    sell_limit = round(signal["sell_ltp"] * 0.99, 2)
-                    
-                    logger.warning(f"🚨 LIVE TRADING: Placing Multi-Leg Order for {quantity} qty")
-                    
-                    _send_time = time.time()
-                    order_response = fyers_client.place_multileg_order(
-                        fyers_instance=fyers_model,
-                        buy_symbol=signal["buy_symbol"],
-                        buy_qty=quantity,
-                        buy_limit_price=buy_limit,
-                        sell_symbol=signal["sell_symbol"],
-                        sell_qty=quantity,
-                        sell_limit_price=sell_limit
-                    )
-                    _ack_time = time.time()
-                    latency_ms = (_ack_time - _send_time) * 1000
-                    logger.warning(f"  ⏱️ FYERS API ENTRY EXECUTION LATENCY: {latency_ms:.2f} ms")
-                    
-                    if order_response.get("s") == "ok" or order_response.get("status") == "success":
-                        logger.info(f"✅ Live spread filled: {order_response['order_id']}")
-                        
-                        # Also record it in paper account for dashboard tracking
-                        paper_account.execute_spread(
-                            buy_symbol=signal["buy_symbol"],
-                            sell_symbol=signal["sell_symbol"],
-                            quantity=quantity,
-                            buy_premium=buy_limit,  # use limit price as entry
-                            sell_premium=sell_limit, # use limit price as sell entry
-                            net_debit=buy_limit - sell_limit,
-                            max_profit=signal["spread_width"] - (buy_limit - sell_limit),
-                            profit_target=signal["profit_target"],
-                            index_entry_price=signal["breakout_price"],
-                            index_stop_loss_price=signal["index_stop_loss"],
-                            spread_width=signal["spread_width"],
-                            direction=direction
-                        )
-                    else:
-                        logger.error(f"❌ Live spread execution failed: {order_response['message']}")
-                else:
-                    # ---------------- PAPER TRADE EXECUTION ----------------
-                    paper_account.execute_spread(
-                        buy_symbol=signal["buy_symbol"],
-                        sell_symbol=signal["sell_symbol"],
-                        quantity=quantity,
-                        buy_premium=signal["buy_ltp"],
-                        sell_premium=signal["sell_ltp"],
-                        net_debit=signal["net_debit"],
-                        max_profit=signal["max_profit"],
-                        profit_target=signal["profit_target"],
-                        index_entry_price=signal["breakout_price"],
-                        index_stop_loss_price=signal["index_stop_loss"],
-                        spread_width=signal["spread_width"],
-                        direction=direction
-                    )
-            
-                # Mark this breakout as taken (1 trade per index per day)
-                orb_scalper_strategy.mark_breakout_taken(tick_index_name)
-            
-            paper_account.get_summary()
 
-        except queue.Empty:
-            time.sleep(0.1)
         except Exception as e:
             logger.error(f"Error in analysis loop: {e}", exc_info=True)
             time.sleep(5)
@@ -326,14 +774,36 @@ if __name__ == '__main__':
     fyers_model = fyers_client.get_fyers_model()
     if fyers_model:
         paper_account = PaperAccount(initial_balance=config.ACCOUNT_BALANCE, filename="paper_positions_scalper.json")
+        if LIVE_TRADING:
+            margin_service = MarginService(fyers_model).start()
+            order_book = OrderBook(latency=latency)
+            order_socket = fyers_client.start_order_socket(fyers_model.token, order_book.on_order, order_book.on_trade)
+        order_gateway = OrderGateway(fyers_model, order_book=order_book)
+        fyers_client.prewarm_connections(fyers_model)
         
         symbols_to_watch = list(SYMBOLS_TO_TRADE.values())
         
-        fyers_socket = fyers_client.start_level2_websocket(
-            access_token=fyers_model.token,
-            on_tick=on_index_tick,
-            symbols=symbols_to_watch
-        )
+        # Reconnects with backoff, restores every live subscription and backfills outages
+        if FEED_SHARDS > 1:
+            fyers_socket = ShardedFeed(
+                fyers_model,
+                on_tick=on_index_tick,
+                symbols=symbols_to_watch,
+                shards=FEED_SHARDS,
+                bar_builder=bar_builder,
+                history_symbols=symbols_to_watch,
+                on_gap=_feed_gaps.append
+            ).start()
+        else:
+            fyers_socket = ResilientFeed(
+                fyers_model,
+                on_tick=on_index_tick,
+                symbols=symbols_to_watch,
+                bar_builder=bar_builder,
+                history_symbols=symbols_to_watch,
+                on_gap=_feed_gaps.append,
+                latency=latency
+            ).start()
 
         if fyers_socket:
             ws_thread = threading.Thread(target=fyers_socket.keep_running, daemon=True)
@@ -346,6 +816,8 @@ if __name__ == '__main__':
                 analysis_and_trading_loop()
             except KeyboardInterrupt:
                 logger.info(">>> Shutdown signal received. <<<")
+                _stop_workers()
+                latency.log_report(logger)
             finally:
                 if fyers_socket.is_connected():
                     fyers_socket.close_connection()
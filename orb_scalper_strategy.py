@@ -6,6 +6,7 @@
 import logging
 import datetime
 import fyers_client
+import market_clock
 
 logger = logging.getLogger(__name__)
 
@@ -20,17 +21,67 @@ PROFIT_TARGET_PCT = 15.0     # Take profit at 15% of net debit
 TRADING_START = datetime.time(9, 15)   # test mode
 TRADING_END = datetime.time(23, 59)    # test mode
 
+MARKET_OPEN = datetime.time(9, 15)
+ORB_REST_RETRY_SECONDS = 30  # Min gap between history-API fallback attempts per index
+
 # Cache: computed once per day
 _orb_cache = {}  # key=index_name, value={"date": date, "high": x, "low": y, "valid": bool}
+_orb_rest_retry_at = {}  # key=index_name, value=market_clock.monotonic() before which REST isn't retried
+
+
+def reset_state():
+    """Forget cached ORBs, breakout flags and REST throttles (e.g. before a replay session)."""
+    _orb_cache.clear()
+    _orb_rest_retry_at.clear()
+
+
+def _orb_window(today):
+    """(start, end) datetimes of today's opening range: 9:15 + ORB_CANDLES × 5 min."""
+    start = datetime.datetime.combine(today, MARKET_OPEN)
+    return start, start + datetime.timedelta(minutes=5 * ORB_CANDLES)
+
+
+def _validate_and_cache_orb(index_name, today, orb_high, orb_low, source):
+    """Apply the range filters, cache the outcome for the day and return the ORB dict (or None)."""
+    orb_range = orb_high - orb_low
+    
+    # --- Filters ---
+    min_range = MIN_RANGE_POINTS_NIFTY if index_name == "NIFTY" else MIN_RANGE_POINTS_BANK
+    mid_price = (orb_high + orb_low) / 2
+    range_pct = (orb_range / mid_price) * 100
+    
+    if orb_range < min_range:
+        logger.info(f"[ORB] {index_name}: Range too narrow ({orb_range:.0f} pts < {min_range}). Skipping.")
+        _orb_cache[index_name] = {"date": today, "valid": False}
+        return None
+    
+    if range_pct > MAX_RANGE_PCT:
+        logger.info(f"[ORB] {index_name}: Range too wide ({range_pct:.2f}% > {MAX_RANGE_PCT}%). Skipping.")
+        _orb_cache[index_name] = {"date": today, "valid": False}
+        return None
+    
+    result = {
+        "date": today,
+        "valid": True,
+        "orb_high": orb_high,
+        "orb_low": orb_low,
+        "orb_range": orb_range
+    }
+    _orb_cache[index_name] = result
+    logger.info(f"[ORB] {index_name}: ORB Range = {orb_low:.2f} - {orb_high:.2f} ({orb_range:.0f} pts) [{source}]")
+    return result
 
 
-def _get_orb_range(fyers_instance, index_name, fyers_symbol):
+def _get_orb_range(fyers_instance, index_name, fyers_symbol, bar_builder=None):
     """
-    Compute today's Opening Range from 5-min candles.
-    Returns dict with orb_high, orb_low, orb_range, or None if invalid.
+    Compute today's Opening Range.
+    Preferred source is the live tick-built bars (bar_builder), read once the range
+    window has closed. The 5-min history API is only a cold-start fallback (process
+    started after 9:15), and failed fallbacks are throttled instead of retried per tick.
+    Returns dict with orb_high, orb_low, orb_range, or None if invalid / not formed.
     Caches result per index per day.
     """
-    today = datetime.date.today()
+    today = market_clock.today()
     
     # Return cached value if already computed today
     if index_name in _orb_cache and _orb_cache[index_name]["date"] == today:
@@ -39,12 +90,23 @@ def _get_orb_range(fyers_instance, index_name, fyers_symbol):
             return None
         return cached
     
-    # Need at least 9:30 to have 3 complete 5-min candles
-    now = datetime.datetime.now().time()
-    if now < TRADING_START:
-        logger.info(f"[ORB] {index_name}: Too early ({now}), ORB not formed yet")
+    # The range only exists once its last candle has closed (9:30 for 3 × 5-min)
+    orb_start, orb_end = _orb_window(today)
+    if market_clock.now() < orb_end:
         return None
     
+    # --- Primary: tick-derived bars (no REST) ---
+    if bar_builder is not None:
+        tick_range = bar_builder.get_range(fyers_symbol, orb_start.timestamp(), orb_end.timestamp())
+        if tick_range is not None:
+            return _validate_and_cache_orb(index_name, today, float(tick_range["high"]),
+                                           float(tick_range["low"]), "ticks")
+    
+    # --- Fallback: history API, at most once per ORB_REST_RETRY_SECONDS ---
+    if market_clock.monotonic() < _orb_rest_retry_at.get(index_name, 0):
+        return None
+    _orb_rest_retry_at[index_name] = market_clock.monotonic() + ORB_REST_RETRY_SECONDS
+    
     # Fetch today's 5-min candles
     try:
         df = fyers_client.get_historical_data(
@@ -62,42 +124,15 @@ def _get_orb_range(fyers_instance, index_name, fyers_symbol):
         
         # First 3 candles = Opening Range (9:15, 9:20, 9:25)
         orb_candles = df.iloc[:ORB_CANDLES]
-        orb_high = float(orb_candles['high'].max())
-        orb_low = float(orb_candles['low'].min())
-        orb_range = orb_high - orb_low
-        
-        # --- Filters ---
-        min_range = MIN_RANGE_POINTS_NIFTY if index_name == "NIFTY" else MIN_RANGE_POINTS_BANK
-        mid_price = (orb_high + orb_low) / 2
-        range_pct = (orb_range / mid_price) * 100
-        
-        if orb_range < min_range:
-            logger.info(f"[ORB] {index_name}: Range too narrow ({orb_range:.0f} pts < {min_range}). Skipping.")
-            _orb_cache[index_name] = {"date": today, "valid": False}
-            return None
-        
-        if range_pct > MAX_RANGE_PCT:
-            logger.info(f"[ORB] {index_name}: Range too wide ({range_pct:.2f}% > {MAX_RANGE_PCT}%). Skipping.")
-            _orb_cache[index_name] = {"date": today, "valid": False}
-            return None
-        
-        result = {
-            "date": today,
-            "valid": True,
-            "orb_high": orb_high,
-            "orb_low": orb_low,
-            "orb_range": orb_range
-        }
-        _orb_cache[index_name] = result
-        logger.info(f"[ORB] {index_name}: ORB Range = {orb_low:.2f} - {orb_high:.2f} ({orb_range:.0f} pts)")
-        return result
+        return _validate_and_cache_orb(index_name, today, float(orb_candles['high'].max()),
+                                       float(orb_candles['low'].min()), "history API")
         
     except Exception as e:
         logger.error(f"[ORB] Error computing ORB for {index_name}: {e}", exc_info=True)
         return None
 
 
-def get_orb_trade_signal(fyers_instance, index_name, fyers_symbol, current_ltp):
+def get_orb_trade_signal(fyers_instance, index_name, fyers_symbol, current_ltp, option_ladder=None, bar_builder=None):
     """
     Check if a breakout has occurred and return a trade signal with spread legs.
     
@@ -106,19 +141,22 @@ def get_orb_trade_signal(fyers_instance, index_name, fyers_symbol, current_ltp):
         index_name: "NIFTY" or "BANKNIFTY"
         fyers_symbol: "NSE:NIFTY50-INDEX" or "NSE:NIFTYBANK-INDEX"
         current_ltp: current index price from tick
+        option_ladder: optional OptionLadder; legs are priced from streamed ticks when
+                       possible, falling back to REST (resolve_spread_quote) otherwise
+        bar_builder: optional BarBuilder fed by the live feed; the ORB is computed from it
         
     Returns:
         dict with trade signal and spread details, or None
     """
     # --- Time Window Check ---
-    now = datetime.datetime.now().time()
+    now = market_clock.now().time()
     if now < TRADING_START:
         return None  # ORB not formed yet
     if now > TRADING_END:
         return None  # Past trading window
     
     # --- Get ORB Range ---
-    orb = _get_orb_range(fyers_instance, index_name, fyers_symbol)
+    orb = _get_orb_range(fyers_instance, index_name, fyers_symbol, bar_builder)
     if orb is None:
         return None
     
@@ -160,18 +198,17 @@ def get_orb_trade_signal(fyers_instance, index_name, fyers_symbol, current_ltp):
     spread_width = SPREAD_WIDTH_NIFTY if index_name == "NIFTY" else SPREAD_WIDTH_BANK
     option_type = signal["trade_type"]
     
-    # Buy leg: ATM option
-    buy_leg = fyers_client.find_option_by_offset(fyers_instance, index_name, option_type, 0)
-    if not buy_leg or buy_leg['ltp'] <= 0:
-        logger.warning(f"[ORB] Could not find ATM {option_type} for {index_name}")
-        return None
-    
-    # Sell leg: 1-strike OTM
-    sell_leg = fyers_client.find_option_by_offset(fyers_instance, index_name, option_type, 
-                                                   1 if option_type == "PE" else 1)
-    if not sell_leg or sell_leg['ltp'] <= 0:
-        logger.warning(f"[ORB] Could not find OTM {option_type} for {index_name}")
-        return None
+    legs = option_ladder.get_spread_legs(option_type, current_ltp) if option_ladder else None
+    if legs is not None:
+        buy_leg, sell_leg = legs
+        logger.info("[ORB] Spread legs priced from streamed ladder (no REST)")
+    else:
+        # One quotes() call prices spot and every candidate leg
+        spread = fyers_client.resolve_spread_quote(fyers_instance, index_name, option_type, current_ltp)
+        if spread is None:
+            logger.warning(f"[ORB] Could not price {option_type} spread for {index_name}")
+            return None
+        buy_leg, sell_leg = spread["buy_leg"], spread["sell_leg"]
     
     # Calculate spread economics
     net_debit = buy_leg['ltp'] - sell_leg['ltp']
@@ -200,9 +237,32 @@ def get_orb_trade_signal(fyers_instance, index_name, fyers_symbol, current_ltp):
     return signal
 
 
+def breakout_candidate(index_name, current_ltp):
+    """
+    Cache-only pre-check for the tick loop (never calls REST). True if the LTP is outside
+    today's formed ORB, or if today's ORB hasn't been computed yet (get_orb_trade_signal
+    will compute it); False inside the range, when today's ORB was filtered out or
+    when today's breakout has already been traded.
+    """
+    cached = _orb_cache.get(index_name)
+    if cached is None or cached["date"] != market_clock.today():
+        return True
+    if not cached["valid"] or cached.get("breakout_taken"):
+        return False
+    return current_ltp > cached["orb_high"] or current_ltp < cached["orb_low"]
+
+
+def get_formed_orb(index_name):
+    """Returns today's cached, valid ORB for an index (no API calls), or None if not formed yet."""
+    cached = _orb_cache.get(index_name)
+    if cached and cached["date"] == market_clock.today() and cached["valid"]:
+        return cached
+    return None
+
+
 def has_breakout_today(index_name):
     """Check if we already detected a breakout for this index today (avoid re-entry)."""
-    today = datetime.date.today()
+    today = market_clock.today()
     if index_name in _orb_cache and _orb_cache[index_name].get("date") == today:
         return _orb_cache[index_name].get("breakout_taken", False)
     return False
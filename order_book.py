@@ -0,0 +1,197 @@
+# order_book.py - In-Memory Order Book Fed by the Order-Update Socket
+# ===================================================================
+# A REST "s: ok" on placement only means the broker accepted the order. For
+# IOC limit legs the real outcome (filled, partially filled, cancelled
+# unfilled or rejected by RMS) arrives on the broker's order/trade update
+# stream a few milliseconds later. fyers_client.start_order_socket() pushes
+# those updates in here, keyed by order id, and the order gateway waits on
+# the order instead of polling the orderbook endpoint.
+#
+# Updates can beat the REST ack, so an order is created by whichever arrives
+# first. Multi-leg baskets report each leg with its own symbol, either under
+# the basket id or under a leg id whose parentId is the basket; legs are filed
+# under the basket either way. An order is complete once every expected leg
+# is in a terminal state.
+#
+# Fyers order status codes: 1 cancelled, 2 traded (filled), 4 transit,
+# 5 rejected, 6 pending, 7 expired.
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+STATUS_CANCELLED, STATUS_FILLED, STATUS_TRANSIT, STATUS_REJECTED, STATUS_PENDING, STATUS_EXPIRED = 1, 2, 4, 5, 6, 7
+TERMINAL_STATUSES = (STATUS_CANCELLED, STATUS_FILLED, STATUS_REJECTED, STATUS_EXPIRED)
+MAX_ORDERS = 5000  # Completed orders kept for lookups; oldest dropped first
+
+
+class LegFill:
+    """Fill state of one leg (one symbol) of an order."""
+
+    __slots__ = ("symbol", "side", "qty", "filled_qty", "avg_price", "status", "trade_qty", "trade_value")
+
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.side = 0
+        self.qty = 0
+        self.filled_qty = 0
+        self.avg_price = 0.0  # Broker-reported average fill price (0 until the order update carries it)
+        self.status = STATUS_PENDING
+        self.trade_qty = 0     # Running totals from trade updates, used until the order update lands
+        self.trade_value = 0.0
+
+    @property
+    def price(self):
+        if self.avg_price:
+            return self.avg_price
+        return self.trade_value / self.trade_qty if self.trade_qty else 0.0
+
+    @property
+    def done(self):
+        return self.status in TERMINAL_STATUSES
+
+
+class OrderState:
+    """Everything the update stream has told us about one order id."""
+
+    __slots__ = ("order_id", "legs", "expected", "message", "created_ns", "done_ns", "event")
+
+    def __init__(self, order_id):
+        self.order_id = order_id
+        self.legs = {}          # symbol -> LegFill
+        self.expected = ()      # Leg symbols the placer is waiting on
+        self.message = ""
+        self.created_ns = time.monotonic_ns()  # Reset by expect() to the REST ack
+        self.done_ns = None
+        self.event = threading.Event()
+
+    @property
+    def outcome(self):
+        """FILLED (every leg in full), PARTIAL (some fills), REJECTED or UNFILLED."""
+        legs = self.legs.values()
+        if legs and all(leg.filled_qty >= leg.qty > 0 for leg in legs):
+            return "FILLED"
+        if any(leg.filled_qty for leg in legs):
+            return "PARTIAL"
+        if any(leg.status == STATUS_REJECTED for leg in legs):
+            return "REJECTED"
+        return "UNFILLED"
+
+    def _complete(self):
+        return bool(self.expected) and all(s in self.legs and self.legs[s].done for s in self.expected)
+
+
+class OrderBook:
+    """Thread-safe: the socket thread writes, order-placing threads wait()."""
+
+    def __init__(self, latency=None):
+        self.latency = latency  # Optional LatencyRecorder: "order.ack->complete"
+        self.stats = {"updates": 0, "trades": 0, "FILLED": 0, "PARTIAL": 0, "UNFILLED": 0, "REJECTED": 0}
+        self._lock = threading.Lock()
+        self._orders = OrderedDict()
+        self._parents = {}  # Leg order id -> basket order id (from parentId), for trade updates
+
+    def _order(self, order_id):
+        order = self._orders.get(order_id)
+        if order is None:
+            order = self._orders[order_id] = OrderState(order_id)
+            while len(self._orders) > MAX_ORDERS:
+                self._orders.popitem(last=False)
+        return order
+
+    def _leg(self, order, symbol):
+        leg = order.legs.get(symbol)
+        if leg is None:
+            leg = order.legs[symbol] = LegFill(symbol)
+        return leg
+
+    def on_order(self, update):
+        """
+        Applies one order update (flat SDK-shaped dict: id, parentId, symbol, qty,
+        filledQty, tradedPrice, status, side, message).
+        """
+        order_id = update.get("id")
+        if not order_id:
+            return
+        with self._lock:
+            self.stats["updates"] += 1
+            parent_id = update.get("parentId")
+            if parent_id:
+                if len(self._parents) >= MAX_ORDERS:
+                    self._parents.clear()
+                self._parents[str(order_id)] = str(parent_id)
+                orphan = self._orders.pop(str(order_id), None)  # Trades that beat the leg's first order update
+                order_id = parent_id
+            else:
+                orphan = None
+            order = self._order(str(order_id))
+            if orphan is not None:
+                for symbol, early in orphan.legs.items():
+                    merged = self._leg(order, symbol)
+                    merged.trade_qty += early.trade_qty
+                    merged.trade_value += early.trade_value
+                    merged.filled_qty = max(merged.filled_qty, early.filled_qty)
+            leg = self._leg(order, update.get("symbol", ""))
+            leg.side = update.get("side", leg.side)
+            leg.qty = int(update.get("qty", leg.qty) or 0)
+            leg.filled_qty = max(leg.filled_qty, int(update.get("filledQty", 0) or 0))
+            if update.get("tradedPrice"):
+                leg.avg_price = float(update["tradedPrice"])
+            if not leg.done:  # Never step back from a terminal status on a late/out-of-order update
+                leg.status = int(update.get("status", leg.status))
+            if update.get("message"):
+                order.message = update["message"]
+            self._check_complete(order)
+
+    def on_trade(self, trade):
+        """Applies one trade (fill) update: orderNumber, symbol, tradedQty, tradePrice."""
+        order_id = trade.get("orderNumber") or trade.get("id")
+        if not order_id:
+            return
+        with self._lock:
+            self.stats["trades"] += 1
+            order_id = self._parents.get(str(order_id), str(order_id))
+            leg = self._leg(self._order(order_id), trade.get("symbol", ""))
+            qty = int(trade.get("tradedQty", 0) or 0)
+            leg.trade_qty += qty
+            leg.trade_value += qty * float(trade.get("tradePrice", 0.0) or 0.0)
+            leg.filled_qty = max(leg.filled_qty, leg.trade_qty)
+
+    def expect(self, order_id, symbols):
+        """Registers the legs a just-placed order must report before it counts as complete."""
+        with self._lock:
+            order = self._order(str(order_id))
+            order.expected = tuple(symbols)
+            order.created_ns = time.monotonic_ns()
+            self._check_complete(order)
+            return order
+
+    def wait(self, order_id, timeout):
+        """Blocks until every expected leg is terminal. Returns the OrderState, or None on timeout."""
+        with self._lock:
+            order = self._order(str(order_id))
+        if not order.event.wait(timeout):
+            return None
+        return order
+
+    def get(self, order_id):
+        with self._lock:
+            return self._orders.get(str(order_id))
+
+    def log_report(self, logger):
+        if self.stats["updates"]:
+            logger.info(f"Order stream: {self.stats['updates']} order updates, {self.stats['trades']} trades | "
+                        f"Filled {self.stats['FILLED']}, partial {self.stats['PARTIAL']}, "
+                        f"unfilled {self.stats['UNFILLED']}, rejected {self.stats['REJECTED']}")
+
+    def _check_complete(self, order):
+        if order.done_ns is not None or not order._complete():
+            return
+        order.done_ns = time.monotonic_ns()
+        self.stats[order.outcome] += 1
+        if self.latency is not None:
+            self.latency.record("order.ack->complete", order.done_ns - order.created_ns)
+        order.event.set()
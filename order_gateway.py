@@ -0,0 +1,258 @@
+# order_gateway.py - Shared Broker Order Gateway
+# ==============================================
+# One thread-safe front door to the broker for every strategy worker. Each
+# order is tied to a position key (the spread's buy-leg symbol), and only one
+# order per key may be in flight: a second entry or exit for the same spread
+# (another worker, the EOD square-off, a dashboard close) is refused instead
+# of doubling the position. Orders for different keys run concurrently on
+# the caller's thread, so a slow NIFTY order never queues a BANKNIFTY exit.
+#
+# With an order book (order_book.OrderBook fed by the order-update socket),
+# an acked order is only reported once its fills are confirmed, with actual
+# fill quantities and prices. An IOC spread whose legs filled unevenly has
+# the unmatched quantity flattened at market so no leg is left naked. An
+# entry not confirmed within fill_timeout stays pending under its key until
+# settle_entry() finds its confirmation: no news is never taken as a fill.
+#
+# Exits with an order book are only done once both legs are confirmed filled
+# in full. A leg that was rejected, cancelled short or never confirmed keeps
+# the exit open: later close_spread() calls for that key settle late
+# confirmations and re-send only the unfilled remainder of each leg.
+
+import logging
+import threading
+import time
+
+import fyers_client
+
+logger = logging.getLogger(__name__)
+
+ORDER_FILL_TIMEOUT = 1.0  # Seconds to wait for fill confirmation before falling back to the ack
+EXIT_RETRY_INTERVAL = 1.0  # Min seconds between re-sends of an exit's unfilled remainder
+
+
+class OrderGateway:
+    """Sends spread entry/exit orders, at most one in flight per position key."""
+
+    def __init__(self, fyers_instance, order_book=None, fill_timeout=ORDER_FILL_TIMEOUT):
+        self.fyers = fyers_instance
+        self.order_book = order_book
+        self.fill_timeout = fill_timeout
+        self._lock = threading.Lock()
+        self._in_flight = set()  # Position keys with an order outstanding
+        self._exits = {}  # Position key -> exit still being worked (see _close_confirmed)
+        self._entries = {}  # Position key -> (order_id, buy_symbol, sell_symbol) of an unconfirmed entry
+        self.stats = {"entries": 0, "exits": 0, "duplicates": 0, "errors": 0, "unconfirmed": 0, "unwinds": 0}
+
+    def _claim(self, key):
+        with self._lock:
+            if key in self._in_flight:
+                self.stats["duplicates"] += 1
+                return False
+            self._in_flight.add(key)
+            return True
+
+    def _release(self, key):
+        with self._lock:
+            self._in_flight.discard(key)
+
+    def in_flight(self, key):
+        return key in self._in_flight
+
+    def open_spread(self, buy_symbol, sell_symbol, qty, buy_limit, sell_limit, trace=None):
+        """
+        Places the 2-leg IOC entry order. Returns the fyers_client response dict,
+        or None if an order for this spread is already in flight. With an order book,
+        a successful response also carries "fill": the confirmed OrderState, any leg
+        imbalance already flattened. If it is None (unconfirmed within fill_timeout),
+        the entry stays pending (entry_pending) until settle_entry() returns its fills.
+        """
+        if not self._claim(buy_symbol):
+            logger.warning(f"Entry for {buy_symbol} skipped: an order for it is already in flight")
+            return None
+        try:
+            if trace is not None:
+                trace.mark("order_send")
+            response = fyers_client.place_multileg_order(
+                fyers_instance=self.fyers,
+                buy_symbol=buy_symbol,
+                buy_qty=qty,
+                buy_limit_price=buy_limit,
+                sell_symbol=sell_symbol,
+                sell_qty=qty,
+                sell_limit_price=sell_limit
+            )
+            if trace is not None:
+                trace.mark("broker_ack")
+            if self.order_book is not None and response.get("status") == "success":
+                fill = self._await_fills(response["order_id"], (buy_symbol, sell_symbol), trace)
+                response["fill"] = fill
+                if fill is not None:
+                    self._unwind_imbalance(fill, buy_symbol, sell_symbol)
+                else:
+                    self._entries[buy_symbol] = (response["order_id"], buy_symbol, sell_symbol)
+        finally:
+            self._release(buy_symbol)
+        with self._lock:
+            self.stats["entries"] += 1
+            if response.get("status") != "success":
+                self.stats["errors"] += 1
+        return response
+
+    def close_spread(self, buy_symbol, sell_symbol, qty, trace=None, label="EXIT"):
+        """
+        Closes both legs concurrently (fyers_client.close_spread_legs). Returns its
+        result dict, or None if an order for this spread is already in flight.
+
+        With an order book the result also carries "closed" (both legs confirmed filled
+        in full), "exit_value" (long-leg avg fill minus short-leg avg fill, once closed),
+        "remaining" {symbol: qty still open}, "unconfirmed" [symbols awaiting
+        confirmation] and "sent" (orders went out on this call; False while a resend
+        is throttled or only confirmations are awaited). Until closed, the exit stays registered under `label`
+        (exit_pending/exit_label) and each further call works off what is left.
+        """
+        if not self._claim(buy_symbol):
+            logger.warning(f"Exit for {buy_symbol} skipped: an order for it is already in flight")
+            return None
+        try:
+            if self.order_book is not None:
+                result = self._close_confirmed(buy_symbol, sell_symbol, qty, trace, label)
+            else:
+                if trace is not None:
+                    trace.mark("order_send")
+                result = fyers_client.close_spread_legs(self.fyers, buy_symbol, sell_symbol, qty)
+                if trace is not None:
+                    trace.mark("broker_ack")
+        finally:
+            self._release(buy_symbol)
+        if result["legs"]:
+            with self._lock:
+                self.stats["exits"] += 1
+                if result["status"] != "success":
+                    self.stats["errors"] += 1
+        return result
+
+    def entry_pending(self, key):
+        """True while an entry for `key` was acked but its fills are not confirmed yet."""
+        return key in self._entries
+
+    def settle_entry(self, key):
+        """
+        The confirmed OrderState of a pending entry once the order stream has completed it
+        (leg imbalance flattened, no longer pending), or None while still unconfirmed.
+        """
+        pending = self._entries.get(key)
+        if pending is None:
+            return None
+        order_id, buy_symbol, sell_symbol = pending
+        state = self.order_book.get(order_id)
+        if state is None or state.done_ns is None:
+            return None
+        del self._entries[key]
+        self._unwind_imbalance(state, buy_symbol, sell_symbol)
+        return state
+
+    def exit_pending(self, key):
+        """True while an exit for `key` has legs not yet confirmed filled."""
+        return key in self._exits
+
+    def exit_label(self, key):
+        exit_state = self._exits.get(key)
+        return exit_state["label"] if exit_state else None
+
+    def _close_confirmed(self, buy_symbol, sell_symbol, qty, trace, label):
+        exit_state = self._exits.get(buy_symbol)
+        if exit_state is None:
+            exit_state = self._exits[buy_symbol] = {"label": label, "next_send": 0.0, "legs": {
+                symbol: {"side": side, "remaining": qty, "pending": None, "filled": 0, "value": 0.0, "warned": None}
+                for symbol, side in ((buy_symbol, -1), (sell_symbol, 1))}}
+        legs = exit_state["legs"]
+        for symbol, leg in legs.items():  # Confirmations that arrived after an earlier timeout
+            if leg["pending"] is not None:
+                self._settle(symbol, leg, self.order_book.get(leg["pending"]))
+
+        result = {"status": "success", "legs": [], "total_latency_ms": 0.0}
+        to_send = [(symbol, leg["remaining"], leg["side"]) for symbol, leg in legs.items()
+                   if leg["remaining"] > 0 and leg["pending"] is None]
+        now = time.monotonic()
+        if to_send and now >= exit_state["next_send"]:
+            exit_state["next_send"] = now + EXIT_RETRY_INTERVAL
+            if trace is not None:
+                trace.mark("order_send")
+            result = fyers_client.close_legs(self.fyers, to_send)
+            if trace is not None:
+                trace.mark("broker_ack")
+            # Register every sent leg before waiting on any, so no confirmation is missed
+            for sent in result["legs"]:
+                if sent["response"].get("status") == "success":
+                    legs[sent["symbol"]]["pending"] = sent["response"]["order_id"]
+                    self.order_book.expect(sent["response"]["order_id"], (sent["symbol"],))
+            deadline = time.monotonic() + self.fill_timeout
+            for symbol, leg in legs.items():
+                if leg["pending"] is not None:
+                    state = self.order_book.wait(leg["pending"], max(deadline - time.monotonic(), 0.0))
+                    self._settle(symbol, leg, state)
+            if trace is not None and all(leg["pending"] is None for leg in legs.values()):
+                trace.mark("fill_confirm")
+
+        unconfirmed = [symbol for symbol, leg in legs.items() if leg["pending"] is not None]
+        remaining = {symbol: leg["remaining"] for symbol, leg in legs.items() if leg["remaining"] > 0}
+        newly_unconfirmed = [symbol for symbol in unconfirmed if legs[symbol]["warned"] != legs[symbol]["pending"]]
+        if newly_unconfirmed:  # Once per leg order, not on every call that finds it still open
+            for symbol in newly_unconfirmed:
+                legs[symbol]["warned"] = legs[symbol]["pending"]
+            with self._lock:
+                self.stats["unconfirmed"] += 1
+            logger.warning(f"Exit for {buy_symbol}: no fill confirmation yet for {', '.join(newly_unconfirmed)}")
+        result.update(closed=not remaining, exit_value=None, remaining=remaining, unconfirmed=unconfirmed,
+                      sent=bool(result["legs"]), label=exit_state["label"])
+        if not remaining:
+            del self._exits[buy_symbol]
+            buy_leg, sell_leg = legs[buy_symbol], legs[sell_symbol]
+            result["exit_value"] = buy_leg["value"] / buy_leg["filled"] - sell_leg["value"] / sell_leg["filled"]
+        return result
+
+    @staticmethod
+    def _settle(symbol, leg, state):
+        """Applies a completed leg order's fills to the exit; leaves it pending if not complete yet."""
+        if state is None or state.done_ns is None:
+            return
+        fill = state.legs.get(symbol)
+        filled = fill.filled_qty if fill is not None else 0
+        leg["remaining"] -= filled
+        leg["filled"] += filled
+        leg["value"] += filled * (fill.price if fill is not None else 0.0)
+        leg["pending"] = None
+
+    def _await_fills(self, order_id, symbols, trace=None):
+        """Waits for the order book to report every leg terminal; marks "fill_confirm" on the trace."""
+        self.order_book.expect(order_id, symbols)
+        state = self.order_book.wait(order_id, self.fill_timeout)
+        if state is None:
+            with self._lock:
+                self.stats["unconfirmed"] += 1
+            logger.warning(f"No fill confirmation for order {order_id} within {self.fill_timeout:g}s")
+        elif trace is not None:
+            trace.mark("fill_confirm")
+        return state
+
+    def _unwind_imbalance(self, fill, buy_symbol, sell_symbol):
+        """Flattens whatever one leg of an IOC spread filled beyond the other, at market."""
+        buy_leg, sell_leg = fill.legs.get(buy_symbol), fill.legs.get(sell_symbol)
+        bought = buy_leg.filled_qty if buy_leg else 0
+        sold = sell_leg.filled_qty if sell_leg else 0
+        if bought == sold:
+            return
+        # Excess long leg is sold back; excess short leg is bought back
+        symbol, qty, side = (buy_symbol, bought - sold, -1) if bought > sold else (sell_symbol, sold - bought, 1)
+        logger.error(f"⚠️ Spread order {fill.order_id} filled unevenly (bought {bought}, sold {sold}). "
+                     f"Flattening {qty} of {symbol} at market.")
+        with self._lock:
+            self.stats["unwinds"] += 1
+        fyers_client.place_market_order(self.fyers, symbol, qty, side)
+
+    def log_report(self, logger):
+        if self.stats["entries"] or self.stats["exits"]:
+            logger.info(f"Orders: {self.stats['entries']} entries, {self.stats['exits']} exits | "
+                        f"{self.stats['errors']} failed, {self.stats['duplicates']} duplicates refused | "
+                        f"{self.stats['unconfirmed']} unconfirmed fills, {self.stats['unwinds']} leg imbalances flattened")
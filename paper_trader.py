@@ -1,26 +1,52 @@
 import logging
 import csv
 import datetime
+import functools
 import json
 import os
-import pandas as pd # <--- THIS IS THE FIX
+import threading
+import market_clock
+from tick_types import SYMBOLS, SpreadPosition
 
 logger = logging.getLogger(__name__)
 
+
+def _underlying_index_symbol(option_symbol):
+    """Maps an option symbol like NSE:BANKNIFTY26FEB61100PE to its index symbol (or None)."""
+    if not option_symbol:
+        return None
+    return SYMBOLS.classify(option_symbol).index_symbol
+
+
+def _synchronized(method):
+    """Runs a PaperAccount method under the account lock (shared by the per-index workers)."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
 class PaperAccount:
     """
     A paper trading account that simulates trades and tracks P&L.
     V1.2: Upgraded for backtesting.
     - Stores 6 price points for simulated option trades.
     - Checks exits based on INDEX prices, not option prices.
+    Thread-safe: public methods hold a re-entrant lock, so the per-index strategy
+    workers, the dispatcher and the EOD square-off can share one account.
     """
-    def __init__(self, initial_balance=100000.0, filename="paper_positions.json"):
+    def __init__(self, initial_balance=100000.0, filename="paper_positions.json", log_filename="trade_log.csv"):
+        self._lock = threading.RLock()
         self.initial_balance = initial_balance
         self.balance = initial_balance
         self.positions = {} # Stores active trades
+        self.symbol_index = {} # Reverse index: subscribed symbol -> set of position keys that depend on it
+        self.spreads = {} # Position key -> SpreadPosition (compact exit parameters for the tick loop)
         self.trade_log = [] # Stores history of closed trades
+        self._reset_stats() # Running P&L aggregates, updated O(1) per open/close
         self.filename = filename
-        self.log_filename = "trade_log.csv"
+        self.log_filename = log_filename
         self._last_file_mtime = 0  # Track file modification time for hot-reload
         self._setup_log_file()
         self._load_positions() # Restore state
@@ -83,6 +109,7 @@ class PaperAccount:
                 for sym, pos in data.items():
                     pos['entry_time'] = datetime.datetime.fromisoformat(pos['entry_time'])
                     self.positions[sym] = pos
+                    self._register_position(sym, pos)
             if self.positions:
                 logger.info(f"Restored {len(self.positions)} active positions from disk.")
             # Track initial file mtime
@@ -92,6 +119,7 @@ class PaperAccount:
         except Exception as e:
             logger.error(f"Failed to load positions: {e}")
 
+    @_synchronized
     def sync_positions(self):
         """
         Hot-reload: checks if the positions JSON file was modified externally
@@ -116,13 +144,14 @@ class PaperAccount:
                 if sym not in self.positions:
                     pos['entry_time'] = datetime.datetime.fromisoformat(pos['entry_time'])
                     self.positions[sym] = pos
+                    self._register_position(sym, pos)
                     new_count += 1
                     logger.info(f"📡 HOT-RELOAD: Picked up new position {sym} (added via dashboard)")
             
             # Find REMOVED positions (in memory but not on disk — closed via dashboard)
             removed = [sym for sym in self.positions if sym not in disk_data]
             for sym in removed:
-                del self.positions[sym]
+                self._unregister_position(sym, self.positions.pop(sym))
                 logger.info(f"📡 HOT-RELOAD: Position {sym} was removed externally (closed via dashboard)")
             
             self._last_file_mtime = current_mtime
@@ -133,6 +162,151 @@ class PaperAccount:
         except Exception as e:
             logger.error(f"Failed to sync positions: {e}")
 
+    def _position_symbols(self, symbol, pos):
+        """Returns every market-data symbol whose ticks can trigger an exit for this position."""
+        symbols = {symbol}
+        if pos.get('is_spread'):
+            if pos.get('sell_symbol'):
+                symbols.add(pos['sell_symbol'])
+            index_symbol = pos.get('index_symbol') or _underlying_index_symbol(symbol)
+            if index_symbol:
+                symbols.add(index_symbol)
+        return symbols
+
+    def _index_position(self, symbol, pos):
+        """Registers a position in the symbol -> positions reverse index."""
+        if pos.get('is_spread') and not pos.get('index_symbol'):
+            pos['index_symbol'] = _underlying_index_symbol(symbol)
+        for sub_symbol in self._position_symbols(symbol, pos):
+            self.symbol_index.setdefault(sub_symbol, set()).add(symbol)
+        spread = SpreadPosition.from_position(symbol, pos)
+        if spread is not None:
+            self.spreads[symbol] = spread
+
+    def _unindex_position(self, symbol, pos):
+        """Removes a position key from every reverse-index bucket it was registered in."""
+        self.spreads.pop(symbol, None)
+        for sub_symbol in self._position_symbols(symbol, pos):
+            keys = self.symbol_index.get(sub_symbol)
+            if keys is None:
+                continue
+            keys.discard(symbol)
+            if not keys:
+                del self.symbol_index[sub_symbol]
+
+    def _register_position(self, symbol, pos):
+        """Book-keeping for a newly opened/restored position: reverse index + used margin."""
+        self._index_position(symbol, pos)
+        self._used_margin += pos.get('net_debit', pos['sim_entry_price']) * pos['qty']
+
+    def _unregister_position(self, symbol, pos):
+        """Book-keeping for a closed/removed position (inverse of _register_position)."""
+        self._unindex_position(symbol, pos)
+        if self.positions:
+            self._used_margin -= pos.get('net_debit', pos['sim_entry_price']) * pos['qty']
+        else:
+            self._used_margin = 0.0  # Reset to avoid float drift once flat
+
+    def _reset_stats(self):
+        """Initialise the running trade statistics (session-scoped, like trade_log)."""
+        self._used_margin = 0.0
+        self._wins = 0
+        self._losses = 0
+        self._gross_profit = 0.0
+        self._gross_loss = 0.0  # Stored as a positive number
+        self._equity_high = self.balance
+        self._max_drawdown = 0.0
+
+    def _update_stats(self, net_pnl):
+        """O(1) update of the running aggregates after a trade is closed."""
+        if net_pnl > 0:
+            self._wins += 1
+            self._gross_profit += net_pnl
+        else:
+            self._losses += 1
+            self._gross_loss += -net_pnl
+        if self.balance > self._equity_high:
+            self._equity_high = self.balance
+        self._max_drawdown = max(self._max_drawdown, self._equity_high - self.balance)
+
+    @_synchronized
+    def get_stats(self):
+        """
+        Cheap snapshot of the running P&L statistics. Safe to call on a timer
+        from the trading loop (no DataFrame rebuild, no logging).
+        """
+        total_trades = self._wins + self._losses
+        return {
+            "balance": self.balance,
+            "realized_pnl": self.balance - self.initial_balance,
+            "used_margin": self._used_margin,
+            "available_balance": self.balance - self._used_margin,
+            "open_positions": len(self.positions),
+            "total_trades": total_trades,
+            "wins": self._wins,
+            "losses": self._losses,
+            "win_rate": (self._wins / total_trades) * 100 if total_trades > 0 else 0,
+            "gross_profit": self._gross_profit,
+            "gross_loss": self._gross_loss,
+            "profit_factor": self._gross_profit / self._gross_loss if self._gross_loss > 0 else float("inf"),
+            "avg_win": self._gross_profit / self._wins if self._wins > 0 else 0,
+            "avg_loss": -self._gross_loss / self._losses if self._losses > 0 else 0,
+            "equity_high": self._equity_high,
+            "max_drawdown": self._max_drawdown,
+        }
+
+    @_synchronized
+    def positions_for_symbol(self, symbol):
+        """
+        Returns [(position_key, position)] for positions affected by a tick on `symbol`
+        (index, buy leg or sell leg). O(affected positions), not O(all positions).
+        """
+        keys = self.symbol_index.get(symbol)
+        if not keys:
+            return []
+        return [(key, self.positions[key]) for key in list(keys) if key in self.positions]
+
+    def spreads_for_symbol(self, symbol):
+        """
+        Like positions_for_symbol(), but returns SpreadPosition views of the affected spreads.
+        Lock-free for symbols no position depends on (most ticks on the hot path).
+        """
+        if symbol not in self.symbol_index:
+            return []
+        with self._lock:
+            keys = self.symbol_index.get(symbol)
+            if not keys:
+                return []
+            spreads = self.spreads
+            return [spreads[key] for key in keys if key in spreads]
+
+    @_synchronized
+    def tracked_symbols(self):
+        """All symbols that open positions depend on (for WebSocket subscription)."""
+        return set(self.symbol_index)
+
+    @_synchronized
+    def flag_blind_positions(self, symbols, blind_seconds):
+        """
+        Marks every position that depends on any of `symbols` as having had no exit
+        checks for `blind_seconds` (market data outage). Returns the affected keys.
+        """
+        keys = set()
+        for symbol in symbols:
+            keys.update(self.symbol_index.get(symbol, ()))
+        flagged = []
+        for key in sorted(keys):
+            pos = self.positions.get(key)
+            if pos is None:
+                continue
+            pos['blind_gaps'] = pos.get('blind_gaps', 0) + 1
+            pos['blind_seconds'] = round(pos.get('blind_seconds', 0.0) + blind_seconds, 1)
+            flagged.append(key)
+        if flagged:
+            self._save_positions()
+        return flagged
+
+    @_synchronized
     def execute_buy(self, symbol, quantity, 
                     sim_entry_price, sim_stop_loss_price, sim_take_profit_price,
                     index_entry_price, index_stop_loss_price, index_take_profit_price):
@@ -149,8 +323,7 @@ class PaperAccount:
         # unless we want to implement specific margin rules. 
         # For now, let's assume 1x margin (Cash & Carry) for simplicity or match the log logic.
         
-        used_margin = sum(p['sim_entry_price'] * p['qty'] for p in self.positions.values())
-        available_balance = self.balance - used_margin
+        available_balance = self.balance - self._used_margin
         
         cost = sim_entry_price * quantity
         
@@ -160,12 +333,12 @@ class PaperAccount:
             
         # We don't deduct balance here, we do it on P&L settlement for simplicity
         
-        trade_id = int(datetime.datetime.now().timestamp())
+        trade_id = int(market_clock.now().timestamp())
         self.positions[symbol] = {
             "id": trade_id,
             "qty": quantity,
             "direction": "LONG",
-            "entry_time": datetime.datetime.now(),
+            "entry_time": market_clock.now(),
             
             # 1. Prices for P&L (Simulated Option)
             "sim_entry_price": sim_entry_price,
@@ -177,6 +350,7 @@ class PaperAccount:
             "index_stop_loss_price": index_stop_loss_price,
             "index_take_profit_price": index_take_profit_price,
         }
+        self._register_position(symbol, self.positions[symbol])
         logger.info("--- POSITION OPENED ---")
         logger.info(f"   Symbol: {symbol} | Qty: {quantity} | Entry: ₹{sim_entry_price:,.2f}")
         logger.info(f"   SL (Option): ₹{sim_stop_loss_price:,.2f} | TP (Option): ₹{sim_take_profit_price:,.2f}")
@@ -184,6 +358,7 @@ class PaperAccount:
         
         self._save_positions()
 
+    @_synchronized
     def execute_sell(self, symbol, quantity, 
                      sim_entry_price, sim_stop_loss_price, sim_take_profit_price,
                      index_entry_price, index_stop_loss_price, index_take_profit_price):
@@ -199,12 +374,12 @@ class PaperAccount:
             logger.error(f"Cannot execute SELL for {symbol}. Cost (₹{cost:,.2f}) exceeds balance (₹{self.balance:,.2f}).")
             return
             
-        trade_id = int(datetime.datetime.now().timestamp())
+        trade_id = int(market_clock.now().timestamp())
         self.positions[symbol] = {
             "id": trade_id,
             "qty": quantity,
             "direction": "SHORT",
-            "entry_time": datetime.datetime.now(),
+            "entry_time": market_clock.now(),
             
             # 1. Prices for P&L (Simulated Option)
             "sim_entry_price": sim_entry_price,
@@ -216,6 +391,7 @@ class PaperAccount:
             "index_stop_loss_price": index_stop_loss_price,
             "index_take_profit_price": index_take_profit_price,
         }
+        self._register_position(symbol, self.positions[symbol])
         logger.info("--- POSITION OPENED (SHORT) ---")
         logger.info(f"   Symbol: {symbol} | Qty: {quantity} | Entry: ₹{sim_entry_price:,.2f}")
         logger.info(f"   SL (Option): ₹{sim_stop_loss_price:,.2f} | TP (Option): ₹{sim_take_profit_price:,.2f}")
@@ -223,11 +399,12 @@ class PaperAccount:
         
         self._save_positions()
 
+    @_synchronized
     def execute_spread(self, buy_symbol, sell_symbol, quantity, 
                        buy_premium, sell_premium, net_debit,
                        max_profit, profit_target,
                        index_entry_price, index_stop_loss_price, spread_width,
-                       direction="LONG"):
+                       direction="LONG", index_symbol=None):
         """
         Executes a simulated DEBIT SPREAD order.
         Buys ATM option + Sells OTM option as a single position.
@@ -245,21 +422,21 @@ class PaperAccount:
             index_stop_loss_price: Index price where we exit
             spread_width: Distance between strikes in points
             direction: "LONG" for bullish CE spread, "SHORT" for bearish PE spread
+            index_symbol: Underlying index symbol whose ticks drive the SL (derived from buy_symbol if omitted)
         """
         if buy_symbol in self.positions:
             logger.warning(f"Already holding {buy_symbol}. Spread order ignored.")
             return
 
         # Check balance against net debit cost
-        used_margin = sum(p.get('net_debit', p['sim_entry_price']) * p['qty'] for p in self.positions.values())
-        available_balance = self.balance - used_margin
+        available_balance = self.balance - self._used_margin
         cost = net_debit * quantity
         
         if cost > available_balance:
             logger.error(f"Cannot execute SPREAD. Cost ₹{cost:,.2f} exceeds available ₹{available_balance:,.2f}")
             return
 
-        trade_id = int(datetime.datetime.now().timestamp())
+        trade_id = int(market_clock.now().timestamp())
         
         # TP on index: not used for spreads (we exit on premium target)
         # We use net_debit as sim_entry_price for P&L calculation on dashboard
@@ -269,7 +446,7 @@ class PaperAccount:
             "id": trade_id,
             "qty": quantity,
             "direction": f"LONG SPREAD ({direction})", # Makes dashboard say "LONG SPREAD (SHORT)"
-            "entry_time": datetime.datetime.now(),
+            "entry_time": market_clock.now(),
             
             # Premium prices (for dashboard P&L display)
             "sim_entry_price": net_debit,           # What we paid (net debit per unit)
@@ -280,6 +457,7 @@ class PaperAccount:
             "index_entry_price": index_entry_price,
             "index_stop_loss_price": index_stop_loss_price,
             "index_take_profit_price": 0,  # Not used for spreads (premium-based TP)
+            "index_symbol": index_symbol or _underlying_index_symbol(buy_symbol),
             
             # Spread-specific fields
             "is_spread": True,
@@ -292,6 +470,8 @@ class PaperAccount:
             "spread_width": spread_width,
         }
         
+        self._register_position(buy_symbol, self.positions[buy_symbol])
+        
         logger.info("--- SPREAD POSITION OPENED ---")
         logger.info(f"   BUY:  {buy_symbol} @ ₹{buy_premium:,.2f}")
         logger.info(f"   SELL: {sell_symbol} @ ₹{sell_premium:,.2f}")
@@ -301,6 +481,7 @@ class PaperAccount:
         
         self._save_positions()
 
+    @_synchronized
     def _close_position(self, symbol, exit_reason, index_exit_price):
         """
         Internal function to close a position and log the trade.
@@ -309,7 +490,8 @@ class PaperAccount:
             return
 
         pos = self.positions.pop(symbol)
-        exit_time = datetime.datetime.now()
+        self._unregister_position(symbol, pos)
+        exit_time = market_clock.now()
         
         sim_exit_price = 0
         pnl = 0
@@ -350,6 +532,7 @@ class PaperAccount:
         net_pnl = gross_pnl - brokerage
             
         self.balance += net_pnl
+        self._update_stats(net_pnl)
         
         # Determine symbol name for logging
         display_symbol = symbol 
@@ -365,7 +548,8 @@ class PaperAccount:
             "entry_time": pos['entry_time'], "exit_time": exit_time,
             "stop_loss": pos['sim_stop_loss_price'], "take_profit": pos['sim_take_profit_price'],
             "pnl": net_pnl,
-            "brokerage": brokerage
+            "brokerage": brokerage,
+            "exit_reason": exit_reason
         }
         
         self.trade_log.append(trade_data)
@@ -378,6 +562,7 @@ class PaperAccount:
         self._save_positions()
 
 
+    @_synchronized
     def check_positions_for_exit(self, symbol, current_high, current_low):
         """
         This is the new backtesting exit logic.
@@ -404,6 +589,7 @@ class PaperAccount:
             elif pos['index_take_profit_price'] > 0 and current_low <= pos['index_take_profit_price']:
                 self._close_position(symbol, "TAKE-PROFIT", pos['index_take_profit_price'])
 
+    @_synchronized
     def close_all_positions(self, reason="END_OF_DAY", current_prices=None):
         """
         Closes all open positions immediately.
@@ -439,25 +625,22 @@ class PaperAccount:
                 self._close_position(symbol, "MARKET_EXIT", pos['sim_entry_price'])
                 logger.warning(f"   No LTP available for {symbol}, closed at entry price.")
             
+    @_synchronized
     def close_position_at_market(self, symbol, ltp):
         """Closes a specific position at the given market price (LTP)."""
         if symbol in self.positions:
              self._close_position(symbol, "MARKET_EXIT", ltp)
 
 
+    @_synchronized
     def get_summary(self):
+        stats = self.get_stats()
         logger.info("--- Trading Summary ---")
         logger.info(f"Initial Balance: Rs {self.initial_balance:,.2f}")
         logger.info(f"Final Balance:   Rs {self.balance:,.2f}")
-        
-        total_pnl = self.balance - self.initial_balance
-        logger.info(f"Total P&L (Realized): Rs {total_pnl:,.2f}")
-        
-        used_margin = sum(p['sim_entry_price'] * p['qty'] for p in self.positions.values())
-        available_balance = self.balance - used_margin
-        
-        logger.info(f"Used Margin:     Rs {used_margin:,.2f}")
-        logger.info(f"Available Bal:   Rs {available_balance:,.2f}")
+        logger.info(f"Total P&L (Realized): Rs {stats['realized_pnl']:,.2f}")
+        logger.info(f"Used Margin:     Rs {stats['used_margin']:,.2f}")
+        logger.info(f"Available Bal:   Rs {stats['available_balance']:,.2f}")
         
         if self.positions:
             logger.info(f"--- Active Positions: {len(self.positions)} ---")
@@ -467,34 +650,17 @@ class PaperAccount:
         else:
             logger.info("--- No Active Positions ---")
 
-        if not self.trade_log:
+        if stats['total_trades'] == 0:
             logger.info("No closed trades yet.")
             return
 
-        try:
-            log_df = pd.DataFrame(self.trade_log)
-            total_trades = len(log_df)
-            wins = log_df[log_df['pnl'] > 0]
-            losses = log_df[log_df['pnl'] <= 0]
-            
-            win_rate = (len(wins) / total_trades) * 100 if total_trades > 0 else 0
-            
-            total_profit = wins['pnl'].sum()
-            total_loss = abs(losses['pnl'].sum())
-            
-            profit_factor = total_profit / total_loss if total_loss > 0 else "inf"
-            avg_win = wins['pnl'].mean() if len(wins) > 0 else 0
-            avg_loss = losses['pnl'].mean() if len(losses) > 0 else 0
-
-            logger.info(f"Full trade log saved to {self.log_filename}")
-            logger.info(f"Total Closed Trades: {total_trades}")
-            logger.info(f"   > Profitable:     {len(wins)}")
-            logger.info(f"   > Unprofitable:   {len(losses)}")
-            logger.info(f"Win Rate:            {win_rate:.2f}%")
-            logger.info(f"Profit Factor:       {profit_factor}")
-            logger.info(f"Average Win:         ₹{avg_win:,.2f}")
-            logger.info(f"Average Loss:        ₹{avg_loss:,.2f}")
-        
-        except Exception as e:
-            logger.error(f"Error generating summary: {e}")
-
+        profit_factor = stats['profit_factor'] if stats['gross_loss'] > 0 else "inf"
+        logger.info(f"Full trade log saved to {self.log_filename}")
+        logger.info(f"Total Closed Trades: {stats['total_trades']}")
+        logger.info(f"   > Profitable:     {stats['wins']}")
+        logger.info(f"   > Unprofitable:   {stats['losses']}")
+        logger.info(f"Win Rate:            {stats['win_rate']:.2f}%")
+        logger.info(f"Profit Factor:       {profit_factor}")
+        logger.info(f"Average Win:         ₹{stats['avg_win']:,.2f}")
+        logger.info(f"Average Loss:        ₹{stats['avg_loss']:,.2f}")
+        logger.info(f"Equity High:         ₹{stats['equity_high']:,.2f} (Max DD: ₹{stats['max_drawdown']:,.2f})")
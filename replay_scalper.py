@@ -0,0 +1,340 @@
+# replay_scalper.py - Deterministic Offline Replay of the Live ORB Scalper Loop
+# ============================================================================
+# Drives options_scalper_main.process_tick_batch() -- the production loop body,
+# not a re-implementation -- from recorded (tick_journal) or synthetic ticks.
+# Session time comes from a simulated market_clock, the broker is an in-process
+# stub, and ticks are handed to the loop one WebSocket message at a time, so the
+# same input always produces the same decisions at any replay speed.
+#
+# Usage:
+#   python replay_scalper.py --synthetic --seed 7 --speed max
+#   python replay_scalper.py --date 2026-03-02 --source options_scalper_main --speed 100
+#   python replay_scalper.py --synthetic --speed max --live-orders   # exercise the order path on the stub
+
+import argparse
+import datetime
+import itertools
+import logging
+import os
+import random
+import time
+from collections import Counter
+import numpy as np
+import pandas as pd
+
+import config
+import fyers_client
+import market_clock
+import options_scalper_main as scalper
+import orb_scalper_strategy
+import tick_journal
+from bar_builder import BarBuilder
+from latency_stats import LatencyRecorder
+from market_data_store import ConflatingMarketDataStore, DepthStore
+from order_gateway import OrderGateway
+from margin_service import MarginService
+from order_book import OrderBook
+from limit_pricer import LimitPricer
+from paper_trader import PaperAccount
+
+logger = logging.getLogger(__name__)
+
+REPLAY_DIR = os.path.join("data", "replay")
+
+# Synthetic session parameters: (spot at open, per-second sigma in points, strike step)
+SYNTHETIC_INDICES = {
+    "NSE:NIFTY50-INDEX": ("NIFTY", 25000.0, 0.8, 50),
+    "NSE:NIFTYBANK-INDEX": ("BANKNIFTY", 56000.0, 2.5, 100),
+}
+SYNTHETIC_CHAIN_STRIKES = 20   # Listed strikes each side of the opening ATM
+SYNTHETIC_TICKED_STRIKES = 6   # Strikes each side of the running ATM that receive ticks
+SYNTHETIC_TREND_MINUTES = 60   # Directional drift lasts this long after the opening range
+SYNTHETIC_BOOK_SIZE = 900      # Displayed bid/ask size on synthetic option ticks (units)
+
+
+class StubBroker:
+    """
+    FyersModel stand-in: quotes come from the replayed ticks, orders are acked instantly.
+    With an order book attached, every leg is also reported filled in full before the
+    ack returns (limit legs at their limit, market legs at the replayed LTP).
+    """
+
+    def __init__(self, market_data, balance, order_book=None):
+        self.market_data = market_data
+        self.balance = balance
+        self.order_book = order_book
+        self.token = "replay"
+        self.orders = []
+
+    def quotes(self, data):
+        quotes = []
+        for symbol in data["symbols"].split(","):
+            tick = self.market_data.get(symbol)
+            if tick is not None:
+                quotes.append({"n": symbol, "s": "ok", "v": {
+                    "symbol": symbol, "lp": tick.ltp, "bid": tick.bid, "ask": tick.ask}})
+        return {"s": "ok", "d": quotes} if quotes else {"s": "error", "message": "no replayed quote"}
+
+    def history(self, data):
+        return {"s": "no_data", "candles": []}  # ORB must come from the replayed ticks
+
+    def _ack(self, data):
+        self.orders.append(data)
+        order_id = f"REPLAY-{len(self.orders)}"
+        if self.order_book is not None:
+            for leg in data.get("legs") or [data]:
+                tick = self.market_data.get(leg["symbol"])
+                price = leg["limitPrice"] if leg.get("type") == 1 else (tick.ltp if tick is not None else 0.0)
+                self.order_book.on_order({"id": order_id, "symbol": leg["symbol"], "side": leg["side"], "qty": leg["qty"],
+                                          "filledQty": leg["qty"], "tradedPrice": price, "status": 2})
+        return {"s": "ok", "id": order_id}
+
+    def place_order(self, data):
+        return self._ack(data)
+
+    def place_multileg_order(self, data):
+        return self._ack(data)
+
+    def funds(self):
+        return {"s": "ok", "fund_limit": [{"id": 10, "title": "Available Balance", "equityAmount": self.balance}]}
+
+    def market_status(self):
+        return {"s": "ok"}
+
+
+class StubSocket:
+    """Records (un)subscribe calls the loop makes; replayed ticks are not filtered by them."""
+
+    def __init__(self):
+        self.subscribed = set()
+
+    def subscribe(self, symbols, data_type=None):
+        self.subscribed.update(symbols)
+
+    def unsubscribe(self, symbols, data_type=None):
+        self.subscribed.difference_update(symbols)
+
+    def is_connected(self):
+        return True
+
+
+# --- Tick sources: iterables of (recv_ts_seconds, [tick, ...]) ---
+
+def recorded_messages(date, source):
+    """Messages from a tick journal segment, regrouped by receive timestamp."""
+    ticks = tick_journal.iter_ticks(date, source)
+    for recv_ns, group in itertools.groupby(ticks, key=lambda t: t["recv_ns"]):
+        yield recv_ns / 1e9, list(group)
+
+
+def _option_symbol(root, expiry, strike, option_type):
+    return f"NSE:{root}{expiry.strftime('%y%b').upper()}{int(strike)}{option_type}"
+
+
+def _option_price(spot, strike, option_type, step):
+    intrinsic = max(spot - strike, 0.0) if option_type == "CE" else max(strike - spot, 0.0)
+    time_value = 0.004 * spot * np.exp(-abs(spot - strike) / (4 * step))
+    return max(round((intrinsic + time_value) * 20) / 20, 0.05)
+
+
+def synthetic_session(date, seed, end_time, tick_interval=1.0):
+    """
+    Builds a seeded random-walk session for NIFTY/BANKNIFTY (with a directional
+    drift for SYNTHETIC_TREND_MINUTES after the opening range) plus an option
+    chain priced off spot.
+    Returns (symbol_master_df, message_iterator).
+    """
+    rng = random.Random(seed)
+    expiry = date + datetime.timedelta(days=(3 - date.weekday()) % 7 or 7)
+    expiry_epoch = int(datetime.datetime.combine(expiry, datetime.time(15, 30)).timestamp())
+    rows = []
+    for _, (root, spot, _, step) in SYNTHETIC_INDICES.items():
+        atm = round(spot / step) * step
+        for k in range(-SYNTHETIC_CHAIN_STRIKES, SYNTHETIC_CHAIN_STRIKES + 1):
+            for option_type in ("CE", "PE"):
+                strike = atm + k * step
+                rows.append({8: expiry_epoch, 9: _option_symbol(root, expiry, strike, option_type),
+                             13: root, 15: float(strike), 16: option_type})
+    master = pd.DataFrame(rows)
+
+    def messages():
+        start = datetime.datetime.combine(date, datetime.time(9, 14, 30)).timestamp()
+        trend_start = datetime.datetime.combine(date, datetime.time(9, 30)).timestamp()
+        trend_end = trend_start + SYNTHETIC_TREND_MINUTES * 60
+        end = datetime.datetime.combine(date, end_time).timestamp()
+        state = {sym: spot for sym, (_, spot, _, _) in SYNTHETIC_INDICES.items()}
+        drift = {sym: rng.choice((-1, 1)) * sigma * 0.03 for sym, (_, _, sigma, _) in SYNTHETIC_INDICES.items()}
+        volume = 0
+        ts, n = start, 0
+        while ts < end:
+            batch = []
+            for sym, (root, _, sigma, step) in SYNTHETIC_INDICES.items():
+                state[sym] += rng.gauss(drift[sym] if trend_start <= ts < trend_end else 0.0, sigma)
+                spot = round(state[sym] * 20) / 20
+                volume += rng.randint(1, 50)
+                batch.append({"symbol": sym, "ltp": spot, "exch_feed_time": int(ts), "vol_traded_today": volume})
+                if n % 2 == 0:  # Option ladder ticks every other second
+                    atm = round(spot / step) * step
+                    for k in range(-SYNTHETIC_TICKED_STRIKES, SYNTHETIC_TICKED_STRIKES + 1):
+                        strike = atm + k * step
+                        for option_type in ("CE", "PE"):
+                            price = _option_price(spot, strike, option_type, step)
+                            batch.append({"symbol": _option_symbol(root, expiry, strike, option_type),
+                                          "ltp": price, "bid_price": max(price - 0.05, 0.05),
+                                          "ask_price": price + 0.05, "bid_size": SYNTHETIC_BOOK_SIZE,
+                                          "ask_size": SYNTHETIC_BOOK_SIZE, "exch_feed_time": int(ts)})
+            yield ts, batch
+            ts += tick_interval
+            n += 1
+
+    return master, messages()
+
+
+# --- Harness ---
+
+def _reset_scalper(live_orders, balance):
+    """Point the scalper module at fresh replay state, a stub broker and a stub socket."""
+    os.makedirs(REPLAY_DIR, exist_ok=True)
+    positions_file = os.path.join(REPLAY_DIR, "paper_positions_replay.json")
+    if os.path.exists(positions_file):
+        os.remove(positions_file)
+
+    orb_scalper_strategy.reset_state()
+    scalper.market_data = ConflatingMarketDataStore()
+    scalper.depth_book = DepthStore()
+    scalper.limit_pricer = LimitPricer(scalper.market_data, scalper.depth_book)
+    scalper.bar_builder = BarBuilder()
+    scalper.latency = LatencyRecorder()
+    scalper.order_book = OrderBook(latency=scalper.latency) if live_orders else None
+    scalper.fyers_model = StubBroker(scalper.market_data, balance, order_book=scalper.order_book)
+    scalper.fyers_socket = StubSocket()
+    scalper.paper_account = PaperAccount(initial_balance=balance, filename=positions_file,
+                                         log_filename=os.path.join(REPLAY_DIR, "trade_log_replay.csv"))
+    scalper.order_gateway = OrderGateway(scalper.fyers_model, order_book=scalper.order_book)
+    scalper.LIVE_TRADING = live_orders
+    scalper.margin_service = MarginService(scalper.fyers_model, inline=True).start() if live_orders else None
+    scalper._latest_ltp.clear()
+    scalper._option_ladders.clear()
+    scalper._feed_gaps.clear()
+    scalper._pending_entries.clear()
+    scalper.currently_subscribed = set(scalper.SYMBOLS_TO_TRADE.values())
+    scalper.depth_subscribed = set()
+    scalper._start_workers(inline=True)  # Same worker code path, run on the replay thread
+    scalper._schedule_session()  # Timetable on the simulated clock
+
+
+def run_replay(messages, speed=None, live_orders=False, balance=None):
+    """
+    Replays `messages` through the scalper loop. `speed` is a multiple of real time
+    (1 = real time, 100 = 100x) or None for as fast as possible.
+    Returns a report dict.
+    """
+    messages = iter(messages)
+    first = next(messages, None)
+    if first is None:
+        raise ValueError("Nothing to replay")
+
+    clock = market_clock.SimulatedClock(first[0])
+    market_clock.use(clock)
+    try:
+        _reset_scalper(live_orders, balance or config.ACCOUNT_BALANCE)
+        entries, rejected = Counter(), Counter()
+        execute_spread = scalper.paper_account.execute_spread
+
+        def counting_execute_spread(*args, **kwargs):
+            key = f"{scalper.INDEX_NAMES.get(kwargs.get('index_symbol'))} {kwargs.get('direction')}"
+            opened_before = len(scalper.paper_account.positions)
+            result = execute_spread(*args, **kwargs)
+            (entries if len(scalper.paper_account.positions) > opened_before else rejected)[key] += 1
+            return result
+
+        scalper.paper_account.execute_spread = counting_execute_spread
+
+        n_messages = n_ticks = 0
+        session_over = False
+        wall_start = time.perf_counter()
+        for recv_ts, ticks in itertools.chain([first], messages):
+            if speed:
+                delay = (recv_ts - first[0]) / speed - (time.perf_counter() - wall_start)
+                if delay > 0:
+                    time.sleep(delay)
+            clock.set(recv_ts)
+            scalper.on_index_tick(ticks)
+            dequeue_ns, batch = scalper._drain_tick_batch(timeout=0)
+            n_messages += 1
+            n_ticks += len(ticks)
+            if not scalper.process_tick_batch(dequeue_ns, batch):
+                session_over = True
+                break
+        wall = time.perf_counter() - wall_start
+
+        account = scalper.paper_account
+        return {
+            "messages": n_messages,
+            "ticks": n_ticks,
+            "wall_seconds": wall,
+            "ticks_per_sec": n_ticks / wall if wall > 0 else 0.0,
+            "sim_start": datetime.datetime.fromtimestamp(first[0]),
+            "sim_end": market_clock.now(),
+            "speedup": (clock.ts - first[0]) / wall if wall > 0 else 0.0,
+            "session_over": session_over,
+            "entries": dict(entries),
+            "rejected_entries": dict(rejected),  # Signals the account refused (duplicate leg / balance)
+            "exits": dict(Counter(t.get("exit_reason") for t in account.trade_log)),
+            "open_positions": len(account.positions),
+            "stub_orders": len(scalper.fyers_model.orders),
+            "stats": account.get_stats(),
+            "latency": scalper.latency.snapshot(),
+        }
+    finally:
+        market_clock.use(None)
+
+
+def print_report(report):
+    stats = report["stats"]
+    print("=" * 60)
+    print(f"Replayed {report['sim_start']} -> {report['sim_end']}"
+          f"{' (EOD reached)' if report['session_over'] else ''}")
+    print(f"  {report['ticks']:,} ticks in {report['messages']:,} messages, {report['wall_seconds']:.2f} s wall "
+          f"-> {report['ticks_per_sec']:,.0f} ticks/sec ({report['speedup']:,.0f}x real time)")
+    print(f"  Entries: {report['entries'] or 'none'} | Rejected by account: {report['rejected_entries'] or 'none'}")
+    print(f"  Exits:   {report['exits'] or 'none'} | Still open: {report['open_positions']} | "
+          f"Stub broker orders: {report['stub_orders']}")
+    print(f"  P&L: ₹{stats['realized_pnl']:,.2f} | Trades: {stats['total_trades']} "
+          f"(W {stats['wins']} / L {stats['losses']}) | Max DD: ₹{stats['max_drawdown']:,.2f}")
+    for name, s in report["latency"].items():
+        print(f"  ⏱️ {name:<36} n={s['count']:<8} p50 {s['p50_ms']:.3f}  p99 {s['p99_ms']:.3f}  max {s['max_ms']:.3f} ms")
+    print("=" * 60)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay ticks through the live ORB scalper loop offline.")
+    parser.add_argument("--date", type=datetime.date.fromisoformat, default=datetime.date.today(),
+                        help="Session date (journal segment to read, or synthetic session date)")
+    parser.add_argument("--source", default="options_scalper_main", help="Tick journal source to replay")
+    parser.add_argument("--synthetic", action="store_true", help="Generate a seeded synthetic session instead")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--until", type=datetime.time.fromisoformat, default=datetime.time(15, 1),
+                        help="Synthetic session end (past 15:00 exercises the EOD square-off)")
+    parser.add_argument("--speed", default="max", help="Replay speed: 1, 100, ... or 'max'")
+    parser.add_argument("--live-orders", action="store_true", help="Run the LIVE_TRADING order path against the stub broker")
+    parser.add_argument("--balance", type=float, default=None, help="Paper balance (default: config.ACCOUNT_BALANCE)")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(args.log_level.upper())
+    for handler in logging.getLogger().handlers:
+        handler.setLevel(args.log_level.upper())
+
+    if args.synthetic:
+        master, messages = synthetic_session(args.date, args.seed, args.until)
+        fyers_client.install_symbol_master(master)
+    else:
+        messages = recorded_messages(args.date, args.source)
+
+    speed = None if args.speed == "max" else float(args.speed)
+    print_report(run_replay(messages, speed=speed, live_orders=args.live_orders, balance=args.balance))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# scheduler.py - Monotonic Task Scheduler (Periodic + Wall-Clock Tasks)
+# =====================================================================
+# A binary heap of (due, seq, task) on market_clock.monotonic(). The owner
+# calls run_pending() from its loop and waits at most time_until_next() for
+# input, so periodic housekeeping and wall-clock deadlines (trading window,
+# EOD square-off) fire on time whether or not ticks arrive. Checking for due
+# work is a single float comparison: no datetime objects on the tick path.
+#
+# Wall-clock times are converted to a monotonic deadline once, when the task
+# is scheduled. Under the replay's SimulatedClock both clocks are the session
+# timestamp, so tasks fire at the same simulated instant on every run.
+
+import datetime
+import heapq
+import itertools
+import logging
+
+import market_clock
+
+logger = logging.getLogger(__name__)
+
+
+class ScheduledTask:
+    """Handle returned by Scheduler.every()/at(); pass it to cancel()."""
+
+    __slots__ = ("name", "fn", "interval", "cancelled", "runs")
+
+    def __init__(self, name, fn, interval=None):
+        self.name = name
+        self.fn = fn
+        self.interval = interval  # Seconds between runs, or None for one-shot
+        self.cancelled = False
+        self.runs = 0
+
+
+class Scheduler:
+    """Single-threaded: every method is called from the owning loop's thread."""
+
+    def __init__(self):
+        self._heap = []
+        self._seq = itertools.count()  # FIFO among tasks due at the same instant
+
+    def _push(self, due, task):
+        heapq.heappush(self._heap, (due, next(self._seq), task))
+        return task
+
+    def every(self, interval, fn, name=None, first_delay=0.0):
+        """
+        Runs fn() every `interval` seconds, first after `first_delay`. The next run is
+        counted from the end of the previous one, so a stalled loop doesn't burst-catch-up.
+        """
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        task = ScheduledTask(name or fn.__name__, fn, interval)
+        return self._push(market_clock.monotonic() + first_delay, task)
+
+    def at(self, wall_time, fn, name=None):
+        """Runs fn() once at today's `wall_time` (datetime.time); on the next pass if that's already past."""
+        now = market_clock.now()
+        delay = (datetime.datetime.combine(now.date(), wall_time) - now).total_seconds()
+        return self._push(market_clock.monotonic() + delay, ScheduledTask(name or fn.__name__, fn))
+
+    def cancel(self, task):
+        task.cancelled = True  # Dropped lazily when it reaches the top of the heap
+
+    def time_until_next(self):
+        """Seconds until the earliest task is due (0 if overdue), or None if nothing is scheduled."""
+        while self._heap and self._heap[0][2].cancelled:
+            heapq.heappop(self._heap)
+        if not self._heap:
+            return None
+        return max(self._heap[0][0] - market_clock.monotonic(), 0.0)
+
+    def run_pending(self):
+        """Runs every task that is due, in due order. Returns the number of tasks run."""
+        heap = self._heap
+        if not heap:
+            return 0
+        now = market_clock.monotonic()
+        if heap[0][0] > now:
+            return 0
+        ran = 0
+        while heap and heap[0][0] <= now:
+            _, _, task = heapq.heappop(heap)
+            if task.cancelled:
+                continue
+            try:
+                task.fn()
+            except Exception as e:
+                logger.error(f"Scheduled task {task.name} failed: {e}", exc_info=True)
+            task.runs += 1
+            ran += 1
+            if task.interval is not None and not task.cancelled:
+                self._push(market_clock.monotonic() + task.interval, task)
+        return ran
@@ -0,0 +1,325 @@
+# sharded_feed.py - Sharded Multi-Connection Market Data Ingestion
+# ================================================================
+# Spreads subscriptions over several WebSocket connections by a stable symbol
+# hash, so a large universe (NIFTY 200 + option ladders) is decoded in
+# parallel instead of on a single SDK callback thread.
+#
+# The SDK's FyersDataSocket is a per-process singleton, so against the real
+# broker each shard runs in its own child process (its own ResilientFeed) and
+# forwards tick batches over a multiprocessing queue. Children reuse the
+# parent's client id and access token: they never log in themselves, so a
+# stale token can't drop a headless child into the interactive token flow. Against the local
+# simulator (FYERS_SIM_URL) shards can also run as threads in-process.
+#
+# Every symbol lives on exactly one shard and each shard is delivered by one
+# FIFO receiver thread, so the merged stream stays in order per symbol.
+# Per-shard throughput and lag are tracked and logged with log_report().
+#
+# Usage (bench against the simulator):
+#   python sharded_feed.py --shards 4 --symbols 400 --seconds 20
+
+import argparse
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import zlib
+from collections import deque
+
+import fyers_client
+import tick_journal
+from feed_manager import ResilientFeed
+from latency_stats import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SHARDS = 4
+FORWARD_INTERVAL = 0.002  # Child-side batching window before a batch is pushed to the parent
+STATS_INTERVAL = 1.0      # Child -> parent feed stats cadence
+
+
+def shard_for(symbol, shards):
+    """Stable shard number for a symbol (same on every run and in every process)."""
+    return zlib.crc32(symbol.encode()) % shards
+
+
+def _max_exch_ts(ticks):
+    return max((t.get('exch_feed_time') or 0 for t in ticks if isinstance(t, dict)), default=0)
+
+
+# --- Child process ---
+
+def _shard_process(shard_id, client_id, access_token, symbols, history_symbols, out_queue, cmd_queue):
+    """Runs one shard's ResilientFeed and forwards batched ticks, gaps and stats to the parent."""
+    logging.basicConfig(level=logging.INFO, format=f"[feed shard {shard_id}] %(message)s")
+    if not access_token:
+        out_queue.put(("error", shard_id, "no access token from the parent process"))
+        return
+    fyers = fyers_client.fyers_model_for_token(client_id, access_token)
+
+    pending = deque()
+    wake = threading.Event()
+
+    def on_tick(message):
+        pending.append((time.monotonic_ns(), message))
+        wake.set()
+
+    feed = ResilientFeed(fyers, on_tick, symbols, history_symbols=history_symbols, record_ticks=False,
+                         on_gap=lambda gap: out_queue.put(("gap", shard_id, gap))).start()
+    stop = threading.Event()
+
+    def apply_commands():
+        while True:
+            command, args = cmd_queue.get()
+            if command == "subscribe":
+                feed.subscribe(*args)
+            elif command == "unsubscribe":
+                feed.unsubscribe(*args)
+            elif command == "stop":
+                stop.set()
+                wake.set()
+                return
+
+    threading.Thread(target=apply_commands, daemon=True).start()
+    next_stats = time.monotonic()
+    while not stop.is_set():
+        wake.wait(STATS_INTERVAL)
+        wake.clear()
+        time.sleep(FORWARD_INTERVAL)  # Let a burst accumulate into one batch
+        ticks, first_recv_ns = [], None
+        for _ in range(len(pending)):
+            recv_ns, message = pending.popleft()
+            first_recv_ns = first_recv_ns or recv_ns
+            if isinstance(message, list):
+                ticks.extend(message)
+            else:
+                ticks.append(message)
+        if ticks:
+            out_queue.put(("ticks", shard_id, first_recv_ns, ticks))
+        if time.monotonic() >= next_stats:
+            next_stats = time.monotonic() + STATS_INTERVAL
+            out_queue.put(("stats", shard_id, dict(feed.stats, connected=feed.is_connected())))
+    feed.close_connection()
+
+
+# --- Parent ---
+
+class _Shard:
+    """Parent-side bookkeeping for one connection."""
+
+    def __init__(self, shard_id):
+        self.shard_id = shard_id
+        self.symbols = set()
+        self.messages = 0
+        self.ticks = 0
+        self.report_ticks = 0            # Ticks since the last log_report()
+        self.handoff = LatencyHistogram()  # Child receive -> parent delivery (process mode)
+        self.exch_lag = LatencyHistogram()  # Exchange timestamp -> receive (1 s resolution)
+        self.feed_stats = {}
+        self.feed = None      # ResilientFeed (thread mode)
+        self.process = None   # Child process (process mode)
+        self.cmd_queue = None
+        self.out_queue = None
+
+
+class ShardedFeed:
+    """
+    Socket-compatible feed (subscribe/unsubscribe/keep_running/close_connection/
+    is_connected) backed by `shards` connections. `on_tick` may be called from
+    several receiver threads at once, so it must be thread-safe (the conflating
+    store and BarBuilder are).
+    """
+
+    def __init__(self, fyers_instance, on_tick, symbols, shards=DEFAULT_SHARDS, processes=None,
+                 bar_builder=None, history_symbols=(), on_gap=None, record_ticks=True):
+        self.fyers = fyers_instance
+        self.on_tick = on_tick
+        self.shards = [_Shard(i) for i in range(shards)]
+        # Threads only work where each shard gets its own socket object (the simulator)
+        self.processes = (not fyers_client.SIM_SERVER_URL) if processes is None else processes
+        if not self.processes and not fyers_client.SIM_SERVER_URL and shards > 1:
+            logger.warning("FyersDataSocket is a per-process singleton: using one process per shard")
+            self.processes = True
+        self.bar_builder = bar_builder
+        self.history_symbols = set(history_symbols)
+        self.on_gap = on_gap
+        self.journal = tick_journal.get_journal() if record_ticks else None
+        self._stop = threading.Event()
+        self._report_ts = time.monotonic()
+        for symbol in symbols:
+            self.shards[shard_for(symbol, len(self.shards))].symbols.add(symbol)
+
+    def _group(self, symbols):
+        groups = {}
+        for symbol in symbols:
+            groups.setdefault(shard_for(symbol, len(self.shards)), []).append(symbol)
+        return groups
+
+    def start(self):
+        if self.processes:
+            ctx = multiprocessing.get_context("spawn")  # No forking of a threaded parent
+            for shard in self.shards:
+                shard.cmd_queue = ctx.Queue()
+                shard.out_queue = ctx.Queue()
+                history = sorted(self.history_symbols & shard.symbols)
+                shard.process = ctx.Process(target=_shard_process, name=f"feed-shard-{shard.shard_id}", daemon=True,
+                                            args=(shard.shard_id, self.fyers.client_id, self.fyers.token,
+                                                  sorted(shard.symbols), history, shard.out_queue, shard.cmd_queue))
+                shard.process.start()
+                threading.Thread(target=self._receive, args=(shard,), name=f"feed-rx-{shard.shard_id}",
+                                 daemon=True).start()
+        else:
+            for shard in self.shards:
+                history = sorted(self.history_symbols & shard.symbols)
+                shard.feed = ResilientFeed(self.fyers, lambda message, shard=shard: self._deliver(shard, None, message),
+                                           sorted(shard.symbols), history_symbols=history, record_ticks=False,
+                                           on_gap=lambda gap, shard=shard: self._handle_gap(shard, gap)).start()
+        logger.info(f"📡 Sharded feed: {sum(len(s.symbols) for s in self.shards)} symbols over {len(self.shards)} "
+                    f"{'processes' if self.processes else 'connections'}")
+        return self
+
+    def _receive(self, shard):
+        """Parent receiver thread: one per shard, so each shard's stream stays FIFO."""
+        while not self._stop.is_set():
+            try:
+                item = shard.out_queue.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                return
+            kind = item[0]
+            if kind == "ticks":
+                self._deliver(shard, item[2], item[3])
+            elif kind == "gap":
+                self._handle_gap(shard, item[2])
+            elif kind == "stats":
+                shard.feed_stats = item[2]
+            elif kind == "error":
+                logger.error(f"Feed shard {shard.shard_id}: {item[2]}")
+
+    def _deliver(self, shard, child_recv_ns, message):
+        ticks = message if isinstance(message, list) else [message]
+        shard.messages += 1
+        shard.ticks += len(ticks)
+        shard.report_ticks += len(ticks)
+        if child_recv_ns is not None:
+            shard.handoff.record(time.monotonic_ns() - child_recv_ns)
+        exch_ts = _max_exch_ts(ticks)
+        if exch_ts:
+            shard.exch_lag.record(max(time.time() - exch_ts, 0.0) * 1e9)
+        if self.journal is not None:
+            self.journal.record(ticks)
+        self.on_tick(ticks)
+
+    def _handle_gap(self, shard, gap):
+        if self.bar_builder is not None:
+            for symbol, candles in gap.get('bars', {}).items():
+                self.bar_builder.backfill(symbol, candles)
+        if self.on_gap is not None:
+            self.on_gap(gap)
+
+    # --- Socket-compatible surface ---
+
+    def subscribe(self, symbols, data_type="SymbolUpdate", channel=11):
+        for shard_id, group in self._group(symbols).items():
+            shard = self.shards[shard_id]
+            if data_type == "SymbolUpdate":
+                shard.symbols.update(group)
+            if shard.feed is not None:
+                shard.feed.subscribe(group, data_type)
+            elif shard.cmd_queue is not None:
+                shard.cmd_queue.put(("subscribe", (group, data_type)))
+
+    def unsubscribe(self, symbols, data_type="SymbolUpdate", channel=11):
+        for shard_id, group in self._group(symbols).items():
+            shard = self.shards[shard_id]
+            if data_type == "SymbolUpdate":
+                shard.symbols.difference_update(group)
+            if shard.feed is not None:
+                shard.feed.unsubscribe(group, data_type)
+            elif shard.cmd_queue is not None:
+                shard.cmd_queue.put(("unsubscribe", (group, data_type)))
+
+    def keep_running(self):
+        self._stop.wait()
+
+    def close_connection(self):
+        self._stop.set()
+        for shard in self.shards:
+            if shard.feed is not None:
+                shard.feed.close_connection()
+            if shard.process is not None:
+                shard.cmd_queue.put(("stop", None))
+                shard.process.join(timeout=5)
+                if shard.process.is_alive():
+                    shard.process.terminate()
+
+    def is_connected(self):
+        if self.processes:
+            return all(s.process is not None and s.process.is_alive() and s.feed_stats.get('connected', True)
+                       for s in self.shards)
+        return all(s.feed is not None and s.feed.is_connected() for s in self.shards)
+
+    # --- Stats ---
+
+    def shard_stats(self):
+        """Per-connection counters: symbols, messages, ticks, drops and lag percentiles (ms)."""
+        stats = []
+        for shard in self.shards:
+            feed_stats = shard.feed.stats if shard.feed is not None else shard.feed_stats
+            handoff = shard.handoff.summary()
+            exch_lag = shard.exch_lag.summary()
+            stats.append({
+                "shard": shard.shard_id, "symbols": len(shard.symbols), "messages": shard.messages,
+                "ticks": shard.ticks, "drops": feed_stats.get('drops', 0),
+                "handoff_p50_ms": handoff['p50_ms'], "handoff_p99_ms": handoff['p99_ms'],
+                "exch_lag_p50_ms": exch_lag['p50_ms'], "exch_lag_p99_ms": exch_lag['p99_ms'],
+            })
+        return stats
+
+    def log_report(self, logger):
+        now = time.monotonic()
+        elapsed = max(now - self._report_ts, 1e-9)
+        self._report_ts = now
+        for shard, s in zip(self.shards, self.shard_stats()):
+            rate = shard.report_ticks / elapsed
+            shard.report_ticks = 0
+            logger.info(f"  📡 shard {s['shard']}: {s['symbols']:>4} symbols | {rate:>8,.0f} ticks/s | "
+                        f"handoff p50 {s['handoff_p50_ms']:.3f} p99 {s['handoff_p99_ms']:.3f} ms | "
+                        f"exch lag p50 {s['exch_lag_p50_ms']:.0f} ms | drops {s['drops']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark sharded ingestion against fyers_sim_server.py.")
+    parser.add_argument("--url", default="http://127.0.0.1:8765")
+    parser.add_argument("--shards", type=int, default=DEFAULT_SHARDS)
+    parser.add_argument("--symbols", type=int, default=400)
+    parser.add_argument("--seconds", type=float, default=20.0)
+    parser.add_argument("--threads", action="store_true", help="Shards as threads instead of processes")
+    args = parser.parse_args(argv)
+
+    os.environ["FYERS_SIM_URL"] = args.url
+    fyers_client.SIM_SERVER_URL = args.url.rstrip("/")
+    counts = {"ticks": 0}
+    lock = threading.Lock()
+
+    def on_tick(ticks):
+        with lock:
+            counts["ticks"] += len(ticks)
+
+    symbols = [f"NSE:SIM{i:04d}-EQ" for i in range(args.symbols)]
+    feed = ShardedFeed(fyers_client.get_fyers_model(), on_tick, symbols, shards=args.shards,
+                       processes=not args.threads, record_ticks=False).start()
+    start = time.monotonic()
+    while time.monotonic() - start < args.seconds:
+        time.sleep(5)
+        feed.log_report(logger)
+    feed.close_connection()
+    logger.info(f"Merged {counts['ticks']:,} ticks in {args.seconds:g} s -> {counts['ticks'] / args.seconds:,.0f} ticks/s")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    main()
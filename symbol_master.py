@@ -0,0 +1,312 @@
+# symbol_master.py - Local, Memory-Mapped Fyers Symbol Master Cache + Query CLI
+# =============================================================================
+# The NSE_FO symbol master is downloaded at most once per day (by whichever
+# process needs it first) and stored as a fixed-width numpy structured array
+# with a SHA-256 checksum. Every other process memory-maps it in milliseconds
+# instead of pulling a multi-MB CSV over HTTP.
+#
+# Usage (replaces the ad-hoc find_symbol*.py scripts):
+#   python symbol_master.py refresh
+#   python symbol_master.py expiries BANKNIFTY --type PE
+#   python symbol_master.py strikes NIFTY 25500 --type CE
+#   python symbol_master.py prefixes NIFTY --weekly
+#   python symbol_master.py search "NSE:BANKNIFTY26MAR.*PE"
+#   python symbol_master.py row NSE:NIFTY26MAR25500CE
+
+import argparse
+import datetime
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SYMBOL_MASTER_URL = "https://public.fyers.in/sym_details/NSE_FO.csv"
+CACHE_DIR = os.path.join("data", "symbol_master")
+KEEP_DAYS = 3  # Older cache files are pruned on refresh
+
+# (field name, numpy dtype, CSV column index in NSE_FO.csv)
+FIELDS = [
+    ("fytoken", "S24", 0),
+    ("details", "S48", 1),
+    ("instrument", "i4", 2),
+    ("lot_size", "i4", 3),
+    ("tick_size", "f8", 4),
+    ("expiry", "i8", 8),
+    ("symbol", "S48", 9),
+    ("scrip_code", "i8", 12),
+    ("underlying", "S24", 13),
+    ("strike", "f8", 15),
+    ("option_type", "S2", 16),
+]
+DTYPE = np.dtype([(name, dtype) for name, dtype, _ in FIELDS])
+_MONTHLY_RE = re.compile(r"\d{2}(JAN|FEB|MAR|APR|MAY|JUN|JUL|AUG|SEP|OCT|NOV|DEC)")
+
+_refresh_lock = threading.Lock()
+
+
+def _paths(date):
+    base = os.path.join(CACHE_DIR, f"NSE_FO_{date.isoformat()}")
+    return base + ".npy", base + ".json"
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def refresh(date=None):
+    """Download the CSV and write today's cache file + checksum metadata atomically."""
+    import pandas as pd  # Only needed for the CSV parse on refresh
+
+    date = date or datetime.date.today()
+    npy_path, meta_path = _paths(date)
+    with _refresh_lock:
+        if os.path.exists(npy_path) and os.path.exists(meta_path):
+            return npy_path
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        logger.info(f"Downloading Fyers Symbol Master from {SYMBOL_MASTER_URL} ...")
+        df = pd.read_csv(SYMBOL_MASTER_URL, header=None)
+
+        arr = np.zeros(len(df), dtype=DTYPE)
+        for name, dtype, col in FIELDS:
+            series = df[col] if col in df.columns else pd.Series([None] * len(df))
+            if dtype.startswith("S"):
+                arr[name] = series.fillna("").astype(str).str.encode("ascii", "ignore").to_numpy()
+            else:
+                arr[name] = pd.to_numeric(series, errors="coerce").fillna(0).to_numpy()
+
+        tmp_path = npy_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, arr, allow_pickle=False)
+        meta = {
+            "date": date.isoformat(),
+            "rows": int(len(arr)),
+            "sha256": _sha256(tmp_path),
+            "source": SYMBOL_MASTER_URL,
+            "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        }
+        os.replace(tmp_path, npy_path)
+        with open(meta_path, "w") as f:
+            json.dump(meta, f, indent=4)
+        logger.info(f"Symbol master cached: {npy_path} ({meta['rows']:,} rows)")
+        _prune(date)
+        return npy_path
+
+
+def _prune(today):
+    cutoff = today - datetime.timedelta(days=KEEP_DAYS)
+    for path in glob.glob(os.path.join(CACHE_DIR, "NSE_FO_*.npy")):
+        try:
+            file_date = datetime.date.fromisoformat(os.path.basename(path)[7:17])
+        except ValueError:
+            continue
+        if file_date < cutoff:
+            for p in _paths(file_date):
+                if os.path.exists(p):
+                    os.remove(p)
+
+
+def _latest_cached():
+    """(date, npy_path) of the newest complete cache file, or (None, None)."""
+    for path in sorted(glob.glob(os.path.join(CACHE_DIR, "NSE_FO_*.npy")), reverse=True):
+        try:
+            date = datetime.date.fromisoformat(os.path.basename(path)[7:17])
+        except ValueError:
+            continue
+        if os.path.exists(_paths(date)[1]):
+            return date, path
+    return None, None
+
+
+def _open(date, path, verify):
+    if verify:
+        with open(_paths(date)[1]) as f:
+            meta = json.load(f)
+        if _sha256(path) != meta["sha256"]:
+            logger.error(f"Symbol master cache {path} failed checksum; discarding.")
+            os.remove(path)
+            return None
+    return np.load(path, mmap_mode="r", allow_pickle=False)
+
+
+def load(verify=True, background_refresh=True):
+    """
+    Memory-maps the newest cached symbol master.
+    - Today's file present: returned immediately.
+    - Only an older file: returned immediately, and today's refresh runs in a background thread.
+    - No cache at all (first run): downloads synchronously.
+    Returns a read-only numpy structured array (dtype DTYPE), or None on failure.
+    """
+    today = datetime.date.today()
+    date, path = _latest_cached()
+    if path is not None:
+        arr = _open(date, path, verify)
+        if arr is not None:
+            if date != today and background_refresh:
+                threading.Thread(target=_safe_refresh, daemon=True).start()
+            return arr
+    try:
+        return _open(today, refresh(today), verify=False)
+    except Exception as e:
+        logger.error(f"Failed to fetch Fyers Symbol Master: {e}")
+        return None
+
+
+def _safe_refresh():
+    try:
+        refresh()
+    except Exception as e:
+        logger.error(f"Background symbol master refresh failed: {e}")
+
+
+def load_dataframe(verify=True):
+    """
+    The cached master as a pandas DataFrame using the raw CSV column numbers
+    (8 expiry, 9 symbol, 13 underlying, 15 strike, 16 option type, ...), so code
+    written against pd.read_csv(NSE_FO.csv, header=None) keeps working.
+    """
+    import pandas as pd
+
+    arr = load(verify=verify)
+    if arr is None:
+        return None
+    columns = {}
+    for name, dtype, col in FIELDS:
+        values = arr[name]
+        columns[col] = np.char.decode(values, "ascii") if dtype.startswith("S") else np.asarray(values)
+    df = pd.DataFrame(columns)
+    df[16] = df[16].replace("", "XX")
+    return df
+
+
+# --- Query helpers (used by the CLI) ---
+
+def _decode(value):
+    return value.decode("ascii") if isinstance(value, bytes) else value
+
+
+def _select(arr, underlying=None, option_type=None, strike=None, weekly=None):
+    mask = np.ones(len(arr), dtype=bool)
+    if underlying:
+        mask &= arr["underlying"] == underlying.upper().encode()
+    if option_type:
+        mask &= arr["option_type"] == option_type.upper().encode()
+    if strike is not None:
+        mask &= arr["strike"] == float(strike)
+    rows = arr[mask]
+    if weekly is not None:
+        is_monthly = np.array([bool(_MONTHLY_RE.search(_decode(s))) for s in rows["symbol"]], dtype=bool)
+        rows = rows[~is_monthly] if weekly else rows[is_monthly]
+    return rows[np.argsort(rows["expiry"], kind="stable")]
+
+
+def _fmt_expiry(epoch):
+    dt = datetime.datetime.fromtimestamp(int(epoch))
+    return f"{dt.date()} ({dt.strftime('%A')})"
+
+
+def cmd_expiries(arr, args):
+    rows = _select(arr, args.underlying, args.type, weekly=args.weekly)
+    expiries, first = np.unique(rows["expiry"], return_index=True)
+    print(f"{args.underlying.upper()} expiries ({len(expiries)}):")
+    for epoch, i in list(zip(expiries, first))[:args.limit]:
+        print(f"  {_fmt_expiry(epoch)} | Sample: {_decode(rows['symbol'][i])}")
+
+
+def cmd_strikes(arr, args):
+    rows = _select(arr, args.underlying, args.type, strike=args.strike, weekly=args.weekly)
+    print(f"Found {len(rows)} contracts for {args.underlying.upper()} {args.strike} {args.type or ''}")
+    for row in rows[:args.limit]:
+        print(f"  {_decode(row['symbol']):<32} {_fmt_expiry(row['expiry'])} | Lot {row['lot_size']}")
+
+
+def cmd_prefixes(arr, args):
+    rows = _select(arr, args.underlying, args.type, weekly=args.weekly)
+    seen = {}
+    for row in rows:
+        symbol = _decode(row["symbol"])
+        strike = float(row["strike"])
+        strike_text = str(int(strike)) if strike.is_integer() else str(strike)
+        suffix = strike_text + _decode(row["option_type"])
+        prefix = symbol[:-len(suffix)] if symbol.endswith(suffix) else symbol
+        seen.setdefault(prefix, (row["expiry"], symbol))
+    print(f"{args.underlying.upper()} expiry prefixes ({len(seen)}):")
+    for prefix, (epoch, sample) in list(seen.items())[:args.limit]:
+        print(f"  {prefix:<24} {_fmt_expiry(epoch)} | e.g. {sample}")
+
+
+def cmd_search(arr, args):
+    pattern = re.compile(args.pattern)
+    rows = arr[np.argsort(arr["expiry"], kind="stable")]
+    shown = 0
+    for row in rows:
+        symbol, details = _decode(row["symbol"]), _decode(row["details"])
+        if pattern.search(symbol) or pattern.search(details):
+            print(f"  {symbol:<32} {details:<40} {_fmt_expiry(row['expiry'])}")
+            shown += 1
+            if shown >= args.limit:
+                break
+    print(f"{shown} match(es) shown")
+
+
+def cmd_row(arr, args):
+    rows = arr[arr["symbol"] == args.symbol.encode()]
+    if len(rows) == 0:
+        print(f"{args.symbol} not found")
+        return
+    for name, _, col in FIELDS:
+        print(f"Col {col:>2} {name:<12}: {_decode(rows[0][name])}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query the cached Fyers NSE_FO symbol master.")
+    parser.add_argument("--no-verify", action="store_true", help="Skip the checksum check on load")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("refresh", help="Download today's master into the local cache")
+
+    for name, helptext in [("expiries", "List upcoming expiries"), ("prefixes", "List symbol prefixes per expiry")]:
+        p = sub.add_parser(name, help=helptext)
+        p.add_argument("underlying")
+        p.add_argument("--type", choices=["CE", "PE"], default="PE")
+        p.add_argument("--weekly", action="store_true", default=None, help="Only weekly contracts")
+        p.add_argument("--limit", type=int, default=20)
+
+    p = sub.add_parser("strikes", help="Contracts for one strike, nearest expiry first")
+    p.add_argument("underlying")
+    p.add_argument("strike", type=float)
+    p.add_argument("--type", choices=["CE", "PE"])
+    p.add_argument("--weekly", action="store_true", default=None, help="Only weekly contracts")
+    p.add_argument("--limit", type=int, default=20)
+
+    p = sub.add_parser("search", help="Regex search over symbol and description")
+    p.add_argument("pattern")
+    p.add_argument("--limit", type=int, default=50)
+
+    p = sub.add_parser("row", help="Print every cached field for one symbol")
+    p.add_argument("symbol")
+
+    args = parser.parse_args(argv)
+    if args.command == "refresh":
+        print(refresh())
+        return
+
+    arr = load(verify=not args.no_verify, background_refresh=False)
+    if arr is None:
+        parser.error("Symbol master unavailable (no cache and download failed)")
+    {"expiries": cmd_expiries, "strikes": cmd_strikes, "prefixes": cmd_prefixes,
+     "search": cmd_search, "row": cmd_row}[args.command](arr, args)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    main()
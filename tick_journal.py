@@ -0,0 +1,281 @@
+# tick_journal.py - Append-Only Binary Tick Journal
+# ==================================================
+# Every raw WebSocket tick is stored as a 64-byte fixed-width record in a
+# daily segment file, so a full session (indices + option ladder) can be
+# replayed, backtested or profiled later. The feed thread only appends the
+# raw message to a deque; a background writer thread packs records into numpy
+# arrays and writes them in blocks. Segments are read back with np.memmap.
+#
+# Layout:  data/tick_journal/<YYYY-MM-DD>/<source>.bin           (records)
+#          data/tick_journal/<YYYY-MM-DD>/<source>.symbols.json  (symbol id -> symbol)
+#
+# Usage:
+#   python tick_journal.py list
+#   python tick_journal.py stats 2026-03-02 [--source options_scalper_main]
+
+import argparse
+import atexit
+import datetime
+import glob
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import deque
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_DIR = os.path.join("data", "tick_journal")
+FLUSH_INTERVAL = 0.2  # Seconds between writer passes
+
+RECORD_DTYPE = np.dtype([
+    ("sym_id", "<u4"),
+    ("last_qty", "<u4"),    # last_traded_qty
+    ("exch_ts", "<i8"),     # exch_feed_time (epoch seconds, 0 if absent)
+    ("recv_ns", "<i8"),     # wall-clock receive time, time.time_ns()
+    ("ltp", "<f8"),
+    ("bid", "<f8"),
+    ("ask", "<f8"),
+    ("bid_qty", "<u4"),
+    ("ask_qty", "<u4"),
+    ("volume", "<i8"),      # vol_traded_today
+])
+assert RECORD_DTYPE.itemsize == 64
+
+
+def _segment_paths(date, source):
+    day_dir = os.path.join(JOURNAL_DIR, date.isoformat())
+    return os.path.join(day_dir, f"{source}.bin"), os.path.join(day_dir, f"{source}.symbols.json")
+
+
+def _default_source():
+    return os.path.splitext(os.path.basename(sys.argv[0] or "session"))[0] or "session"
+
+
+class TickJournal:
+    """
+    Non-blocking tick recorder. Call `record(message)` from the WebSocket thread
+    with whatever the SDK delivered (one tick dict or a list of them).
+    """
+
+    def __init__(self, source=None, flush_interval=FLUSH_INTERVAL):
+        self.source = source or _default_source()
+        self.flush_interval = flush_interval
+        self._pending = deque()     # (recv_ns, message) appended by the feed thread
+        self._symbol_ids = {}       # symbol -> id for the current segment
+        self._symbols = []          # id -> symbol
+        self._date = None
+        self._file = None
+        self._stop = threading.Event()
+        self._thread = None
+        self.stats = {"records": 0, "bytes": 0, "flushes": 0, "dropped": 0}
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="tick-journal", daemon=True)
+            self._thread.start()
+            logger.info(f"📼 Tick journal recording to {JOURNAL_DIR} (source: {self.source})")
+        return self
+
+    def record(self, message):
+        """Feed-thread hot path: timestamp and queue the raw message, nothing else."""
+        self._pending.append((time.time_ns(), message))
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Tick journal flush failed: {e}", exc_info=True)
+
+    def flush(self):
+        pending = self._pending
+        if not pending:
+            return
+
+        rows = []
+        for _ in range(len(pending)):
+            recv_ns, message = pending.popleft()
+            date = datetime.date.fromtimestamp(recv_ns / 1e9)
+            if date != self._date:
+                self._write(rows)  # Close out the previous day's segment first
+                rows = []
+                self._open_segment(date)
+            ticks = message if isinstance(message, list) else (message,)
+            for tick in ticks:
+                if not (isinstance(tick, dict) and 'symbol' in tick and 'ltp' in tick):
+                    continue
+                try:
+                    rows.append(self._pack(recv_ns, tick))
+                except (TypeError, ValueError):
+                    self.stats["dropped"] += 1
+        self._write(rows)
+
+    def _write(self, rows):
+        if not rows:
+            return
+        records = np.array(rows, dtype=RECORD_DTYPE)
+        self._file.write(records.tobytes())
+        self._file.flush()
+        self.stats["records"] += len(records)
+        self.stats["bytes"] += records.nbytes
+        self.stats["flushes"] += 1
+
+    def _pack(self, recv_ns, tick):
+        symbol = tick['symbol']
+        sym_id = self._symbol_ids.get(symbol)
+        if sym_id is None:
+            sym_id = self._symbol_ids[symbol] = len(self._symbols)
+            self._symbols.append(symbol)
+            self._write_symbols()
+        return (sym_id, tick.get('last_traded_qty') or 0, tick.get('exch_feed_time') or 0, recv_ns,
+                tick['ltp'], tick.get('bid_price') or 0.0, tick.get('ask_price') or 0.0,
+                tick.get('bid_size') or 0, tick.get('ask_size') or 0, tick.get('vol_traded_today') or 0)
+
+    def _open_segment(self, date):
+        if self._file is not None:
+            self._file.close()
+        bin_path, _ = _segment_paths(date, self.source)
+        os.makedirs(os.path.dirname(bin_path), exist_ok=True)
+        self._date = date
+        self._symbols = load_symbols(date, self.source)
+        self._symbol_ids = {sym: i for i, sym in enumerate(self._symbols)}
+        self._file = open(bin_path, "ab")
+        # Drop a torn trailing record left by a crash so the file stays record-aligned
+        torn = self._file.tell() % RECORD_DTYPE.itemsize
+        if torn:
+            self._file.truncate(self._file.tell() - torn)
+            self._file.seek(0, os.SEEK_END)
+
+    def _write_symbols(self):
+        _, sym_path = _segment_paths(self._date, self.source)
+        tmp_path = sym_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._symbols, f)
+        os.replace(tmp_path, sym_path)
+
+
+_default_journal = None
+_default_lock = threading.Lock()
+
+
+def get_journal(source=None):
+    """Process-wide journal, started on first use."""
+    global _default_journal
+    with _default_lock:
+        if _default_journal is None:
+            _default_journal = TickJournal(source).start()
+            atexit.register(_default_journal.close)
+        return _default_journal
+
+
+# --- Reading ---
+
+def load_symbols(date, source):
+    """Symbol list for a segment (index = sym_id)."""
+    _, sym_path = _segment_paths(date, source)
+    if not os.path.exists(sym_path):
+        return []
+    with open(sym_path) as f:
+        return json.load(f)
+
+
+def open_segment(date, source):
+    """
+    Memory-maps one day's segment. Returns (records, symbols) where records is a
+    read-only structured array (RECORD_DTYPE) and symbols maps sym_id -> symbol.
+    """
+    bin_path, _ = _segment_paths(date, source)
+    if not os.path.exists(bin_path):
+        return np.zeros(0, dtype=RECORD_DTYPE), []
+    count = os.path.getsize(bin_path) // RECORD_DTYPE.itemsize
+    if count == 0:
+        return np.zeros(0, dtype=RECORD_DTYPE), load_symbols(date, source)
+    records = np.memmap(bin_path, dtype=RECORD_DTYPE, mode="r", shape=(count,))
+    return records, load_symbols(date, source)
+
+
+def list_segments():
+    """[(date, source, n_records)] for every segment on disk, oldest first."""
+    segments = []
+    for path in sorted(glob.glob(os.path.join(JOURNAL_DIR, "*", "*.bin"))):
+        try:
+            date = datetime.date.fromisoformat(os.path.basename(os.path.dirname(path)))
+        except ValueError:
+            continue
+        source = os.path.basename(path)[:-4]
+        segments.append((date, source, os.path.getsize(path) // RECORD_DTYPE.itemsize))
+    return segments
+
+
+def iter_ticks(date, source, symbols=None):
+    """
+    Yields ticks in SDK dict form (symbol, ltp, bid_price, ...) plus 'recv_ns', in
+    recording order. `symbols` optionally restricts the output.
+    """
+    records, names = open_segment(date, source)
+    if symbols is not None:
+        wanted = [i for i, name in enumerate(names) if name in set(symbols)]
+        records = records[np.isin(records["sym_id"], wanted)]
+    for rec in records:
+        yield {
+            "symbol": names[rec["sym_id"]],
+            "ltp": float(rec["ltp"]),
+            "bid_price": float(rec["bid"]),
+            "ask_price": float(rec["ask"]),
+            "bid_size": int(rec["bid_qty"]),
+            "ask_size": int(rec["ask_qty"]),
+            "last_traded_qty": int(rec["last_qty"]),
+            "vol_traded_today": int(rec["volume"]),
+            "exch_feed_time": int(rec["exch_ts"]),
+            "recv_ns": int(rec["recv_ns"]),
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect recorded tick journal segments.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="List segments on disk")
+    p = sub.add_parser("stats", help="Per-symbol counts and LTP range for one day")
+    p.add_argument("date", type=datetime.date.fromisoformat)
+    p.add_argument("--source", default=None, help="Recording process (default: all)")
+    args = parser.parse_args(argv)
+
+    if args.command == "list":
+        for date, source, count in list_segments():
+            print(f"  {date}  {source:<28} {count:>12,} ticks  {count * RECORD_DTYPE.itemsize / 1e6:>9.1f} MB")
+        return
+
+    sources = [args.source] if args.source else [s for d, s, _ in list_segments() if d == args.date]
+    for source in sources:
+        start = time.perf_counter()
+        records, names = open_segment(args.date, source)
+        counts = np.bincount(records["sym_id"], minlength=len(names))
+        order = np.argsort(records["sym_id"], kind="stable")
+        sorted_ids = records["sym_id"][order]
+        ltps = records["ltp"][order]
+        bounds = np.searchsorted(sorted_ids, np.arange(len(names) + 1))
+        elapsed = time.perf_counter() - start
+        print(f"{args.date} {source}: {len(records):,} ticks, {len(names)} symbols "
+              f"(scanned {records.nbytes / 1e6:.1f} MB in {elapsed * 1000:.1f} ms)")
+        for i, name in enumerate(names):
+            if counts[i]:
+                seg = ltps[bounds[i]:bounds[i + 1]]
+                print(f"  {name:<32} {counts[i]:>10,}  LTP {seg.min():>10.2f} - {seg.max():>10.2f}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    main()
@@ -0,0 +1,192 @@
+# tick_types.py - Compact Tick / Position Types for the Hot Path
+# ==============================================================
+# SDK ticks arrive as ~20-key dicts and positions live as JSON-shaped dicts
+# that get .get()-probed on every tick. The trading loop instead works on:
+#   - Tick: a __slots__ object built once at ingestion (Tick.from_sdk)
+#   - SpreadPosition: the immutable exit parameters of an open spread,
+#     resolved once when the position is opened/restored
+#   - Integer symbol ids from a process-wide SymbolTable, with the symbol
+#     strings interned so the remaining string compares are identity checks.
+#     Each symbol is parsed once, when first seen (subscription or first tick),
+#     into a SymbolInfo record (underlying, expiry, strike, option type), so
+#     routing a tick to its underlying is a list lookup by id.
+# Persistence (paper_positions_*.json) and the dashboard keep using dicts.
+
+import re
+import sys
+import threading
+
+# Underlying -> the index symbol whose ticks drive its options
+INDEX_SYMBOLS = {
+    "NIFTY": "NSE:NIFTY50-INDEX",
+    "BANKNIFTY": "NSE:NIFTYBANK-INDEX",
+    "FINNIFTY": "NSE:FINNIFTY-INDEX",
+    "MIDCPNIFTY": "NSE:MIDCPNIFTY-INDEX",
+    "SENSEX": "BSE:SENSEX-INDEX",
+}
+INDEX_UNDERLYINGS = {v: k for k, v in INDEX_SYMBOLS.items()}  # "NSE:NIFTY50-INDEX" -> "NIFTY"
+
+# Fyers option symbols: NSE:<ROOT><YY><MON><STRIKE><CE|PE> (monthly, e.g. NIFTY25OCT25000CE)
+# or NSE:<ROOT><YY><M><DD><STRIKE><CE|PE> (weekly, M = 1-9/O/N/D, e.g. NIFTY25O1425000CE)
+_MONTHLY_OPTION_RE = re.compile(r"^[A-Z]+:([A-Z&]+?)(\d{2}[A-Z]{3})(\d+(?:\.\d+)?)(CE|PE)$")
+_WEEKLY_OPTION_RE = re.compile(r"^[A-Z]+:([A-Z&]+?)(\d{2}[1-9OND]\d{2})(\d+(?:\.\d+)?)(CE|PE)$")
+
+
+class SymbolInfo:
+    """Classification of one symbol, parsed once. Option fields are None for indices/other symbols."""
+
+    __slots__ = ("sym_id", "symbol", "underlying", "index_symbol", "is_index", "expiry", "strike", "option_type")
+
+    def __init__(self, sym_id, symbol, underlying=None, expiry=None, strike=None, option_type=None):
+        self.sym_id = sym_id
+        self.symbol = symbol
+        self.underlying = underlying  # "NIFTY", "BANKNIFTY", ... (None if unrecognised)
+        self.index_symbol = INDEX_SYMBOLS.get(underlying)
+        self.is_index = option_type is None and self.index_symbol == symbol
+        self.expiry = expiry          # Expiry code as listed: "25OCT" (monthly) / "25O14" (weekly)
+        self.strike = strike
+        self.option_type = option_type
+
+    @classmethod
+    def parse(cls, sym_id, symbol):
+        underlying = INDEX_UNDERLYINGS.get(symbol)
+        if underlying is not None:
+            return cls(sym_id, symbol, underlying)
+        match = _MONTHLY_OPTION_RE.match(symbol) or _WEEKLY_OPTION_RE.match(symbol)
+        if match is None:
+            return cls(sym_id, symbol)
+        root, expiry, strike, option_type = match.groups()
+        return cls(sym_id, symbol, root, expiry, float(strike), option_type)
+
+    def __repr__(self):
+        if self.option_type is None:
+            return f"SymbolInfo({self.symbol} underlying={self.underlying})"
+        return f"SymbolInfo({self.symbol} {self.underlying} {self.expiry} {self.strike:g} {self.option_type})"
+
+
+class SymbolTable:
+    """
+    Process-wide symbol <-> small integer id mapping (ids are never reused), with
+    the SymbolInfo classification of every symbol in `info` (indexed by id).
+    """
+
+    def __init__(self):
+        self._ids = {}
+        self.names = []  # id -> interned symbol string
+        self.info = []   # id -> SymbolInfo
+        self._lock = threading.Lock()
+
+    def intern(self, symbol):
+        sym_id = self._ids.get(symbol)
+        if sym_id is None:
+            with self._lock:
+                sym_id = self._ids.get(symbol)
+                if sym_id is None:
+                    symbol = sys.intern(symbol)
+                    sym_id = len(self.names)
+                    self.info.append(SymbolInfo.parse(sym_id, symbol))
+                    self.names.append(symbol)
+                    self._ids[symbol] = sym_id  # Published last: lock-free readers see a complete entry
+        return sym_id
+
+    def register(self, symbols):
+        """Interns and classifies symbols up front (e.g. at subscription time). Returns their ids."""
+        return [self.intern(symbol) for symbol in symbols]
+
+    def classify(self, symbol):
+        """SymbolInfo for a symbol (parsed on first sight)."""
+        return self.info[self.intern(symbol)]
+
+    def name(self, sym_id):
+        return self.names[sym_id]
+
+    def __len__(self):
+        return len(self.names)
+
+
+SYMBOLS = SymbolTable()
+_SYMBOL_IDS = SYMBOLS._ids      # Lock-free read path for already-known symbols
+_SYMBOL_NAMES = SYMBOLS.names
+_new = object.__new__
+
+
+class Tick:
+    """One market data update, converted from the SDK payload exactly once."""
+
+    __slots__ = ("sym_id", "symbol", "ltp", "bid", "ask", "bid_qty", "ask_qty", "volume", "exch_ts")
+
+    def __init__(self, sym_id, symbol, ltp, bid=None, ask=None, bid_qty=None, ask_qty=None,
+                 volume=None, exch_ts=None):
+        self.sym_id = sym_id
+        self.symbol = symbol
+        self.ltp = ltp
+        self.bid = bid
+        self.ask = ask
+        self.bid_qty = bid_qty
+        self.ask_qty = ask_qty
+        self.volume = volume    # vol_traded_today (cumulative)
+        self.exch_ts = exch_ts  # exch_feed_time / last_traded_time, epoch seconds
+
+    @classmethod
+    def from_sdk(cls, payload):
+        """Tick from an SDK tick dict, or None for control messages / malformed payloads."""
+        try:
+            symbol = payload['symbol']
+            ltp = payload['ltp']
+        except (TypeError, KeyError):
+            return None
+        sym_id = _SYMBOL_IDS.get(symbol)
+        if sym_id is None:
+            sym_id = SYMBOLS.intern(symbol)
+        get = payload.get
+        # Slot assignment on a bare instance skips the __init__ call (~20% cheaper per tick)
+        tick = _new(cls)
+        tick.sym_id = sym_id
+        tick.symbol = _SYMBOL_NAMES[sym_id]
+        tick.ltp = ltp
+        tick.bid = get('bid_price')
+        tick.ask = get('ask_price')
+        tick.bid_qty = get('bid_size')
+        tick.ask_qty = get('ask_size')
+        tick.volume = get('vol_traded_today')
+        tick.exch_ts = get('exch_feed_time') or get('last_traded_time')
+        return tick
+
+    def __repr__(self):
+        return f"Tick({self.symbol} ltp={self.ltp} bid={self.bid} ask={self.ask})"
+
+
+def ticks_from_message(message):
+    """Converts one SDK socket message (a tick dict or a list of them) to a list of Ticks."""
+    if isinstance(message, list):
+        return [tick for tick in map(Tick.from_sdk, message) if tick is not None]
+    tick = Tick.from_sdk(message)
+    return [tick] if tick is not None else []
+
+
+class SpreadPosition:
+    """Exit parameters of one open debit spread (keyed by its buy-leg symbol)."""
+
+    __slots__ = ("key", "buy_id", "sell_id", "index_id", "sell_symbol", "index_symbol",
+                 "is_call", "index_stop_loss", "take_profit", "sim_stop_loss", "qty")
+
+    def __init__(self, key, sell_symbol, index_symbol, is_call, index_stop_loss, take_profit, sim_stop_loss, qty):
+        self.key = SYMBOLS.names[SYMBOLS.intern(key)]
+        self.buy_id = SYMBOLS.intern(key)
+        self.sell_id = SYMBOLS.intern(sell_symbol)
+        self.index_id = SYMBOLS.intern(index_symbol) if index_symbol else -1
+        self.sell_symbol = SYMBOLS.names[self.sell_id]
+        self.index_symbol = SYMBOLS.names[self.index_id] if index_symbol else None
+        self.is_call = is_call  # Call spread: stop below the index entry; put spread: above
+        self.index_stop_loss = index_stop_loss
+        self.take_profit = take_profit
+        self.sim_stop_loss = sim_stop_loss
+        self.qty = qty
+
+    @classmethod
+    def from_position(cls, key, pos):
+        """View of a PaperAccount position dict, or None if it isn't a spread."""
+        if not pos.get('is_spread') or not pos.get('sell_symbol'):
+            return None
+        return cls(key, pos['sell_symbol'], pos.get('index_symbol'), "(LONG)" in pos['direction'],
+                   pos['index_stop_loss_price'], pos['sim_take_profit_price'], pos['sim_stop_loss_price'], pos['qty'])
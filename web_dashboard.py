@@ -12,6 +12,7 @@ import threading
 from flask import Flask, render_template_string, jsonify, request
 import fyers_client
 import config
+from tick_types import SYMBOLS, SymbolInfo
 
 app = Flask(__name__)
 
@@ -964,7 +965,7 @@ HTML_TEMPLATE = '''
 
             // Fetch live prices for BOTH option premium AND underlying index
             try {
-                // 1. Fetch option premium price
+                // 1. Fetch option premium price (the quote also carries the symbol's underlying index)
                 const resp = await fetch(`/api/quote?symbol=${encodeURIComponent(sym)}`);
                 const data = await resp.json();
                 if (data.lp && data.lp > 0) {
@@ -975,8 +976,8 @@ HTML_TEMPLATE = '''
                 }
 
                 // 2. Fetch underlying index spot price
-                const isBank = sym.includes('BANK');
-                const idxSym = isBank ? 'NSE:NIFTYBANK-INDEX' : 'NSE:NIFTY50-INDEX';
+                const isBank = data.underlying === 'BANKNIFTY';
+                const idxSym = data.index_symbol || 'NSE:NIFTY50-INDEX';
                 const idxResp = await fetch(`/api/quote?symbol=${encodeURIComponent(idxSym)}`);
                 const idxData = await idxResp.json();
                 if (idxData.lp && idxData.lp > 0) {
@@ -1100,12 +1101,9 @@ def _get_live_spot(index_name):
         quote = fyers.quotes({"symbols": "NSE:NIFTY50-INDEX,NSE:NIFTYBANK-INDEX"})
         if quote.get('s') == 'ok' and quote.get('d'):
             for item in quote['d']:
-                sym = item.get('n', '')
-                lp = item.get('v', {}).get('lp', 0)
-                if 'NIFTY50' in sym:
-                    _spot_cache['nifty'] = lp
-                elif 'NIFTYBANK' in sym:
-                    _spot_cache['banknifty'] = lp
+                underlying = SYMBOLS.classify(item.get('n', '')).underlying
+                if underlying:
+                    _spot_cache[underlying.lower()] = item.get('v', {}).get('lp', 0)
             _spot_cache['last_fetch'] = now
     except Exception as e:
         print(f"Spot fetch error: {e}")
@@ -1148,16 +1146,38 @@ def api_symbols():
     return jsonify(unique[:30])
 
 
+def _classify(symbol):
+    """SymbolInfo for client-supplied text, parsed without adding it to the process-wide SYMBOLS table."""
+    return SymbolInfo.parse(-1, symbol)
+
+
+@app.route('/api/symbol_info')
+def api_symbol_info():
+    """Parsed classification of a symbol (underlying, index symbol, expiry, strike, option type)."""
+    info = _classify(request.args.get('symbol', '').strip().upper())
+    return jsonify({
+        "symbol": info.symbol,
+        "underlying": info.underlying,
+        "index_symbol": info.index_symbol,
+        "expiry": info.expiry,
+        "strike": info.strike,
+        "option_type": info.option_type,
+    })
+
+
 @app.route('/api/quote')
 def api_quote():
-    """Fetch live price for a single option symbol."""
+    """Fetch live price for a single option symbol, plus its underlying and index symbol."""
     symbol = request.args.get('symbol', '').strip()
     if not symbol:
         return jsonify({"lp": 0, "error": "No symbol"})
 
+    info = _classify(symbol.upper())
+    classification = {"underlying": info.underlying, "index_symbol": info.index_symbol}
+
     fyers = _get_fyers()
     if not fyers:
-        return jsonify({"lp": 0, "error": "Fyers not connected"})
+        return jsonify({"lp": 0, "error": "Fyers not connected", **classification})
 
     try:
         quote = fyers.quotes({"symbols": symbol})
@@ -1169,10 +1189,11 @@ def api_quote():
                 "high": v.get('high_price', 0),
                 "low": v.get('low_price', 0),
                 "volume": v.get('volume', 0),
+                **classification,
             })
-        return jsonify({"lp": 0, "error": "Symbol not found"})
+        return jsonify({"lp": 0, "error": "Symbol not found", **classification})
     except Exception as e:
-        return jsonify({"lp": 0, "error": str(e)})
+        return jsonify({"lp": 0, "error": str(e), **classification})
 
 # ========== WEBSOCKET LIVE TICK STORE ==========
 _live_ticks = {}  # Thread-safe dict: {symbol: ltp}
@@ -1280,9 +1301,8 @@ def api_live_prices():
     # Refresh subscriptions if positions changed
     _refresh_ws_subscriptions()
 
-    # Read from in-memory tick store
-    nifty_ltp = _live_ticks.get('NSE:NIFTY50-INDEX', 0)
-    bank_ltp = _live_ticks.get('NSE:NIFTYBANK-INDEX', 0)
+    # Read from in-memory tick store; each symbol's index comes from the symbol registry
+    index_of = {sym: _classify(sym).index_symbol for sym in symbols}
 
     result = {}
     missing_symbols = []
@@ -1292,7 +1312,7 @@ def api_live_prices():
         if prem_ltp <= 0:
             missing_symbols.append(sym)
             
-        idx_ltp = bank_ltp if 'BANK' in sym else nifty_ltp
+        idx_ltp = _live_ticks.get(index_of[sym], 0) if index_of[sym] else 0
         result[sym] = {
             "premium_ltp": prem_ltp,
             "index_ltp": idx_ltp
@@ -1304,8 +1324,9 @@ def api_live_prices():
             fyers = _get_fyers()
             if fyers:
                 # Need to also fetch index if missing
-                if nifty_ltp <= 0 and 'NSE:NIFTY50-INDEX' not in missing_symbols: missing_symbols.append('NSE:NIFTY50-INDEX')
-                if bank_ltp <= 0 and 'NSE:NIFTYBANK-INDEX' not in missing_symbols: missing_symbols.append('NSE:NIFTYBANK-INDEX')
+                for index_symbol in sorted(set(filter(None, index_of.values()))):
+                    if _live_ticks.get(index_symbol, 0) <= 0 and index_symbol not in missing_symbols:
+                        missing_symbols.append(index_symbol)
                 
                 # Fyers limits quotes to 50 symbols. Join and fetch.
                 sym_string = ",".join(missing_symbols[:50])
@@ -1316,18 +1337,13 @@ def api_live_prices():
                         lp = item.get('v', {}).get('lp', 0)
                         if lp > 0:
                             _live_ticks[sym_name] = lp # populate the cache
-                            if sym_name == 'NSE:NIFTY50-INDEX':
-                                nifty_ltp = lp
-                            elif sym_name == 'NSE:NIFTYBANK-INDEX':
-                                bank_ltp = lp
-                            else:
-                                if sym_name in result:
-                                    result[sym_name]["premium_ltp"] = lp
+                            if sym_name in result:
+                                result[sym_name]["premium_ltp"] = lp
                                     
                     # Re-map index prices for missing symbols now that we might have them
                     for sym in result:
-                        if result[sym]["index_ltp"] <= 0:
-                            result[sym]["index_ltp"] = bank_ltp if 'BANK' in sym else nifty_ltp
+                        if result[sym]["index_ltp"] <= 0 and index_of[sym]:
+                            result[sym]["index_ltp"] = _live_ticks.get(index_of[sym], 0)
                             
         except Exception as e:
             print(f"[Fallback] Quote fetch error: {e}")